@@ -18,6 +18,7 @@ from .version import __version__
 
 from .prefeatures.video_info import VideoInfo
 from .prefeatures.basic_worm import BasicWorm
+from .prefeatures.heterocardinal_frames import HeterocardinalFrames
 from .prefeatures.normalized_worm import NormalizedWorm
 from .prefeatures.worm_plotter import NormalizedWormPlottable
 
@@ -29,6 +30,7 @@ from .features import feature_manipulations
 
 from .features.worm_features import WormFeatures
 from .features.feature_processing_options import FeatureProcessingOptions
+from .features.feature_cache import FeatureCache
 
 from .statistics.histogram_manager import HistogramManager
 from .statistics.statistics_manager import StatisticsManager
@@ -53,6 +55,7 @@ __all__ = ['__version__',
            'VideoInfo',
            'WormFeatures',
            'FeatureProcessingOptions',
+           'FeatureCache',
            'NormalizedWormPlottable',
            'HistogramManager',
            'StatisticsManager',
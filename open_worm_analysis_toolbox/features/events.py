@@ -71,7 +71,6 @@ import operator
 import h5py
 import warnings
 
-from itertools import groupby
 from .. import utils
 
 
@@ -272,45 +271,26 @@ class EventFinder:
         assert(event_mask.dtype == bool)
         assert(event_data.dtype == float)
 
-        # We concatenate falses to ensure event starts and stops at the edges
-        # are caught
-        bracketed_event_mask = np.concatenate([[False], event_mask, [False]])
-
-        # Let's obtain the "x-coordinates" of the True entries.
-        # e.g. If our bracketed_event_mask is
-        # [False, False, False, True, False True, True, True, False], then
-        # we obtain the array [3, 5, 6, 7]
-        x = np.flatnonzero(bracketed_event_mask) - 1
-
-        # Group these together using a fancy trick from
-        # http://stackoverflow.com/questions/2154249/, since
-        # the lambda function x:x[0]-x[1] on an enumerated list will
-        # group consecutive integers together
-        # e.g. [[(0, 3)], [(1, 5), (2, 6), (3, 7)]]
-        # list(group)
-        x_grouped = [list(group) for key, group in
-                     groupby(enumerate(x), lambda i:i[0] - i[1])]
-
-        # We want to know the first element from each "run", and the
-        # last element e.g. [[3, 4], [5, 7]]
-        event_candidates = [(i[0][1], i[-1][1]) for i in x_grouped]
+        # Find the first and last element from each "run" of Trues
+        # e.g. [(3, 3), (5, 7)]
+        starts, ends, _ = utils.find_runs(event_mask)
+        event_candidates = np.column_stack((starts, ends))
 
         # Early exit if we have no starts and stops at all
-        if not event_candidates:
-            return np.array(event_candidates)
+        if not event_candidates.size:
+            return np.array([])
 
         # If a run of NaNs precedes the first start index, all the way back to
         # the first element, then revise our first (start, stop) entry to
         # include all those NaNs.
-        if np.all(np.isnan(event_data[:event_candidates[0][0]])):
-            event_candidates[0] = (0, event_candidates[0][1])
+        if np.all(np.isnan(event_data[:event_candidates[0, 0]])):
+            event_candidates[0, 0] = 0
 
         # Same but with NaNs succeeding the final end index.
-        if np.all(np.isnan(event_data[event_candidates[-1][1] + 1:])):
-            event_candidates[-1] = (event_candidates[-1]
-                                    [0], event_data.size - 1)
+        if np.all(np.isnan(event_data[event_candidates[-1, 1] + 1:])):
+            event_candidates[-1, 1] = event_data.size - 1
 
-        return np.array(event_candidates)
+        return event_candidates
 
     def remove_gaps(self, event_candidates, threshold,
                     comparison_operator):
@@ -341,26 +321,20 @@ class EventFinder:
                comparison_operator == operator.gt or
                comparison_operator == operator.ge)
 
-        new_event_candidates = []
-        num_groups = np.shape(event_candidates)[0]
+        # Each event is merged with the next one if the gap between them
+        # satisfies our comparison operator
+        gaps = event_candidates[1:, 0] - event_candidates[:-1, 1] - 1
+        is_merged_with_next = comparison_operator(gaps, threshold)
 
-        i = 0
-        while(i < num_groups):
-            # Now advance through groups to the right,
-            # continuing as long as they satisfy our comparison operator
-            ii = i
-            while(ii + 1 < num_groups and comparison_operator(
-                    event_candidates[ii + 1][0] - event_candidates[ii][1] - 1,
-                    threshold)):
-                ii += 1
+        # The merged events start at the first event that is not merged with
+        # the previous one, and stop at the last event that is not merged
+        # with the next one
+        new_starts = event_candidates[
+            np.concatenate(([True], ~is_merged_with_next)), 0]
+        new_ends = event_candidates[
+            np.concatenate((~is_merged_with_next, [True])), 1]
 
-            # Add this largest possible start/stop duple to our NEW revised
-            # list
-            new_event_candidates.append((event_candidates[i][0],
-                                         event_candidates[ii][1]))
-            i = ii + 1
-
-        return np.array(new_event_candidates)
+        return np.column_stack((new_starts, new_ends))
 
     def remove_too_small_events(self, event_candidates):
         """
@@ -428,15 +402,20 @@ class EventFinder:
         # --------------------------------------------------------
 
         num_runs = np.shape(event_candidates)[0]
+        starts = event_candidates[:, 0]
+        ends = event_candidates[:, 1]
+
+        def nanmean_over_events(data):
+            is_good_data = ~np.isnan(data)
+            n_good = utils.sum_over_runs(is_good_data.astype(int), starts, ends)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return utils.sum_over_runs(np.where(is_good_data, data, 0),
+                                           starts, ends) / n_good
 
         # Sum the actual distance travelled by the worm during each candidate
         # event
-        event_sums = np.empty(num_runs, dtype=float)
-        for i in range(num_runs):
-            event_sums[i] = np.nansum(
-                distance_data[
-                    event_candidates[i][0]:(
-                        event_candidates[i][1] + 1)])
+        event_sums = utils.sum_over_runs(
+            np.where(np.isnan(distance_data), 0, distance_data), starts, ends)
 
         # self.min_distance_threshold contains a 1-d n-element array of
         # skeleton lengths * 5% or whatever proportion we've decided the
@@ -449,20 +428,14 @@ class EventFinder:
         # threshold at all.
         min_threshold_sums = np.empty(num_runs, dtype=float)
         if self.min_distance_threshold is not None:
-            for i in range(num_runs):
-                min_threshold_sums[i] = np.nanmean(
-                    self.min_distance_threshold[
-                        event_candidates[i][0]:(
-                            event_candidates[i][1] + 1)])
+            min_threshold_sums = nanmean_over_events(
+                self.min_distance_threshold)
 
         # Same procedure as above, but for the maximum distance threshold.
         max_threshold_sums = np.empty(num_runs, dtype=float)
         if self.max_distance_threshold is not None:
-            for i in range(num_runs):
-                max_threshold_sums[i] = np.nanmean(
-                    self.max_distance_threshold[
-                        event_candidates[i][0]:(
-                            event_candidates[i][1] + 1)])
+            max_threshold_sums = nanmean_over_events(
+                self.max_distance_threshold)
 
         # Actual filtering of the candidate events
         # --------------------------------------------------------
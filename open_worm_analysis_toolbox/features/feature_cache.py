@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+An on-disk cache of computed features.
+
+Each feature is stored under a key that is a hash of everything that went
+into computing it:
+- the package version and the settings in config.py
+- the NormalizedWorm (its arrays and its video info)
+- the feature's spec (i.e. its row in features_list.csv)
+- the keys of the features it depends on
+- the values of the processing options that it read, and the contents
+  of any files that these name (e.g. posture.eigen_worm_file_path)
+
+The processing options that a feature reads are recorded while it is
+computed, and stored alongside the cache. Changing an option therefore
+only invalidates the features that read it, and the features that depend
+on those.
+
+Feature values that are numeric numpy arrays are stored as .npy files and
+loaded back memory-mapped, i.e. lazily. The rest of the feature is pickled.
+
+Usage
+-----
+cache = FeatureCache('/path/to/cache')
+wf = WormFeatures(nw, cache=cache)
+
+"""
+
+import copy
+import hashlib
+import json
+import os
+import pickle
+import types
+
+import numpy as np
+import six
+
+from .. import config, utils
+from ..version import __version__
+
+
+class FeatureCache(object):
+    """
+    Attributes
+    ----------
+    path : string
+        The folder holding the cached features
+
+    See Also
+    --------
+    WormFeatures._get_and_log_feature
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def compute_feature(self, spec, wf, internal_request=False):
+        """
+        Load a feature from the cache, or compute it and store it in the
+        cache. This takes the place of spec.compute_feature(wf)
+
+        Parameters
+        ----------
+        spec : FeatureProcessingSpec
+        wf : WormFeatures
+        internal_request : bool
+
+        """
+        # The keys of the dependencies are needed before we can look
+        # for the feature
+        dependencies = [wf._get_and_log_feature(x, internal_request=True)
+                        for x in spec.dependencies]
+        dependency_keys = [getattr(x, 'cache_key', None)
+                           for x in dependencies]
+
+        if None in dependency_keys:
+            # Without the keys of all of its inputs we can't cache the
+            # feature
+            feature = spec.compute_feature(wf, internal_request)
+            feature.cache_key = None
+            return feature
+
+        # The spec includes its 'source', i.e. computed or loaded
+        base_key = _hash([__version__, self._get_nw_key(wf), spec,
+                          dependency_keys])
+
+        key = self._get_key(base_key, wf.options)
+        if key is not None:
+            feature = self._load(key, spec, wf, internal_request)
+            if feature is not None:
+                return feature
+
+        # Record which options are read while computing the feature
+        option_names = []
+        options = wf.options
+        wf.options = _OptionsRecorder(options, '', option_names)
+        try:
+            feature = spec.compute_feature(wf, internal_request)
+        finally:
+            wf.options = options
+
+        option_names = sorted(set(option_names))
+        key = _hash([base_key, option_names,
+                     _get_option_values(options, option_names)])
+
+        # If the feature requested features other than its declared
+        # dependencies, its key doesn't account for everything it used
+        if getattr(feature, 'dependencies', []) == spec.dependencies:
+            self._save(key, feature)
+            self._write_json(base_key + '.json', option_names)
+            feature.cache_key = key
+        else:
+            feature.cache_key = None
+
+        return feature
+
+    def _get_nw_key(self, wf):
+        """
+        The hash of the normalized worm is computed once per WormFeatures
+
+        Some features read settings from config.py rather than from the
+        processing options, so these are included as well.
+        """
+        try:
+            return wf._nw_cache_key
+        except AttributeError:
+            config_settings = dict((key, value) for key, value in
+                                   vars(config).items() if key.isupper())
+            wf._nw_cache_key = _hash([wf.nw, config_settings])
+            return wf._nw_cache_key
+
+    def _get_key(self, base_key, options):
+        """
+        Return the key of a feature from the options that it read the
+        last time it was computed, or None if it hasn't been computed.
+        """
+        file_path = os.path.join(self.path, base_key + '.json')
+        if not os.path.isfile(file_path):
+            return None
+
+        with open(file_path) as f:
+            option_names = json.load(f)
+
+        try:
+            option_values = _get_option_values(options, option_names)
+        except AttributeError:
+            return None
+
+        return _hash([base_key, option_names, option_values])
+
+    def _load(self, key, spec, wf, internal_request):
+        file_path = os.path.join(self.path, key + '.pickle')
+        if not os.path.isfile(file_path):
+            return None
+
+        start_time = utils.timing_function()
+
+        with open(file_path, 'rb') as f:
+            d = pickle.load(f)
+
+        feature = d['feature']
+        if d['value_in_npy']:
+            # Memory-mapped, so the data is only read from disk when used.
+            # Copy-on-write, so the feature can still be modified.
+            feature.value = np.load(os.path.join(self.path, key + '.npy'),
+                                    mmap_mode='c').view(np.ndarray)
+
+        # As in spec.compute_feature
+        feature.name = spec.name
+        feature.is_temporary = spec.is_temporary
+        feature.spec = spec
+        feature.is_user_requested = not internal_request
+        feature.cache_key = key
+
+        wf.timer.toc(spec.name, start_time)
+
+        return feature
+
+    def _save(self, key, feature):
+        stored_feature = copy.copy(feature)
+        stored_feature.spec = None
+
+        value = getattr(feature, 'value', None)
+        value_in_npy = isinstance(value, np.ndarray) and \
+            value.dtype != np.object_
+        if value_in_npy:
+            stored_feature.value = None
+            self._write(key + '.npy', lambda f: np.save(f, value))
+
+        self._write(key + '.pickle',
+                    lambda f: pickle.dump({'feature': stored_feature,
+                                           'value_in_npy': value_in_npy},
+                                          f, pickle.HIGHEST_PROTOCOL))
+
+    def _write_json(self, file_name, data):
+        self._write(file_name,
+                    lambda f: f.write(json.dumps(data).encode('utf-8')))
+
+    def _write(self, file_name, write_function):
+        # Other processes sharing the cache never see a partial file
+        utils.write_file_atomically(os.path.join(self.path, file_name),
+                                    write_function)
+
+    def __repr__(self):
+        return utils.print_object(self)
+
+
+class _OptionsRecorder(object):
+    """
+    Wraps a FeatureProcessingOptions instance (or one of its sections),
+    logging the full name of each option that is read.
+
+    Methods of the options are called with the recorder as 'self', so that
+    the options they read are logged as well.
+    """
+
+    def __init__(self, options, prefix, option_names):
+        self._options = options
+        self._prefix = prefix
+        self._option_names = option_names
+
+    def __getattr__(self, name):
+        value = getattr(self._options, name)
+        full_name = self._prefix + name
+
+        if isinstance(value, types.MethodType) and \
+                value.__self__ is self._options:
+            return types.MethodType(value.__func__, self)
+        elif hasattr(value, '__dict__') and not callable(value):
+            return _OptionsRecorder(value, full_name + '.',
+                                    self._option_names)
+        else:
+            self._option_names.append(full_name)
+            return value
+
+    def __reduce__(self):
+        # If a feature holds on to its options, pickle the options
+        # themselves
+        return (_return_input, (self._options,))
+
+
+def _return_input(x):
+    return x
+
+
+def _get_option_values(options, option_names):
+    """
+    The values of the given options.  Options that name a file are
+    replaced by the file name and the hash of its contents, so that
+    editing the file invalidates the features computed from it.
+    """
+    values = []
+    for full_name in option_names:
+        value = options
+        for name in full_name.split('.'):
+            value = getattr(value, name)
+        if isinstance(value, six.string_types) and os.path.isfile(value):
+            value = (value, _get_file_hash(value))
+        values.append(value)
+    return values
+
+
+# The hashes of the files named by options, by path, size and modification
+# time, so that each file is only read once per process (unless it changes)
+_file_hashes = {}
+
+
+def _get_file_hash(file_path):
+    stat = os.stat(file_path)
+    file_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime)
+
+    if file_key not in _file_hashes:
+        h = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                h.update(block)
+        _file_hashes[file_key] = h.hexdigest()
+
+    return _file_hashes[file_key]
+
+
+def _hash(data):
+    """
+    Hash numpy arrays, objects with a __dict__ and plain Python values
+    (nested within lists, tuples and dicts).
+    """
+    h = hashlib.sha1()
+    _update_hash(h, data)
+    return h.hexdigest()
+
+
+def _update_hash(h, data):
+    if isinstance(data, np.ndarray):
+        h.update(('ndarray%s%s' % (data.dtype.str, data.shape))
+                 .encode('utf-8'))
+        if data.dtype == np.object_:
+            for x in data.flat:
+                _update_hash(h, x)
+        else:
+            h.update(np.ascontiguousarray(data).view(np.uint8))
+    elif isinstance(data, dict):
+        h.update(('dict%d' % len(data)).encode('utf-8'))
+        for key in sorted(data, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, data[key])
+    elif isinstance(data, (list, tuple)):
+        h.update(('%s%d' % (type(data).__name__, len(data))).encode('utf-8'))
+        for x in data:
+            _update_hash(h, x)
+    elif hasattr(data, '__dict__') and not callable(data):
+        # Skip private attributes, these are caches (e.g. of the frame
+        # code descriptions) rather than data
+        h.update(type(data).__name__.encode('utf-8'))
+        _update_hash(h, dict((key, value) for key, value in
+                             data.__dict__.items()
+                             if not key.startswith('_')))
+    else:
+        h.update(('%s%r' % (type(data).__name__, data)).encode('utf-8'))
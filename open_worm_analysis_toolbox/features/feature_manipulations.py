@@ -14,6 +14,87 @@ import warnings
 import numpy as np
 
 
+class ExpandedFeature(generic_features.Feature):
+    """
+    A feature from feature expansion, i.e. some of the values of a parent
+    feature, possibly transformed (e.g. made absolute).
+
+    Only the name and the spec belong to the expanded feature, all other
+    attributes are those of the parent. The masks are shared between all
+    features expanded from the same parent, and the value is only
+    computed when it is first requested.
+
+    Attributes
+    ----------
+    parent : Feature
+    name : string
+    spec : worm_features.FeatureProcessingSpec
+    value :
+        The selected values of the parent
+
+    See Also
+    --------
+    expand_mrc_features
+
+    """
+
+    def __init__(self, parent, spec, source_value, masks=(), transform=None):
+        """
+        Parameters
+        ----------
+        parent : Feature
+        spec : worm_features.FeatureProcessingSpec
+        source_value : numpy array or None
+            The values to select from, generally the value of the parent
+        masks : sequence of boolean arrays
+            The values that are kept are those for which all masks are True
+        transform : function (optional)
+            Applied to the selected values
+        """
+        self.parent = parent
+        self.name = spec.name
+        self.spec = spec
+        self._source_value = source_value
+        self._masks = masks
+        self._transform = transform
+
+    @property
+    def value(self):
+        try:
+            return self._value
+        except AttributeError:
+            pass
+
+        value = self._source_value
+        if value is not None:
+            if len(self._masks) > 0:
+                mask = self._masks[0]
+                for cur_mask in self._masks[1:]:
+                    mask = mask & cur_mask
+                value = value[mask]
+            if self._transform is not None:
+                value = self._transform(value)
+
+        self._value = value
+        # The selected values are all that is needed from now on
+        self._source_value = None
+        self._masks = ()
+
+        return value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    def __getattr__(self, name):
+        # Only called for attributes that the expanded feature doesn't
+        # have. Private attributes are never inherited, which also avoids
+        # recursion while unpickling, before 'parent' exists.
+        if name.startswith('_') or name == 'parent':
+            raise AttributeError(name)
+        return getattr(self.parent, name)
+
+
 def _expand_event_features(old_features, e_feature, m_masks, num_frames):
     """
         event
@@ -24,48 +105,40 @@ def _expand_event_features(old_features, e_feature, m_masks, num_frames):
 
     cur_spec = e_feature.spec
 
+    data_types = ['all']
+    if cur_spec.is_signed:
+        data_types.extend(['absolute', 'positive', 'negative'])
+
     if e_feature.has_data:
         # Removes partials and signs data
         cur_data = e_feature.get_value()
         # Remove the NaN and Inf entries
         all_data = utils.filter_non_numeric(cur_data)
 
-        data_entries = {}
-        data_entries['all'] = all_data
-        if cur_spec.is_signed:
-            data_entries['absolute'] = np.absolute(all_data)
-            data_entries['positive'] = all_data[all_data > 0]
-            data_entries['negative'] = all_data[all_data > 0]
-
+        positive_mask = all_data > 0
+        d_masks = {'all': (),
+                   'absolute': (),
+                   'positive': (positive_mask,),
+                   'negative': (positive_mask,)}
     else:
-        data_entries = {}
-        data_entries['all'] = None
-        if cur_spec.is_signed:
-            data_entries['absolute'] = None
-            data_entries['positive'] = None
-            data_entries['negative'] = None
+        all_data = None
+        d_masks = dict((x, ()) for x in data_types)
 
-    return [
-        _create_new_event_feature(
-            e_feature,
-            data_entries[x],
-            x) for x in data_entries]
+    return [_create_new_event_feature(e_feature, all_data, d_masks[x], x)
+            for x in data_types]
 
 
-def _create_new_event_feature(feature, data, d_type):
+def _create_new_event_feature(feature, data, masks, d_type):
 
     # TODO: Need to verify that this is correct
 
     FEATURE_NAME_FORMAT_STR = '%s.%s_data'
 
-    temp_feature = feature.copy()
     temp_spec = feature.spec.copy()
     temp_spec.type = 'expanded_event'
     temp_spec.is_time_series = False
     temp_spec.name = FEATURE_NAME_FORMAT_STR % (temp_spec.name, d_type)
 
-    # We might want to change this to load from the spec
-    temp_feature.name = temp_spec.name
     # display_name?
     # short_display_name?
     #
@@ -73,11 +146,14 @@ def _create_new_event_feature(feature, data, d_type):
     # is_signed => maybe ...
     # TODO: Might need to change this for events
     temp_spec.is_signed = temp_spec.is_signed and d_type == 'all'
-    temp_feature.value = data
-    temp_feature.spec = temp_spec
     # TODO: Let's update the keep mask and signed
 
-    return temp_feature
+    if d_type == 'absolute':
+        transform = np.absolute
+    else:
+        transform = None
+
+    return ExpandedFeature(feature, temp_spec, data, masks, transform)
 
 
 def _expand_movement_features(m_feature, m_masks, num_frames):
@@ -103,6 +179,8 @@ def _expand_movement_features(m_feature, m_masks, num_frames):
     cur_spec = m_feature.spec
     cur_data = m_feature.value
 
+    # These masks are computed once per feature and shared by all of the
+    # expanded features, the values are only selected when needed
     good_data_mask = ~utils.get_non_numeric_mask(cur_data).flatten()
 
     d_masks = {}
@@ -152,29 +230,25 @@ def _create_new_movement_feature(feature, m_masks, d_masks, m_type, d_type):
 
     FEATURE_NAME_FORMAT_STR = '%s.%s_data_with_%s_movement'
 
-    cur_mask = m_masks[m_type] & d_masks[d_type]
-    temp_feature = feature.copy()
-    temp_spec = temp_feature.spec
+    temp_spec = feature.spec.copy()
     temp_spec.type = 'expanded_movement'
     temp_spec.is_time_series = False
     temp_spec.name = FEATURE_NAME_FORMAT_STR % (temp_spec.name, d_type, m_type)
 
-    # We might want to change this to load from the spec
-    temp_feature.name = temp_spec.name
     # display_name?
     # short_display_name?
     #
     # has_zero_bin => stays the same
     # is_signed => maybe ...
     temp_spec.is_signed = temp_spec.is_signed and d_type == 'all'
+
     if d_type == 'absolute':
-        temp_feature.value = np.absolute(feature.value[cur_mask])
+        transform = np.absolute
     else:
-        temp_feature.value = feature.value[cur_mask]
+        transform = None
 
-    temp_feature.spec = temp_spec
-
-    return temp_feature
+    return ExpandedFeature(feature, temp_spec, feature.value,
+                           (m_masks[m_type], d_masks[d_type]), transform)
 
 
 def expand_mrc_features(old_features):
@@ -198,7 +272,11 @@ def expand_mrc_features(old_features):
     Outline
     -------
     Return a new set of features in which the specs have been appropriately
-    modified (need to implement a deep copy)
+    modified.
+
+    The expanded features are ExpandedFeature instances, which share the
+    values of the original features (and the masks above) until their
+    own values are requested.
     """
 
     # Motion of the the worm's body
@@ -235,6 +313,10 @@ def expand_mrc_features(old_features):
                     move_mask,
                     num_frames))
         else:
-            all_features.append(cur_feature.copy())
+            # The value is shared with the original feature rather than
+            # copied
+            all_features.append(ExpandedFeature(
+                cur_feature, cur_feature.spec.copy(),
+                getattr(cur_feature, 'value', None)))
 
     return old_features.copy(all_features)
@@ -129,6 +129,12 @@ class PostureOptions(object):
         # Used by: posture.eigenprojections
         self.n_eigenworms_use = 6
 
+        # The file with the eigenworms to project onto, or None for the
+        # N2 eigenworms computed by the Schafer lab (config.EIGENWORM_FILE)
+        #
+        # Used by: posture.eigenprojections
+        self.eigen_worm_file_path = None
+
         # This the fraction of the worm length that a bend must be
         # in order to be counted. The # of worm points
         # (this_value*worm_length_in_samples) is rounded to an integer
@@ -60,10 +60,7 @@ class BendHelper(object):
         fps = int(fps)
 
         max_freq = options.max_frequency(fps)
-        min_freq = options.min_frequency
         fft_n_samples = options.fft_n_samples
-        max_amp_pct_bandwidth = options.max_amplitude_pct_bandwidth
-        peak_energy_threshold = options.peak_energy_threshold
 
         # Maximum index to keep for frequency analysis:
         fft_max_I = int(fft_n_samples / 2)
@@ -89,67 +86,133 @@ class BendHelper(object):
         right_bounds = right_bounds.astype(int)
         left_bounds = left_bounds.astype(int)
 
-        for iFrame in np.flatnonzero(~is_bad_mask):
-            windowed_data = avg_bend_angles[
-                left_bounds[iFrame]:right_bounds[iFrame]]
-            data_win_length = len(windowed_data)
-
-            #
-            # fft frequency and bandwidth
-            #
-            # Compute the real part of the STFT.
-            # These two steps take a lot of time ...
-
-            # New code:
-            fft_data = abs(np.fft.rfft(windowed_data, fft_n_samples))
-
-            # Find the peak frequency.
-            maxPeakI = np.argmax(fft_data)
-            maxPeak = fft_data[maxPeakI]
-
-            # NOTE: If this is true, we'll never bound the peak on the left.
-            # We are looking for a hump with a peak, not just a decaying
-            # signal.
-            if maxPeakI == 0:
-                continue
-
-            unsigned_freq = freq_scalar * maxPeakI
-
-            if not (min_freq <= unsigned_freq <= max_freq):
-                continue
-
-            peakStartI, peakEndI = \
-                self.h__getBandwidth(data_win_length,
-                                     fft_data,
-                                     maxPeakI,
-                                     INIT_MAX_I_FOR_BANDWIDTH)
-            
-            if np.isnan(peakStartI) or np.isnan(peakEndI):
-                #wrong indexes, next loop
-                continue
-
-            # Store data
-            #------------------------------------------------------------------
-            fenergy = fft_data**2
-            tot_energy = np.sum(fenergy)
-            peak_energy = np.sum(fenergy[peakStartI:peakEndI])
-
-            peak_amplitud_treshold = (max_amp_pct_bandwidth * maxPeak)
-            if not (# The minima can't be too big:
-                    fft_data[peakStartI] > peak_amplitud_treshold or
-                    fft_data[peakEndI] > peak_amplitud_treshold or
-                    # Needs to have enough energy:
-                    (peak_energy < (peak_energy_threshold * tot_energy))
-                    ):
-
-                # Convert the peak to a time frequency.
-                dataSign = np.sign(np.nanmean(windowed_data))  # sign the data
-                amps[iFrame] = (2 * fft_data[maxPeakI] /
-                                data_win_length) * dataSign
-                freqs[iFrame] = unsigned_freq * dataSign
+        # Frames with the same window length are processed together, so
+        # that their windows can be stacked into a matrix, with one FFT
+        # per matrix rather than per frame. Each group is split into
+        # chunks to limit the memory used by the FFTs.
+        frames_per_chunk = max(1, self.MAX_FFT_VALUES // fft_n_samples)
+
+        frame_I = np.flatnonzero(~is_bad_mask)
+        win_lengths = right_bounds[frame_I] - left_bounds[frame_I]
+
+        for data_win_length in np.unique(win_lengths):
+            group_I = frame_I[win_lengths == data_win_length]
+            for chunk_start in range(0, group_I.size, frames_per_chunk):
+                chunk_I = group_I[chunk_start:chunk_start + frames_per_chunk]
+                windowed_data = avg_bend_angles[
+                    left_bounds[chunk_I][:, None] +
+                    np.arange(data_win_length)]
+
+                amps[chunk_I], freqs[chunk_I] = \
+                    self.h__getWindowsBendData(windowed_data, options, fps,
+                                               INIT_MAX_I_FOR_BANDWIDTH)
 
         return amps, freqs
 
+    # The number of FFT values computed at once by h__getBendData, i.e.
+    # the number of frames times fft_n_samples
+    MAX_FFT_VALUES = 2 ** 22
+
+    def h__getWindowsBendData(self, windowed_data, options, fps,
+                              INIT_MAX_I_FOR_BANDWIDTH):
+        """
+        The bend amplitude and frequency of frames that have windows of
+        the same length.
+
+        Parameters
+        ----------
+        windowed_data: numpy.array
+            - [n_windows x data_win_length], the data of each window
+        options: open-worm-analysis-toolbox.features.feature_processing_options.LocomotionCrawlingBends
+        fps: int
+            Frames Per Second
+        INIT_MAX_I_FOR_BANDWIDTH: int
+            See h__getBandwidth
+
+        Returns
+        -------
+        amps, freqs: numpy.array
+            - [n_windows], NaN for windows without a valid peak
+
+        """
+        max_freq = options.max_frequency(fps)
+        min_freq = options.min_frequency
+        fft_n_samples = options.fft_n_samples
+        max_amp_pct_bandwidth = options.max_amplitude_pct_bandwidth
+        peak_energy_threshold = options.peak_energy_threshold
+
+        # As in h__getBendData
+        fft_max_I = int(fft_n_samples / 2)
+        freq_scalar = (fps / 2) * 1 / (fft_max_I - 1)
+
+        n_windows, data_win_length = windowed_data.shape
+        amps = np.empty(n_windows) * np.NaN
+        freqs = np.empty(n_windows) * np.NaN
+
+        #
+        # fft frequency and bandwidth
+        #
+        # Compute the real part of the STFT, for all windows at once
+        fft_data = abs(np.fft.rfft(windowed_data, fft_n_samples, axis=1))
+
+        # Find the peak frequency.
+        max_peak_I = np.argmax(fft_data, axis=1)
+        max_peak = fft_data[np.arange(n_windows), max_peak_I]
+
+        unsigned_freq = freq_scalar * max_peak_I
+
+        # NOTE: If max_peak_I is 0, we'll never bound the peak on the left.
+        # We are looking for a hump with a peak, not just a decaying
+        # signal.
+        is_good = (max_peak_I != 0) & \
+            (min_freq <= unsigned_freq) & (unsigned_freq <= max_freq)
+
+        keep_I = np.flatnonzero(is_good)
+        fft_data = fft_data[keep_I]
+        max_peak_I = max_peak_I[keep_I]
+        max_peak = max_peak[keep_I]
+        unsigned_freq = unsigned_freq[keep_I]
+
+        peak_start_I, peak_end_I = \
+            self.h__getBandwidth(data_win_length,
+                                 fft_data,
+                                 max_peak_I,
+                                 INIT_MAX_I_FOR_BANDWIDTH)
+
+        # Windows for which a bound wasn't found
+        is_good = (peak_start_I >= 0) & (peak_end_I >= 0)
+        peak_start_I[~is_good] = 0
+        peak_end_I[~is_good] = 0
+
+        # Check the peak
+        #------------------------------------------------------------------
+        row_I = np.arange(keep_I.size)
+        point_I = np.arange(fft_data.shape[1])
+
+        fenergy = fft_data**2
+        tot_energy = np.sum(fenergy, axis=1)
+        is_in_peak = (point_I >= peak_start_I[:, None]) & \
+            (point_I < peak_end_I[:, None])
+        peak_energy = np.sum(np.where(is_in_peak, fenergy, 0), axis=1)
+
+        peak_amplitude_threshold = (max_amp_pct_bandwidth * max_peak)
+        is_good &= ~(  # The minima can't be too big:
+            (fft_data[row_I, peak_start_I] > peak_amplitude_threshold) |
+            (fft_data[row_I, peak_end_I] > peak_amplitude_threshold) |
+            # Needs to have enough energy:
+            (peak_energy < (peak_energy_threshold * tot_energy)))
+
+        # Convert the peak to a time frequency.
+        good_I = keep_I[is_good]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            # sign the data
+            data_sign = np.sign(np.nanmean(windowed_data[good_I], axis=1))
+        amps[good_I] = (2 * max_peak[is_good] /
+                        data_win_length) * data_sign
+        freqs[good_I] = unsigned_freq[is_good] * data_sign
+
+        return amps, freqs
 
     def h__getBandwidth(self, data_win_length, fft_data,
                         max_peak_I, INIT_MAX_I_FOR_BANDWIDTH):
@@ -161,7 +224,9 @@ class BendHelper(object):
         range of frequencies, as execution time is proportional to the length
         of the input data.  If this fails we use the full data set.
 
-        Called by: h__getBendData
+        All windows, which must have the same length, are processed at once.
+
+        Called by: h__getWindowsBendData
 
         Parameters
         ----------
@@ -170,10 +235,10 @@ class BendHelper(object):
           went into computing the FFT
 
         fft_data
-          Output of the fft function
+          Output of the fft function, [n_windows x n_frequencies]
 
         max_peak_I
-          Location (index) of the maximum of fft_data
+          Location (index) of the maximum of fft_data, [n_windows]
 
         INIT_MAX_I_FOR_BANDWIDTH
           See code
@@ -181,9 +246,11 @@ class BendHelper(object):
 
         Returns
         -------
-        peak_start_I: scalar
+        peak_start_I: numpy.array of ints [n_windows]
+          -1 where there is no minimum before the maximum
 
-        peak_end_I: scalar
+        peak_end_I: numpy.array of ints [n_windows]
+          -1 where there is no minimum after the maximum
 
 
         Notes
@@ -196,54 +263,60 @@ class BendHelper(object):
 
         """
 
-        peakWinSize = round(np.sqrt(data_win_length))
+        peakWinSize = int(round(np.sqrt(data_win_length)))
+        INIT_MAX_I_FOR_BANDWIDTH = int(INIT_MAX_I_FOR_BANDWIDTH)
 
-        # Find the peak bandwidth.
-        if max_peak_I < INIT_MAX_I_FOR_BANDWIDTH:
-            # NOTE: It is incorrect to filter by the maximum here, as we want to
-            # allow matching a peak that will later be judged invalid. If we
-            # filter here we may find another smaller peak which will not be
-            # judged invalid later on.
-            min_peaks, min_peaks_I = utils.separated_peaks(
-                fft_data[:INIT_MAX_I_FOR_BANDWIDTH],
+        n_windows = max_peak_I.size
+        peak_start_I = np.full(n_windows, -1, dtype=int)
+        peak_end_I = np.full(n_windows, -1, dtype=int)
+
+        def find_bounds(window_I, n_points):
+            # NOTE: It is incorrect to filter by the maximum here, as we
+            # want to allow matching a peak that will later be judged
+            # invalid. If we filter here we may find another smaller peak
+            # which will not be judged invalid later on.
+            is_min_peak = utils.separated_peaks_by_row(
+                fft_data[window_I, :n_points],
                 peakWinSize,
                 use_max=False,
                 value_cutoff=np.inf)
 
-            del min_peaks   # this part of max_peaks_dist's return is unused
+            # The first minimum before the maximum, and the first after it
+            point_I = np.arange(n_points)
+            cur_max_peak_I = max_peak_I[window_I, None]
+            for is_bound, bound_I in \
+                    [(is_min_peak & (point_I < cur_max_peak_I), peak_start_I),
+                     (is_min_peak & (point_I > cur_max_peak_I), peak_end_I)]:
+                bound_I[window_I] = np.where(np.any(is_bound, axis=1),
+                                             np.argmax(is_bound, axis=1), -1)
 
-            # TODO: This is wrong, replace add find to utils ...
-            peak_start_I = min_peaks_I[utils.find(min_peaks_I < max_peak_I, 1)]
-            peak_end_I = min_peaks_I[utils.find(min_peaks_I > max_peak_I, 1)]
-        else:
-            peak_start_I = np.array([])
-            peak_end_I = np.array([])
+        # Find the peak bandwidth.
+        is_initial = max_peak_I < INIT_MAX_I_FOR_BANDWIDTH
+        window_I = np.flatnonzero(is_initial)
+        if window_I.size > 0:
+            find_bounds(window_I, INIT_MAX_I_FOR_BANDWIDTH)
 
         # NOTE: Besides checking for an empty value, we also need to ensure that
         # the minimum didn't come too close to the data border, as more data
         # could invalidate the result we have.
         #
         # NOTE: In order to save time we only look at a subset of the FFT data.
-        if (peak_end_I.size == 0) | \
-                (peak_end_I + peakWinSize >= INIT_MAX_I_FOR_BANDWIDTH):
+        #
+        # NOTE: The frame by frame code tested for an empty value with
+        # (peak_end_I.size == 0) | (...), which is an empty array, and thus
+        # False, when peak_end_I is empty. So it only reran the search
+        # when the initial search found a minimum that was too close to the
+        # border, and never for peaks beyond INIT_MAX_I_FOR_BANDWIDTH.
+        # We keep this behaviour so that the results don't change.
+        window_I = np.flatnonzero(
+            is_initial & (peak_end_I != -1) &
+            (peak_end_I + peakWinSize >= INIT_MAX_I_FOR_BANDWIDTH))
+        if window_I.size > 0:
             # If true, then rerun on the full set of data
-            [min_peaks, min_peaks_I] = utils.separated_peaks(
-                fft_data, peakWinSize, use_max=False, value_cutoff=np.inf)
+            find_bounds(window_I, fft_data.shape[1])
 
-            del(min_peaks)  # This part of max_peaks_dist's return is unused
+        return (peak_start_I, peak_end_I)
 
-            peak_start_I = min_peaks_I[utils.find(min_peaks_I < max_peak_I, 1)]
-            peak_end_I = min_peaks_I[utils.find(min_peaks_I > max_peak_I, 1)]
-
-        assert peak_start_I.size <= 1
-        assert peak_end_I.size <= 1
-        
-        #return an array it is problematic, and can give rise to deprecation errors. Let's return a tuple instead.
-        peak_start_Int = int(peak_start_I[0]) if peak_start_I.size == 1 else np.nan
-        peak_end_Int = int(peak_end_I[0]) if peak_end_I.size == 1 else np.nan
-
-        # TODO: Why is this not a tuple - tuple would be more consistent
-        return (peak_start_Int, peak_end_Int)
 
 class LocomotionBend(object):
     """
@@ -445,7 +518,8 @@ class LocomotionCrawlingBends(BendHelper):
                     avg_bend_angles)
 
             bound_info = CrawlingBendsBoundInfo(
-                avg_bend_angles, is_paused, options, fps)
+                avg_bend_angles, is_paused, options, fps,
+                features_ref.options.mimic_old_behaviour)
 
             [amplitude, frequency] = self.h__getBendData(avg_bend_angles,
                                                          bound_info,
@@ -1342,7 +1416,8 @@ class CrawlingBend(Feature, BendHelper):
             avg_bend_angles = utils.interpolate_with_threshold(avg_bend_angles)
 
         bound_info = CrawlingBendsBoundInfo(
-            avg_bend_angles, is_paused, options, fps)
+            avg_bend_angles, is_paused, options, fps,
+            wf.options.mimic_old_behaviour)
 
         [amplitude, frequency] = self.h__getBendData(avg_bend_angles,
                                                      bound_info,
@@ -1398,7 +1473,8 @@ class CrawlingBendsBoundInfo(object):
 
     """
 
-    def __init__(self, avg_bend_angles, is_paused, options, fps):
+    def __init__(self, avg_bend_angles, is_paused, options, fps,
+                 mimic_old_behaviour=True):
 
         # TODO: This needs to be cleaned up ...  - @JimHokanson
         min_number_frames_for_bend = round(options.min_time_for_bend * fps)
@@ -1406,7 +1482,8 @@ class CrawlingBendsBoundInfo(object):
 
         [back_zeros_I, front_zeros_I] = \
             self.h__getBoundingZeroIndices(avg_bend_angles,
-                                           min_number_frames_for_bend)
+                                           min_number_frames_for_bend,
+                                           mimic_old_behaviour)
 
         n_frames = len(avg_bend_angles)
 
@@ -1454,7 +1531,8 @@ class CrawlingBendsBoundInfo(object):
     def h__getBoundingZeroIndices(
             self,
             avg_bend_angles,
-            min_number_frames_for_bend):
+            min_number_frames_for_bend,
+            mimic_old_behaviour=True):
         """
         The goal of this function is to bound each index of avg_bend_angles by
         sign changes.
@@ -1465,6 +1543,10 @@ class CrawlingBendsBoundInfo(object):
         avg_bend_angles : [1 x n_frames]
         min_number_frames_for_bend    : int
           The minimum size of the data window
+        mimic_old_behaviour : bool
+          If True the window is expanded until the distance between the
+          sign changes reaches min_number_frames_for_bend, as the old code
+          did, otherwise only until the centered window does (see below)
 
         Returns
         ----------------------
@@ -1485,14 +1567,8 @@ class CrawlingBendsBoundInfo(object):
         # ---------------------------------------
         # The old code found sign changes for every frame, even though
         # the sign changes never changed. Instead we find all sign changes,
-        # and then for each frame know which frame to the left and right
-        # have sign changes. We do this in such a way so that if we need to
-        # look further to the left or right, it is really easy to get the
-        # next answer. In other words, if we are bounded by the 3rd and 4th sign
-        # change, and we are going towards the 3rd sign change, then if the
-        # 3rd sign change doesn't work, we can go to the 2nd sign change index,
-        # not by searching the data array, but by getting the 2nd element of
-        # the sign change index array.
+        # and then for each frame search the sign change index array for
+        # the bounding sign changes.
 
         with np.errstate(invalid='ignore'):
             sign_change_mask = np.sign(avg_bend_angles[:-1]) != \
@@ -1506,183 +1582,102 @@ class CrawlingBendsBoundInfo(object):
             # no changes of sign return two zeros arrays
             return [np.zeros(n_frames), np.zeros(n_frames)]
 
-        """
-        To get the correct frame numbers, we need to do the following
-        depending on whether or not the bound is the left (backward)
-        bound or the right (forward) bound.
-
-        Note from @JimHokanson: I haven't really thought through why
-        this is, but it mimics the old code.
-
-        for left bounds   - at sign changes - don't subtract or add
-        for right bounds  - we need to add 1
-
-
-        Let's say we have sign changes at indices 3  6  9
-        What we need ...
-                1 2 3 4 5 6 7  9  10  Indices
-        Left  = 0 0 0 3 3 3 6  6  6   - at 4, the left sign change is at 3
-        Right = 4 4 4 7 7 7 10 10 0   - at 4, the right sign change is at 7
-
-        NOTE: The values above are the final indices or values, but instead we
-        want to work with the indices, so we need:
-
-                1 2 3 4 5 6 7  9  10  Indices
-        Left  = 0 0 0 1 1 1 2  2  2 - left_sign_change_I
-        Right = 1 1 1 2 2 2 3  3  3 - right_sign_change_I
-
-        we also need:
-        left_values  = [3 6 9]  #the sign change indices
-        right_values = [4 7 10] #+1
-
-        So this says:
-        left_sign_change_I(7) => 2
-        left_values(2) => 6, our sign change is at 6
-
-        Let's say we need to expand further to the left, then we take
-        left_sign_change_I(7) - 1 => 1
-        left_values(1) => 3, our new sign change is at 3
-
-        Further:
-        left_sign_change_I(7) - 2 => 0
-        We've gone too far, nothing at index 0, set to invalid
-        """
-
-        # For each element, determine the indices to the left and right of the
-        # element at which a sign change occurs.
-
         BAD_INDEX_VALUE = -1
 
-        # For each element in the array, these values indicate which
-        # sign change index to use ...
-        left_sign_change_I = np.zeros(n_frames)
-
-        left_sign_change_I[sign_change_I + 1] = 1
-        # We increment at values to the right of the sign changes
-        left_sign_change_I = left_sign_change_I.cumsum() - 1
-
-        # NOTE: We need to do this after the cumsum :/
-        left_sign_change_I[:sign_change_I[0]] = BAD_INDEX_VALUE
-        # The previous line is a little Matlab trick in which
-        # something like:
-        # 0  1 0 1 0 0 1 0 0 <= sign change indices
-        # 0  1 2 3 4 5 6 7 8 <= indices
-        # becomes:
-        # -1 0 0 1 1 1 2 2 2 <= -1 is off limits, values are inclusive
-        #
-        # so now at each frame, we get the index of the value that
-        # is to the left.
-        #
-        # From above; sign_change_I = [0 3 6]
-        #
-        # So at index 5, the next sign change is at sign_change_I[left_change_I[5]]
-        # or sign_change_I[1] => 3
-
-        # This does:
-        # 0  1 0 1 0 0 1  0  0 <= sign change indices
-        # 0  1 2 3 4 5 6  7  8 <= indices
-        # 0  0 1 1 2 2 2 -1 -1 <= indices of sign change to right
-        right_sign_change_I = np.zeros(n_frames)
-        right_sign_change_I[sign_change_I[:-1] + 1] = 1
-        right_sign_change_I[0] = 1
-        right_sign_change_I = right_sign_change_I.cumsum() - 1
-        # We must have nothing to the right of the last change:
-        right_sign_change_I[sign_change_I[-1] + 1:] = BAD_INDEX_VALUE
-
-        # Indices that each left_sign_change_I or right_sign_change_I points to
-        left_values = sign_change_I
-        right_values = sign_change_I + 1  # By definition
-        #----------------------------------------------------------------
-
         back_zeros_I = np.zeros(n_frames)
         back_zeros_I[:] = BAD_INDEX_VALUE
+        # NOTE: The old code never set invalid front_zeros_I to -1, they
+        # were left at 0. We keep this, although it doesn't matter as long
+        # as back_zeros_I is -1.
         front_zeros_I = np.zeros(n_frames)
-        back_zeros_I[:] = BAD_INDEX_VALUE
 
-        for iFrame in range(n_frames):
-            cur_left_index = left_sign_change_I[iFrame]
-            cur_right_index = right_sign_change_I[iFrame]
-
-            if cur_left_index == BAD_INDEX_VALUE or cur_right_index == BAD_INDEX_VALUE:
-                continue
-
-            # Convert from float to int
-            cur_left_index = int(cur_left_index)
-            cur_right_index = int(cur_right_index)
-
-            back_zero_I = left_values[cur_left_index]
-            front_zero_I = right_values[cur_right_index]
-
-            use_values = True
-
-            # Expand the zero-crossing window.
-            #----------------------------------
-            # Note from @JimHokanson:
-            #
-            # TODO: Fix and move this code to old config
-            #
-            # General problem, we specify a minimum acceptable window size,
-            # and the old code needlessly expands the window past this point
-            # by doing the following comparison:
-            #
-            # - distance from right to left > min_window_size?
-            #
-            #   The following code centers on 2x the larger of the following gaps:
-            #
-            #   - distance from left to center
-            #   - distance from right to center
-            #
-            #   So we should check if either of these is half ot the
-            #   required width.
-            #
-            # half-window sizes:
-            # left_window_size  = iFrame - back_zero_I
-            # right_window_size = front_zero_I - iFrame
-            #
-            # so in reality we should use:
-            #
-            # front_zero_I - iFrame < min_number_frames_for_bend/2 and
-            # iFrame - back_zero_I < min_number_frames_for_bend/2
-            #
-            # By not doing this, we overshoot the minimum window size that
-            # we need to use. Consider window sizes that are in terms of
-            # the minimum window size.
-            #
-            # i.e. 0.5w means the left or right window is half min_number_frames_for_bend
-            #
-            # Consider we have:
-            # 0.5w left
-            # 0.3w right
-            #
-            #   total 0.8w => not at 1w, thus old code should expand
-            #
-            #   But in reality, if we stopped now we would be at twice 0.5w
-
-            while (
-                    front_zero_I -
-                    back_zero_I +
-                    1) < min_number_frames_for_bend:
-                # Expand the smaller of the two windows
-                # -------------------------------------
-                #  left_window_size       right_window_size
-                if (iFrame - back_zero_I) < (front_zero_I - iFrame):
-                    # Expand to the left:
-                    cur_left_index = cur_left_index - 1
-                    if cur_left_index == BAD_INDEX_VALUE:
-                        use_values = False
-                        break
-                    back_zero_I = left_values[cur_left_index]
-                else:
-                    # Expand to the right:
-                    cur_right_index = cur_right_index + 1
-                    if cur_right_index >= n_sign_changes:
-                        use_values = False
-                        break
-                    front_zero_I = right_values[cur_right_index]
-
-            if use_values:
-                back_zeros_I[iFrame] = back_zero_I
-                front_zeros_I[iFrame] = front_zero_I
+        # A frame is bounded on the left by a sign change before it
+        # (back_zero_I = sign_change_I[i]) and on the right by a sign change
+        # at or after it (front_zero_I = sign_change_I[i] + 1). Frames
+        # before the first or after the last sign change are not bounded.
+        frame_I = np.arange(n_frames)
+        is_bounded = (frame_I > sign_change_I[0]) & \
+            (frame_I <= sign_change_I[-1])
+        frame_I = frame_I[is_bounded]
+
+        # Expand the zero-crossing window.
+        #----------------------------------
+        # The old code started with the nearest sign changes and, while the
+        # window was too small, moved the nearer of the two bounds out to
+        # the next sign change (the right one on a tie), giving up if there
+        # was no sign change left on that side.
+        #
+        # Both half-window sizes only grow, so the window size does too.
+        # We can thus describe the expansion by a "level", g, with the
+        # window at a given level being bounded by:
+        #
+        #   left:  the last sign change at or before i - floor(g/2)
+        #   right: the first sign change at or after i - 1 + ceil(g/2)
+        #
+        # i.e. a left (right) bound is passed when 2x its half-window size
+        # (+1 for the left, to move the right first on ties) is below g.
+        # Each window the old code visited is the window at some level, in
+        # the same order, so the window it settled on is the window at the
+        # smallest level for which the window is big enough, or a side has
+        # run out of sign changes. We find that level for all frames at
+        # once with a binary search.
+        #
+        # Note from @JimHokanson:
+        #
+        # General problem, we specify a minimum acceptable window size,
+        # and the old code needlessly expands the window past this point
+        # by checking whether the distance from right to left is at least
+        # min_number_frames_for_bend. The window we use is centered on the
+        # frame, with 2x the larger of the two half-window sizes, so we
+        # should instead check whether the larger half-window is at least
+        # half the required width.
+        #
+        # Consider we have 0.5w left and 0.3w right, where w is
+        # min_number_frames_for_bend. The total is 0.8w, so the old code
+        # expands, but if we stopped now we would be at twice 0.5w.
+        #
+        # mimic_old_behaviour keeps the old (overshooting) test.
+
+        def get_bounds(level):
+            # Returns the bounds of the windows at the given levels, and
+            # whether each window is done expanding
+            left_I = np.searchsorted(
+                sign_change_I, frame_I - level // 2, side='right') - 1
+            right_I = np.searchsorted(
+                sign_change_I, frame_I - 1 + (level + 1) // 2, side='left')
+
+            is_out_of_bounds = (left_I < 0) | (right_I >= n_sign_changes)
+            back_zero_I = sign_change_I[np.maximum(left_I, 0)]
+            front_zero_I = sign_change_I[
+                np.minimum(right_I, n_sign_changes - 1)] + 1
+
+            if mimic_old_behaviour:
+                window_size = front_zero_I - back_zero_I + 1
+            else:
+                window_size = 2 * np.maximum(frame_I - back_zero_I,
+                                             front_zero_I - frame_I) + 1
+
+            is_done = is_out_of_bounds | \
+                (window_size >= min_number_frames_for_bend)
+
+            return back_zero_I, front_zero_I, is_out_of_bounds, is_done
+
+        # Below level 2 the windows are those of level 2, and above the last
+        # level all windows have run out of sign changes.
+        low_level = np.full(frame_I.size, 1, dtype=int)
+        high_level = np.full(frame_I.size, 2 * n_frames + 2, dtype=int)
+        while np.any(high_level - low_level > 1):
+            level = (low_level + high_level) // 2
+            is_done = get_bounds(level)[3]
+            high_level[is_done] = level[is_done]
+            low_level[~is_done] = level[~is_done]
+
+        back_zero_I, front_zero_I, is_out_of_bounds, _ = \
+            get_bounds(high_level)
+
+        use_I = frame_I[~is_out_of_bounds]
+        back_zeros_I[use_I] = back_zero_I[~is_out_of_bounds]
+        front_zeros_I[use_I] = front_zero_I[~is_out_of_bounds]
 
         return [back_zeros_I, front_zeros_I]
 
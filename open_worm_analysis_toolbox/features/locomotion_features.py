@@ -136,24 +136,25 @@ class LocomotionVelocity(object):
             'tail_tip': locomotion_options.velocity_tip_diff
         }
 
-        # Step 2: Run the compute_speed function on the different
-        # parts of the body,
-        for attribute_key, data_key in zip(self.attribute_keys, data_keys):
-            x, y = nw.get_partition(data_key, 'skeleton', True)
-
-            speed, direction = velocity_module.compute_speed(fps, x, y,
-                                                             avg_body_angle,
-                                                             sample_time_values[attribute_key],
-                                                             ventral_mode)[0:2]
-
-            # Go from shape (1, 4642) to shape (4642,), for
-            # num_frames == 4642, say.
-            #speed = speed.flatten()
-            #direction = direction.flatten()
-
-            setattr(self,
-                    attribute_key,
-                    LocomotionVelocityElement(attribute_key, speed, direction))
+        # Step 2: Run the compute_speeds function on the different
+        # parts of the body, together for the parts with the same sample time
+        for sample_time in set(sample_time_values.values()):
+            keys = [(attribute_key, data_key) for attribute_key, data_key in
+                    zip(self.attribute_keys, data_keys)
+                    if sample_time_values[attribute_key] == sample_time]
+            segments = [nw.get_partition(data_key, 'skeleton', True)
+                        for attribute_key, data_key in keys]
+
+            speeds, directions = velocity_module.compute_speeds(
+                fps, segments, avg_body_angle, sample_time,
+                ventral_mode)[0:2]
+
+            for (attribute_key, data_key), speed, direction in \
+                    zip(keys, speeds, directions):
+                setattr(self,
+                        attribute_key,
+                        LocomotionVelocityElement(attribute_key, speed,
+                                                  direction))
 
         timer.toc('locomotion.velocity')
 
@@ -508,10 +509,12 @@ class LocomotionVelocitySection(Feature):
         #i.e. x = self.get_feature(nw,'skeleton_x')
         x, y = nw.get_partition(data_key, 'skeleton', True)
         # The real work ...
-        speed, direction = velocity_module.compute_speed(fps, x, y,
-                                                         avg_body_angle,
-                                                         sample_time,
-                                                         ventral_mode)[0:2]
+        # The frames used to compute the velocity are the same for all
+        # segments with the same sample time, so they are shared through
+        # the WormFeatures instance
+        speed, direction = velocity_module.compute_speed(
+            fps, x, y, avg_body_angle, sample_time, ventral_mode,
+            wf.speed_indices_cache)[0:2]
 
         self.speed = speed
         self.direction = direction
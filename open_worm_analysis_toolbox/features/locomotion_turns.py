@@ -48,7 +48,6 @@ import numpy as np
 import collections
 import warnings
 import operator
-import re
 
 from .generic_features import Feature
 
@@ -716,22 +715,17 @@ class OmegaTurns(object):
         # valid, we'll use the last valid frame to define the difference, unless the
         # gap is too large.
 
-        is_good_th_direction_value = ~np.isnan(th_angle)
+        # i.e. the difference at each good frame is taken relative to the
+        # previous good frame, unless more than MAX_FRAME_JUMP_FOR_ANGLE_DIFF
+        # frames are missing in between
+        good_frames_I = np.flatnonzero(~np.isnan(th_angle))
+        cur_I = good_frames_I[1:]
+        last_I = good_frames_I[:-1]
+        is_small_gap = (cur_I - last_I - 1) <= MAX_FRAME_JUMP_FOR_ANGLE_DIFF
 
-        lastAngle = th_angle[0]
-        gapCounter = 0
-
-        th_angle_diff_temp = np.empty(th_angle.size) * np.NAN
-        for iFrame in range(n_frames)[1:]:   # formerly 2:n_frames
-            if is_good_th_direction_value[iFrame]:
-                th_angle_diff_temp[iFrame] = th_angle[iFrame] - lastAngle
-                gapCounter = 0
-                lastAngle = th_angle[iFrame]
-            else:
-                gapCounter += 1
-
-            if gapCounter > MAX_FRAME_JUMP_FOR_ANGLE_DIFF:
-                lastAngle = np.NaN
+        th_angle_diff_temp = np.full(n_frames, np.NaN)
+        th_angle_diff_temp[cur_I[is_small_gap]] = \
+            th_angle[cur_I[is_small_gap]] - th_angle[last_I[is_small_gap]]
 
         #???? - what does this really mean ??????
         # I think this basically says, instead of looking for gaps in the original
@@ -757,13 +751,12 @@ class OmegaTurns(object):
         #----------------------------------------------------
         # NOTE: We are using the identified jumps from the fixed angles to unwrap
         # the original angle vector
-        # subtract 2pi from remainging data after positive jumps
-        for j in range(len(positiveJumps)):
-            th_angle[positiveJumps[j]:] = th_angle[positiveJumps[j]:] - 2 * 180
-
+        # subtract 2pi from remainging data after positive jumps and
         # add 2pi to remaining data after negative jumps
-        for j in range(len(negativeJumps)):
-            th_angle[negativeJumps[j]:] = th_angle[negativeJumps[j]:] + 2 * 180
+        n_jumps = np.zeros(n_frames, dtype=int)
+        n_jumps[positiveJumps] += 1
+        n_jumps[negativeJumps] -= 1
+        th_angle = th_angle - 2 * 180 * np.cumsum(n_jumps)
 
         # Fix the th_angles through interpolation
         #----------------------------------------------------
@@ -810,30 +803,26 @@ class OmegaTurns(object):
                                  MIN_OMEGA_EVENT_LENGTH)
 
         """
-        # Let's take a boolean numpy array and change it to a string where
-        # A is false and B is true: e.g.
-        # [True, True, False] turns into 'BBA'
+        # Find the runs of omega frames that are long enough
         # (Note: this is all a translation of this Matlab line:
         # [start1, end1] = \
         #   regexp(is_omega_frame_as_string, gap_str, 'start', 'end')
-        is_omega_frame_as_ascii_codes = is_omega_frame.astype(int) + ord('A')
-        is_omega_frame_as_list = [chr(x)
-                                  for x in is_omega_frame_as_ascii_codes]
-        is_omega_frame_as_string = ''.join(is_omega_frame_as_list)
-        gap_re = re.compile(r'B{%d,}' % min_omega_event_length)
-        # Obtain a iterator of the results that match our regex, gap_re.
-        re_result = list(gap_re.finditer(is_omega_frame_as_string))
-        start1 = [m.start(0) for m in re_result]
-        end1 = [m.end(0) for m in re_result]
-
-        signed_omega_frames = np.zeros(is_omega_frame.size)
+        start1, end1, run_lengths = utils.find_runs(is_omega_frame)
+        is_long_run = run_lengths >= min_omega_event_length
+        start1 = start1[is_long_run]
+        end1 = end1[is_long_run]
 
         # Note: Here we keep the long gaps instead of removing them
-        for iEvent in range(len(start1)):
-            if np.mean(body_angles_i[start1[iEvent]:end1[iEvent]]) > 0:
-                signed_omega_frames[start1[iEvent]:end1[iEvent]] = 1
-            else:
-                signed_omega_frames[start1[iEvent]:end1[iEvent]] = -1
+        mean_body_angles = utils.sum_over_runs(body_angles_i, start1, end1) / \
+            run_lengths[is_long_run]
+        with np.errstate(invalid='ignore'):
+            event_signs = np.where(mean_body_angles > 0, 1, -1)
+
+        # Fill in each run with its sign
+        sign_changes = np.zeros(is_omega_frame.size + 1)
+        sign_changes[start1] += event_signs
+        sign_changes[end1 + 1] -= event_signs
+        signed_omega_frames = np.cumsum(sign_changes[:-1])
 
         return signed_omega_frames
 
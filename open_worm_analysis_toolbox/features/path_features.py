@@ -181,14 +181,16 @@ class Duration(Feature):
             y_scaled_max - y_scaled_min + 1, x_scaled_max - x_scaled_min + 1]
         ar = Arena(sx, sy, arena_size)
 
-        # Arena_size must be a list of whole numbers or else we'll get an
-        # error when calling np.zeroes(arena_size) later on
+        # Arena_size must be a list of whole numbers, as we index with it
         arena_size = np.array(arena_size, dtype=int)
 
         #----------------------------------------------------------------------
         def h__populateArenas(arena_size, sys, sxs, s_points, isnan_mask):
             """
 
+            The arenas are kept sparse, as the number of cells visited by the
+            worm is generally much smaller than the size of the arena.
+
             Attributes:
             ----------------------------
             arena_size: list
@@ -202,6 +204,14 @@ class Duration(Feature):
             isnan_mask: bool
               [49, n_frames]
 
+            Returns:
+            ----------------------------
+            list
+              [4] of (indices, counts), the cells of each arena that were
+              visited, as indices into the arena flattened in column-major
+              order (as in Matlab), sorted, and the number of frames in
+              which each cell was visited
+
 
             """
 
@@ -209,10 +219,13 @@ class Duration(Feature):
             # assignment to the matrix based on their values being treated as
             # indices
 
-            # Filter out frames which have no valid values
-            #----------------------------------------------------------
-            frames_run = np.flatnonzero(np.any(~isnan_mask, axis=0))
-            n_frames_run = len(frames_run)
+            n_frames = isnan_mask.shape[1]
+            arena_height = arena_size[0]
+
+            # The index of each point in the arena, after flipping the
+            # y axis to maintain consistency with Matlab
+            point_indices = sxs.astype(np.int64) * arena_height + \
+                (arena_height - 1 - sys)
 
             # 1 area for each set of skeleton indices
             #-----------------------------------------
@@ -222,21 +235,25 @@ class Duration(Feature):
             # Loop over the different regions of the body
             #------------------------------------------------
             for iPoint in range(n_points):
-
-                temp_arena = np.zeros(arena_size)
                 s_indices = s_points[iPoint]
-
-                # For each frame, add +1 to the arena each time a chunk of the skeleton
-                # is located in that part
+                cur_slice = slice(s_indices[0], s_indices[1])
+                is_valid = ~isnan_mask[cur_slice, :]
+                cur_indices = point_indices[cur_slice, :][is_valid]
+                cur_frames = np.nonzero(is_valid)[1]
+
+                # For each frame, add +1 to the arena for each part of the
+                # arena in which a chunk of the skeleton is located. Several
+                # chunks in the same part only count once.
                 #--------------------------------------------------------------
-                for iFrame in range(n_frames_run):
-                    cur_frame = frames_run[iFrame]
-                    cur_x = sxs[s_indices[0]:s_indices[1], cur_frame]
-                    cur_y = sys[s_indices[0]:s_indices[1], cur_frame]
-                    temp_arena[cur_y, cur_x] += 1
+                frame_cells = np.unique(cur_indices * n_frames + cur_frames)
 
-                arenas[iPoint] = temp_arena[::-1, :]  # FLip axis to maintain
-                # consistency with Matlab
+                # The cells are sorted, so each count is the length of a run
+                cells = frame_cells // n_frames
+                is_new_cell = np.ones(cells.size, dtype=bool)
+                is_new_cell[1:] = cells[1:] != cells[:-1]
+                new_cell_I = np.flatnonzero(is_new_cell)
+                arenas[iPoint] = (cells[new_cell_I],
+                                  np.diff(np.append(new_cell_I, cells.size)))
 
             return arenas
         #----------------------------------------------------------------------
@@ -248,11 +265,8 @@ class Duration(Feature):
             s_points,
             isnan_mask)
 
-        # For looking at the data
-        #------------------------------------
-        # utils.imagesc(temp_arenas[0])
-
-        temp_duration = [DurationElement(x, fps) for x in temp_arenas]
+        temp_duration = [DurationElement.from_counts(indices, counts, fps)
+                         for indices, counts in temp_arenas]
 
         self.arena = ar
         self.worm = temp_duration[0]
@@ -336,6 +350,25 @@ class DurationElement(object):
             other.times,
             'Duration.times')
 
+    @classmethod
+    def from_counts(cls, indices, counts, fps):
+        """
+        Parameters
+        ----------
+        indices : numpy.array
+          The sorted indices of the visited cells of the arena, flattened in
+          column-major order
+        counts : numpy.array
+          The number of frames in which each cell was visited
+        fps : float
+
+        """
+        self = cls.__new__(cls)
+        self.indices = indices
+        self.times = counts / fps
+
+        return self
+
     @classmethod
     def from_disk(cls, saved_duration_elem):
 
@@ -593,7 +626,8 @@ class Curvature(Feature):
         # it.
         speed, ignored_variable, motion_direction = \
             velocity_module.compute_speed(fps, x[BODY_I, :], y[BODY_I, :],
-                                          avg_body_angles_d, BODY_DIFF, ventral_mode)
+                                          avg_body_angles_d, BODY_DIFF, ventral_mode,
+                                          wf.speed_indices_cache)
 
         frame_scale = velocity_module.get_frames_per_sample(fps, BODY_DIFF)
         half_frame_scale = int((frame_scale - 1) / 2)
@@ -14,11 +14,10 @@ import os
 import inspect
 import h5py
 
-import cv2
-
 from . import generic_features
 from .generic_features import Feature
 from .. import config, utils
+from ..prefeatures.pre_features_helpers import WormParserHelpers
 from . import events
 
 
@@ -231,36 +230,102 @@ def get_eccentricity_and_orientation(features_ref):
 
     features_ref.timer.tic()
 
-    contour = features_ref.nw.contour_without_redundant_points
+    eccentricity, orientation = _get_eccentricity_and_orientation(
+        features_ref.nw.contour_without_redundant_points)
 
-    # OpenCV does not like float64, this actually make sense for image
-    # data where we do not require a large precition in the decimal part.
-    # This could save quite a lot of space
-    contour = contour.astype(np.float32)
-    tot = contour.shape[-1]
+    features_ref.timer.toc('posture.eccentricity_and_orientation')
 
-    eccentricity = np.full(tot, np.nan)
-    orientation = np.full(tot, np.nan)
-    for ii in range(tot):
-        worm_cnt = contour[:, :, ii]
-        if ~np.any(np.isnan(worm_cnt)):
-            moments = cv2.moments(worm_cnt)
+    return (eccentricity, orientation)
 
-            a1 = (moments['mu20'] + moments['mu02']) / 2
-            a2 = np.sqrt(4 * moments['mu11']**2 +
-                         (moments['mu20'] - moments['mu02'])**2) / 2
 
-            minor_axis = a1 - a2
-            major_axis = a1 + a2
+def get_contour_central_moments(contour):
+    """
+    The second order central moments of the polygons of a contour, for
+    all frames at once.
 
-            eccentricity[ii] = np.sqrt(1 - minor_axis / major_axis)
-            orientation[ii] = \
-                np.arctan2(2 * moments['mu11'],
-                           (moments['mu20'] - moments['mu02'])) / 2
-            # Convert from radians to degrees
-            orientation[ii] *= 180 / np.pi
+    These are the moments of the area enclosed by each polygon (not of
+    its vertices), as computed by OpenCV's moments(), i.e. the sums over
+    the edges of the polygon from Green's theorem.
 
-    features_ref.timer.toc('posture.eccentricity_and_orientation')
+    Parameters
+    ----------
+    contour : numpy array, shape (n_points, 2, n_frames)
+        The polygon of each frame. The last point connects to the first.
+
+    Returns
+    -------
+    (mu20, mu02, mu11) : numpy arrays, each of shape (n_frames,)
+        The moments are NaN for frames with any NaN points. As with
+        OpenCV they are 0 for polygons without area, and positive
+        regardless of the direction in which the polygon is traversed.
+
+    """
+    # Moving the origin to the mean of the points does not change the
+    # central moments, but keeps the sums of products small
+    x = contour[:, 0, :] - np.mean(contour[:, 0, :], axis=0)
+    y = contour[:, 1, :] - np.mean(contour[:, 1, :], axis=0)
+
+    # The edges go from point i to point i + 1
+    x_next = np.roll(x, -1, axis=0)
+    y_next = np.roll(y, -1, axis=0)
+
+    cross = x * y_next - x_next * y
+
+    a00 = np.sum(cross, axis=0)
+    a10 = np.sum(cross * (x + x_next), axis=0)
+    a01 = np.sum(cross * (y + y_next), axis=0)
+    a20 = np.sum(cross * (x * (x + x_next) + x_next**2), axis=0)
+    a02 = np.sum(cross * (y * (y + y_next) + y_next**2), axis=0)
+    a11 = np.sum(cross * (x * (2 * y + y_next) + x_next * (y + 2 * y_next)),
+                 axis=0)
+
+    # Polygons traversed clockwise have negative sums, hence the sign.
+    # The constant factors are from m00 = a00 / 2, m10 = a10 / 6,
+    # m20 = a20 / 12 and m11 = a11 / 24
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_center = a10 / (3 * a00)
+        y_center = a01 / (3 * a00)
+        sign = np.sign(a00)
+
+        mu20 = sign * (a20 / 12 - a10 * x_center / 6)
+        mu02 = sign * (a02 / 12 - a01 * y_center / 6)
+        mu11 = sign * (a11 / 24 - a10 * y_center / 6)
+
+        # As in OpenCV, which returns all moments as 0 for these
+        no_area_mask = np.abs(a00 / 2) <= np.finfo(np.float32).eps
+
+    mu20[no_area_mask] = 0
+    mu02[no_area_mask] = 0
+    mu11[no_area_mask] = 0
+
+    return mu20, mu02, mu11
+
+
+def _get_eccentricity_and_orientation(contour):
+    """
+    The eccentricity and orientation (in degrees) of the ellipse with the
+    same second order moments as the area enclosed by the contour, for
+    each frame.
+
+    Parameters
+    ----------
+    contour : numpy array, shape (n_points, 2, n_frames)
+
+    """
+    mu20, mu02, mu11 = get_contour_central_moments(contour)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a1 = (mu20 + mu02) / 2
+        a2 = np.sqrt(4 * mu11**2 + (mu20 - mu02)**2) / 2
+
+        minor_axis = a1 - a2
+        major_axis = a1 + a2
+
+        eccentricity = np.sqrt(1 - minor_axis / major_axis)
+
+    orientation = np.arctan2(2 * mu11, (mu20 - mu02)) / 2
+    # Convert from radians to degrees
+    orientation *= 180 / np.pi
 
     return (eccentricity, orientation)
 
@@ -500,6 +565,79 @@ Old Vs New Code:
 """
 
 
+def get_kink_counts(smoothed_bend_angles, length_threshold):
+    """
+    Count the kinks of all frames at once.
+
+    A kink is a stretch of the (smoothed) bend angles with the same sign
+    that is at least length_threshold long. NaN values are only allowed at
+    the ends of the worm, and count towards the length of the first and
+    last stretches.
+
+    Parameters
+    ----------
+    smoothed_bend_angles : numpy array, shape (n_angles, n_frames)
+        None of the values may be exactly 0.
+    length_threshold : int
+
+    Returns
+    -------
+    numpy array, shape (n_frames,)
+        The number of kinks, 0 for frames without any values.
+
+    """
+    n_angles, n_frames = smoothed_bend_angles.shape
+
+    # Work with frames as rows, so that the stretches found below are
+    # ordered by frame and then by angle
+    angles = smoothed_bend_angles.T
+    is_valid = ~np.isnan(angles)
+    with np.errstate(invalid='ignore'):
+        data_sign = np.sign(angles)
+
+    # NaN values are sign changes, so each stretch starts and ends on a
+    # sign change, on a NaN value, or at the end of the worm
+    is_sign_change = data_sign[:, 1:] != data_sign[:, :-1]
+    is_start = is_valid.copy()
+    is_start[:, 1:] &= is_sign_change
+    is_end = is_valid.copy()
+    is_end[:, :-1] &= is_sign_change
+
+    frame_I, start_I = is_start.nonzero()
+    end_I = is_end.nonzero()[1]
+
+    # The old code had a provision for having NaN values in the middle
+    # of the worm. I have not translated that feature to the newer code. I
+    # don't think it will ever happen though for a valid frame, only on the
+    # edges should you have NaN values.
+    first_I = np.full(n_frames, n_angles, dtype=int)
+    last_I = np.full(n_frames, -1, dtype=int)
+    np.minimum.at(first_I, frame_I, start_I)
+    np.maximum.at(last_I, frame_I, end_I)
+    has_values = last_I >= 0
+    if np.any(np.sum(is_valid, axis=1)[has_values] !=
+              (last_I - first_I + 1)[has_values]):
+        raise Exception("Unhandled code case")
+
+    # NOTE: The old code computed the length of each stretch as
+    # end - start + 1, where the end of the last stretch of the worm is
+    # n_angles rather than n_angles - 1, so that stretch is 1 longer.
+    lengths = end_I - start_I + 1 + (end_I == n_angles - 1)
+
+    # Adjust lengths for first and last:
+    # Basically we allow NaN values to count towards the length for the
+    # first and last stretches
+    is_first = start_I == first_I[frame_I]
+    is_last = end_I == last_I[frame_I]
+    mask = is_first & (start_I != 0)  # Due to leading NaNs
+    lengths[mask] = end_I[mask] + 1 + (end_I[mask] == n_angles - 1)
+    mask = is_last & (end_I != n_angles - 1)  # Due to trailing NaNs
+    lengths[mask] = n_angles - start_I[mask]
+
+    return np.bincount(frame_I, weights=lengths >= length_threshold,
+                       minlength=n_frames)
+
+
 def get_worm_kinks(features_ref):
     """
     Parameters
@@ -536,84 +674,73 @@ def get_worm_kinks(features_ref):
     gauss_filter = utils.gausswin(half_length_thr * 2 + 1) / half_length_thr
 
     # Compute the kinks for the worms.
-    n_frames = bend_angles.shape[1]
-    n_kinks_all = np.zeros(n_frames, dtype=float)
-    n_kinks_all[:] = np.NaN
-
-    #(np.any(np.logical_or(mask_pos,mask_neg),axis=0)).nonzero()[0]
-
-    nan_mask = np.isnan(bend_angles)
-
-    for iFrame in (~np.all(nan_mask, axis=0)).nonzero()[0]:
-        smoothed_bend_angles = filters.convolve1d(
-            bend_angles[:, iFrame], gauss_filter, cval=0, mode='constant')
+    smoothed_bend_angles = filters.convolve1d(
+        bend_angles, gauss_filter, axis=0, cval=0, mode='constant')
 
-        # This code is nearly identical in getForaging
-        #-------------------------------------------------------
-        n_frames = smoothed_bend_angles.shape[0]
+    if np.any(np.equal(smoothed_bend_angles, 0)):
+        # I don't expect that we'll ever actually reach 0
+        # The code for zero was a bit weird, it keeps counting if no sign
+        # change i.e. + + + 0 + + + => all +
+        #
+        # but it counts for both if sign change
+        # + + 0 - - - => 3 +s and 4 -s
 
-        with np.errstate(invalid='ignore'):
-            dataSign = np.sign(smoothed_bend_angles)
+        # I had to change this to a warning and returning NaNs
+        # to get my corner case unit tests working, i.e. the case
+        # of a perfectly straight worm.  - @MichaelCurrie
+        n_kinks_all = np.full(bend_angles.shape[1], np.NaN)
+        #raise Warning("Unhandled code case")
+        return n_kinks_all
 
-        if np.any(np.equal(dataSign, 0)):
-            # I don't expect that we'll ever actually reach 0
-            # The code for zero was a bit weird, it keeps counting if no sign
-            # change i.e. + + + 0 + + + => all +
-            #
-            # but it counts for both if sign change
-            # + + 0 - - - => 3 +s and 4 -s
+    n_kinks_all = get_kink_counts(smoothed_bend_angles, length_threshold)
+    n_kinks_all[np.all(np.isnan(bend_angles), axis=0)] = np.NaN
 
-            # I had to change this to a warning and returning NaNs
-            # to get my corner case unit tests working, i.e. the case
-            # of a perfectly straight worm.  - @MichaelCurrie
-            n_kinks_all[:] = np.NaN
-            #raise Warning("Unhandled code case")
-            return n_kinks_all
+    timer.toc('posture.kinks')
 
-        sign_change_I = (
-            np.not_equal(dataSign[1:], dataSign[0:-1])).nonzero()[0]
+    return n_kinks_all
 
-        end_I = np.concatenate(
-            (sign_change_I,
-             n_frames * np.ones(1, dtype=np.result_type(sign_change_I))))
 
-        wtf1 = np.zeros(1, dtype=np.result_type(sign_change_I))
-        wtf2 = sign_change_I + 1
-        start_I = np.concatenate((wtf1, wtf2))  # +2? due to inclusion rules???
+def get_coil_starts_and_ends(frame_code, coil_frame_threshold):
+    """
+    Find the coils from the frame codes of the MRC processor.
 
-        # All NaN values are considered sign changes, remove these ...
-        keep_mask = np.logical_not(np.isnan(smoothed_bend_angles[start_I]))
+    Parameters
+    ----------
+    frame_code : numpy.array 1-d
+    coil_frame_threshold : int
+        The minimum number of frames of a coil
 
-        start_I = start_I[keep_mask]
-        end_I = end_I[keep_mask]
+    Returns
+    -------
+    (starts, ends) : numpy.array 1-d
+        The first and last frame (inclusive) of each coil
 
-        # The old code had a provision for having NaN values in the middle
-        # of the worm. I have not translated that feature to the newer code. I
-        # don't think it will ever happen though for a valid frame, only on the
-        # edges should you have NaN values.
-        if start_I.size != 0 and \
-           np.any(np.isnan(smoothed_bend_angles[start_I[0]:end_I[-1]])):
-            raise Exception("Unhandled code case")
+    """
+    # These are values that are specific to the MRC processor
+    COIL_START_CODES = [105, 106]
+    # Code that indicates a frame was successfully segmented
+    FRAME_SEGMENTED = 1
 
-        #-------------------------------------------------------
-        # End of identical code ...
+    # Algorithm: Whenever a new start is found, find the
+    # first segmented frame; that's the end.
 
-        lengths = end_I - start_I + 1
+    # Add on a frame to allow closing a coil at the end ...
+    frame_code = np.concatenate((frame_code, [FRAME_SEGMENTED]))
+    coil_start_mask = np.in1d(frame_code, COIL_START_CODES)
 
-        # Adjust lengths for first and last:
-        # Basically we allow NaN values to count towards the length for the
-        # first and last stretches
-        if lengths.size != 0:
-            if start_I[0] != 0:  # Due to leading NaNs
-                lengths[0] = end_I[0] + 1
-            if end_I[-1] != n_frames:  # Due to trailing NaNs
-                lengths[-1] = n_frames - start_I[-1]
+    # NOTE: These are not guaranteed ends, just possible ends ...
+    end_coil_mask = frame_code == FRAME_SEGMENTED
 
-        n_kinks_all[iFrame] = np.sum(lengths >= length_threshold)
+    # Only the possible starts and ends matter. A coil starts at the first
+    # of a run of starts, and ends before the end that follows the run
+    marker_I = np.flatnonzero(coil_start_mask | end_coil_mask)
+    run_starts, run_ends, _ = utils.find_runs(coil_start_mask[marker_I])
+    starts = marker_I[run_starts]
+    ends = marker_I[run_ends + 1] - 1
 
-    timer.toc('posture.kinks')
+    is_long_coil = ends - starts + 1 >= coil_frame_threshold
 
-    return n_kinks_all
+    return starts[is_long_coil], ends[is_long_coil]
 
 
 def get_worm_coils(features_ref, midbody_distance):
@@ -643,47 +770,8 @@ def get_worm_coils(features_ref, midbody_distance):
 
     COIL_FRAME_THRESHOLD = posture_options.coiling_frame_threshold(fps)
 
-    # These are values that are specific to the MRC processor
-    COIL_START_CODES = [105, 106]
-    # Code that indicates a frame was successfully segmented
-    FRAME_SEGMENTED = 1
-
-    # Algorithm: Whenever a new start is found, find the
-    # first segmented frame; that's the end.
-
-    # Add on a frame to allow closing a coil at the end ...
-    coil_start_mask = (frame_code == COIL_START_CODES[0]) | (
-        frame_code == COIL_START_CODES[1])
-    np_false = np.zeros((1,), dtype=bool)
-    coil_start_mask = np.concatenate((coil_start_mask, np_false))
-
-    # NOTE: These are not guaranteed ends, just possible ends ...
-    end_coil_mask = frame_code == FRAME_SEGMENTED
-    np_true = ~np_false
-    end_coil_mask = np.concatenate((end_coil_mask, np_true))
-
-    in_coil = False
-    coil_frame_start = -1
-    n_coils = 0
-    n_frames_plus1 = len(frame_code) + 1
-
-    starts = []
-    ends = []
-
-    for iFrame in range(n_frames_plus1):
-        if in_coil:
-            if end_coil_mask[iFrame]:
-                n_coil_frames = iFrame - coil_frame_start
-                if n_coil_frames >= COIL_FRAME_THRESHOLD:
-                    n_coils += 1
-
-                    starts.append(coil_frame_start)
-                    ends.append(iFrame - 1)
-
-                in_coil = False
-        elif coil_start_mask[iFrame]:
-            in_coil = True
-            coil_frame_start = iFrame
+    starts, ends = get_coil_starts_and_ends(frame_code,
+                                            COIL_FRAME_THRESHOLD)
 
     if options.mimic_old_behaviour:
         if (len(starts) > 0) and (ends[-1] == len(frame_code) - 1):
@@ -805,55 +893,13 @@ def get_eigenworms(features_ref):
     N_EIGENWORMS_USE = posture_options.n_eigenworms_use
 
     timer = features_ref.timer
-    timer.toc
+    timer.tic()
 
     # eigen_worms: [7,48]
-    eigen_worms = load_eigen_worms()
-
-    #???? How does this differ from nw.angles???
-    angles = np.arctan2(np.diff(sy, n=1, axis=0), np.diff(sx, n=1, axis=0))
-
-    n_frames = sx.shape[1]
-
-    # need to deal with cases where angle changes discontinuously from -pi
-    # to pi and pi to -pi.  In these cases, subtract 2pi and add 2pi
-    # respectively to all remaining points.  This effectively extends the
-    # range outside the -pi to pi range.  Everything is re-centred later
-    # when we subtract off the mean.
-    false_row = np.zeros((1, n_frames), dtype=bool)
-
-    # NOTE: By adding the row of falses, we shift the trues
-    # to the next value, which allows indices to match. Otherwise after every
-    # find statement we would need to add 1, I think this is a bit faster ...
-
-    with np.errstate(invalid='ignore'):
-        mask_pos = np.concatenate(
-            (false_row, np.diff(angles, n=1, axis=0) > np.pi), axis=0)
-        mask_neg = np.concatenate(
-            (false_row, np.diff(angles, n=1, axis=0) < -np.pi), axis=0)
-
-    # Only fix the frames we need to, in which there is a jump in going
-    # from one segment to the next ...
-    fix_frames_I = (
-        np.any(np.logical_or(mask_pos, mask_neg), axis=0)).nonzero()[0]
-
-    for cur_frame in fix_frames_I:
-
-        positive_jump_I = (mask_pos[:, cur_frame]).nonzero()[0]
-        negative_jump_I = (mask_neg[:, cur_frame]).nonzero()[0]
-
-        # subtract 2pi from remainging data after positive jumps
-        # Note that the jumps impact all subsequent frames
-        for cur_pos_jump in positive_jump_I:
-            angles[cur_pos_jump:, cur_frame] -= 2 * np.pi
+    eigen_worms = load_eigen_worms(posture_options.eigen_worm_file_path)
 
-        # add 2pi to remaining data after negative jumps
-        for cur_neg_jump in negative_jump_I:
-            angles[cur_neg_jump:, cur_frame] += 2 * np.pi
-
-    angles = angles - np.mean(angles, axis=0)
-
-    eigen_projections = np.dot(eigen_worms[0:N_EIGENWORMS_USE, :], angles)
+    eigen_projections = get_eigen_projections(
+        sx, sy, eigen_worms[0:N_EIGENWORMS_USE, :])
     timer.toc('posture.eigenworms')
 
     return eigen_projections
@@ -880,8 +926,9 @@ class EccentricityAndOrientationProcessor(Feature):
 
         http://en.wikipedia.org/wiki/Image_moment
 
-        Calculated by opencv moments():
+        Calculated as by opencv moments():
         http://docs.opencv.org/modules/imgproc/doc/structural_analysis_and_shape_descriptors.html
+        but for all frames at once, see get_contour_central_moments()
 
         """
 
@@ -889,34 +936,8 @@ class EccentricityAndOrientationProcessor(Feature):
 
         wf.timer.tic()
 
-        contour = wf.nw.contour_without_redundant_points
-
-        # OpenCV does not like float64, this actually make sense for image
-        # data where we do not require a large precition in the decimal part.
-        # This could save quite a lot of space
-        contour = contour.astype(np.float32)
-        tot = contour.shape[-1]
-
-        eccentricity = np.full(tot, np.nan)
-        orientation = np.full(tot, np.nan)
-        for ii in range(tot):
-            worm_cnt = contour[:, :, ii]
-            if ~np.any(np.isnan(worm_cnt)):
-                moments = cv2.moments(worm_cnt)
-
-                a1 = (moments['mu20'] + moments['mu02']) / 2
-                a2 = np.sqrt(4 * moments['mu11']**2 +
-                             (moments['mu20'] - moments['mu02'])**2) / 2
-
-                minor_axis = a1 - a2
-                major_axis = a1 + a2
-
-                eccentricity[ii] = np.sqrt(1 - minor_axis / major_axis)
-                orientation[ii] = \
-                    np.arctan2(2 * moments['mu11'],
-                               (moments['mu20'] - moments['mu02'])) / 2
-                # Convert from radians to degrees
-                orientation[ii] *= 180 / np.pi
+        eccentricity, orientation = _get_eccentricity_and_orientation(
+            wf.nw.contour_without_redundant_points)
 
         wf.timer.toc(self.name)
 
@@ -950,6 +971,66 @@ class Eccentricity(Feature):
         return cls(wf, feature_name)
 
 
+def _resample_rotated_skeletons(wwx, wwy, ds):
+    """
+    Resample rotated skeletons onto evenly spaced x values, for all frames
+    at once.
+
+    For each frame, the spacing is ds and the x values go from one end of
+    the skeleton to the other, as utils.colon(x1, ds, x2) does. The
+    resampled y values are returned in the order used for the FFT: from
+    the largest x to the smallest when the skeleton goes from small to
+    large x, and from the smallest to the largest otherwise.
+
+    Parameters
+    ----------
+    wwx, wwy : numpy arrays, shape (n_points, n_frames)
+        The rotated skeletons. The x values must be strictly monotonic in
+        each frame (i.e. not a bad worm orientation)
+    ds : numpy array, shape (n_frames,)
+
+    Returns
+    -------
+    numpy array, shape (n_frames, max_n_samples)
+        One row per frame, padded with zeros after the last sample of
+        the frame (which doesn't change its FFT).
+
+    """
+    n_points, n_frames = wwx.shape
+    if n_frames == 0:
+        return np.zeros((0, 1))
+
+    x1 = wwx[0, :]
+    x2 = wwx[-1, :]
+    is_decreasing = x1 > x2
+
+    # As in utils.colon()
+    x_range = np.abs(x2 - x1)
+    n_steps = ((x_range + 2 * np.spacing(x_range)) // ds).astype(int)
+
+    # Make x increasing in every frame, as np.interp requires
+    xp = np.where(is_decreasing, wwx[::-1, :], wwx).T
+    yp = np.where(is_decreasing, wwy[::-1, :], wwy).T
+
+    # The number of steps from the smallest x to each sample
+    sample_I = np.arange(np.max(n_steps) + 1)[None, :]
+    is_sample = sample_I <= n_steps[:, None]
+    step_I = np.where(is_decreasing[:, None], sample_I,
+                      n_steps[:, None] - sample_I).astype(float)
+    step_I[~is_sample] = np.NaN
+
+    # Distances from the smallest x of each frame
+    WPH = WormParserHelpers
+    iwwy = WPH.interp_padded_frames(step_I * ds[:, None],
+                                    xp - xp[:, 0:1],
+                                    np.full(n_frames, n_points - 1,
+                                            dtype=int),
+                                    [yp])[0]
+    iwwy[~is_sample] = 0
+
+    return iwwy
+
+
 class AmplitudeAndWavelengthProcessor(Feature):
 
     """
@@ -1075,86 +1156,75 @@ class AmplitudeAndWavelengthProcessor(Feature):
         frames_to_calculate = \
             (np.logical_not(bad_worm_orientation)).nonzero()[0]
 
-        for cur_frame in frames_to_calculate:
-
-            # Create an evenly sampled x-axis, note that ds varies
-            x1 = wwx[0, cur_frame]
-            x2 = wwx[-1, cur_frame]
-            if x1 > x2:
-                iwwx = utils.colon(x1, -ds[cur_frame], x2)
-                iwwy = np.interp(iwwx,
-                                 wwx[::-1, cur_frame],
-                                 wwy[::-1, cur_frame])
-                iwwy = iwwy[::-1]
-            else:
-                iwwx = utils.colon(x1, ds[cur_frame], x2)
-                iwwy = np.interp(iwwx,
-                                 wwx[:, cur_frame],
-                                 wwy[:, cur_frame])
-                iwwy = iwwy[::-1]
-
-            temp = np.fft.fft(iwwy, N_POINTS_FFT)
-
-            if options.mimic_old_behaviour:
-                iY = temp[0:HALF_N_FFT]
-                iY = iY * np.conjugate(iY) / N_POINTS_FFT
-            else:
-                iY = np.abs(temp[0:HALF_N_FFT])
+        # All frames are processed at once, each row is a frame
+        #-----------------------------------------------------------------
+        iwwy = _resample_rotated_skeletons(wwx[:, frames_to_calculate],
+                                           wwy[:, frames_to_calculate],
+                                           ds[frames_to_calculate])
 
-            # Find peaks that are greater than the cutoff
-            peaks, indx = utils.separated_peaks(iY,
-                                                MIN_DIST_PEAKS,
-                                                True,
-                                                (WAVELENGTH_PCT_MAX_CUTOFF *
-                                                 np.amax(iY)))
+        # Only the first half of the FFT is used, which is what rfft
+        # returns (plus the Nyquist frequency). Zero padded to N_POINTS_FFT.
+        temp = np.fft.rfft(iwwy, N_POINTS_FFT, axis=1)[:, 0:HALF_N_FFT]
 
-            # This is what the supplemental says, not what was done in
-            # the previous code. I'm not sure what was done for the actual
-            # paper, but I would guess they used power.
-            #
-            # This gets used when determining the secondary wavelength, as
-            # it must be greater than half the maximum to be considered a
-            # secondary wavelength.
+        if options.mimic_old_behaviour:
+            # i.e. iY * np.conjugate(iY) / N_POINTS_FFT, but as reals
+            iY = (temp.real**2 + temp.imag**2) / N_POINTS_FFT
+        else:
+            iY = np.abs(temp)
 
-            # NOTE: True Amplitude = 2*abs(fft)/
-            #                    (length_real_data i.e. 48 or 49, not 512)
-            #
-            # i.e. for a sinusoid of a given amplitude, the above formula
-            # would give you the amplitude of the sinusoid
+        # Find peaks that are greater than the cutoff. Only the two
+        # largest are used, for the primary and secondary wavelengths.
+        #
+        # This is what the supplemental says, not what was done in
+        # the previous code. I'm not sure what was done for the actual
+        # paper, but I would guess they used power.
+        #
+        # This gets used when determining the secondary wavelength, as
+        # it must be greater than half the maximum to be considered a
+        # secondary wavelength.
 
-            # We sort the peaks so that the largest is at the first index
-            # and will be primary, this was not done in the previous
-            # version of the code
-            I = np.argsort(-1 * peaks)
-            indx = indx[I]
+        # NOTE: True Amplitude = 2*abs(fft)/
+        #                    (length_real_data i.e. 48 or 49, not 512)
+        #
+        # i.e. for a sinusoid of a given amplitude, the above formula
+        # would give you the amplitude of the sinusoid
+
+        # The peaks are sorted so that the largest is first and will be
+        # primary, this was not done in the previous version of the code
+        if iY.size > 0:
+            indx = utils.largest_separated_peaks(
+                iY, MIN_DIST_PEAKS,
+                WAVELENGTH_PCT_MAX_CUTOFF * np.amax(iY, axis=1), 2)
+        else:
+            indx = np.zeros((0, 2), dtype=int)
 
-            frequency_values = (indx - 1) / N_POINTS_FFT * \
-                spatial_sampling_frequency[cur_frame]
+        frequency_values = (indx - 1) / N_POINTS_FFT * \
+            spatial_sampling_frequency[frames_to_calculate, None]
 
+        with np.errstate(divide='ignore'):
             all_wavelengths = 1 / frequency_values
 
-            p_temp = all_wavelengths[0]
-
-            if indx.size > 1:
-                s_temp = all_wavelengths[1]
-            else:
-                s_temp = np.NaN
+        # Frames with fewer than 2 peaks have no secondary wavelength
+        all_wavelengths[indx == -1] = np.NaN
 
-            worm_wavelength_max = (WAVELENGTH_PCT_CUTOFF *
-                                   worm_lengths[cur_frame])
+        p_temp = all_wavelengths[:, 0]
+        s_temp = all_wavelengths[:, 1]
 
-            # Cap wavelengths ...
-            if p_temp > worm_wavelength_max:
-                p_temp = worm_wavelength_max
+        worm_wavelength_max = (WAVELENGTH_PCT_CUTOFF *
+                               worm_lengths[frames_to_calculate])
 
-            # ??? Do we really want to keep this as well if p_temp == worm_2x?
-            # i.e., should the secondary wavelength be valid if the primary is
-            # also limited in this way ?????
-            if s_temp > worm_wavelength_max:
-                s_temp = worm_wavelength_max
+        # Cap wavelengths ...
+        # ??? Do we really want to keep this as well if p_temp == worm_2x?
+        # i.e., should the secondary wavelength be valid if the primary is
+        # also limited in this way ?????
+        with np.errstate(invalid='ignore'):
+            p_temp = np.where(p_temp > worm_wavelength_max,
+                              worm_wavelength_max, p_temp)
+            s_temp = np.where(s_temp > worm_wavelength_max,
+                              worm_wavelength_max, s_temp)
 
-            primary_wavelength[cur_frame] = p_temp
-            secondary_wavelength[cur_frame] = s_temp
+        primary_wavelength[frames_to_calculate] = p_temp
+        secondary_wavelength[frames_to_calculate] = s_temp
 
         if options.mimic_old_behaviour:
             # In the old code, the first peak (i.e. larger wavelength,
@@ -1309,47 +1379,8 @@ class Coils(Feature):
 
         COIL_FRAME_THRESHOLD = posture_options.coiling_frame_threshold(fps)
 
-        # These are values that are specific to the MRC processor
-        COIL_START_CODES = [105, 106]
-        # Code that indicates a frame was successfully segmented
-        FRAME_SEGMENTED = 1
-
-        # Algorithm: Whenever a new start is found, find the
-        # first segmented frame; that's the end.
-
-        # Add on a frame to allow closing a coil at the end ...
-        coil_start_mask = (frame_code == COIL_START_CODES[0]) | (
-            frame_code == COIL_START_CODES[1])
-        np_false = np.zeros((1,), dtype=bool)
-        coil_start_mask = np.concatenate((coil_start_mask, np_false))
-
-        # NOTE: These are not guaranteed ends, just possible ends ...
-        end_coil_mask = frame_code == FRAME_SEGMENTED
-        np_true = ~np_false
-        end_coil_mask = np.concatenate((end_coil_mask, np_true))
-
-        in_coil = False
-        coil_frame_start = -1
-        n_coils = 0
-        n_frames_plus1 = len(frame_code) + 1
-
-        starts = []
-        ends = []
-
-        for iFrame in range(n_frames_plus1):
-            if in_coil:
-                if end_coil_mask[iFrame]:
-                    n_coil_frames = iFrame - coil_frame_start
-                    if n_coil_frames >= COIL_FRAME_THRESHOLD:
-                        n_coils += 1
-
-                        starts.append(coil_frame_start)
-                        ends.append(iFrame - 1)
-
-                    in_coil = False
-            elif coil_start_mask[iFrame]:
-                in_coil = True
-                coil_frame_start = iFrame
+        starts, ends = get_coil_starts_and_ends(frame_code,
+                                                COIL_FRAME_THRESHOLD)
 
         if options.mimic_old_behaviour:
             if (len(starts) > 0) and (ends[-1] == len(frame_code) - 1):
@@ -1418,113 +1449,121 @@ class Kinks(Feature):
             half_length_thr * 2 + 1) / half_length_thr
 
         # Compute the kinks for the worms.
-        n_frames = bend_angles.shape[1]
-        n_kinks_all = np.zeros(n_frames, dtype=float)
-        n_kinks_all[:] = np.NaN
+        smoothed_bend_angles = filters.convolve1d(
+            bend_angles, gauss_filter, axis=0, cval=0, mode='constant')
 
-        #(np.any(np.logical_or(mask_pos,mask_neg),axis=0)).nonzero()[0]
+        if np.any(np.equal(smoothed_bend_angles, 0)):
+            # I don't expect that we'll ever actually reach 0
+            # The code for zero was a bit weird, it keeps counting if no sign
+            # change i.e. + + + 0 + + + => all +
+            #
+            # but it counts for both if sign change
+            # + + 0 - - - => 3 +s and 4 -s
+            raise Exception("Unhandled code case")
 
-        nan_mask = np.isnan(bend_angles)
+        n_kinks_all = get_kink_counts(smoothed_bend_angles, length_threshold)
+        n_kinks_all[np.all(np.isnan(bend_angles), axis=0)] = np.NaN
 
-        for iFrame in (~np.all(nan_mask, axis=0)).nonzero()[0]:
-            smoothed_bend_angles = filters.convolve1d(
-                bend_angles[:, iFrame], gauss_filter, cval=0, mode='constant')
+        timer.toc('posture.kinks')
 
-            # This code is nearly identical in getForaging
-            #-------------------------------------------------------
-            n_frames = smoothed_bend_angles.shape[0]
+        self.value = n_kinks_all
 
-            with np.errstate(invalid='ignore'):
-                dataSign = np.sign(smoothed_bend_angles)
+    @classmethod
+    def from_schafer_file(cls, wf, feature_name):
+        self = cls.__new__(cls)
+        self.name = feature_name
+        self.value = utils.get_nested_h5_field(wf.h, ['posture', 'kinks'])
+        return self
 
-            if np.any(np.equal(dataSign, 0)):
-                # I don't expect that we'll ever actually reach 0
-                # The code for zero was a bit weird, it keeps counting if no sign
-                # change i.e. + + + 0 + + + => all +
-                #
-                # but it counts for both if sign change
-                # + + 0 - - - => 3 +s and 4 -s
-                raise Exception("Unhandled code case")
 
-            sign_change_I = (
-                np.not_equal(dataSign[1:], dataSign[0:-1])).nonzero()[0]
+# The eigenworms loaded so far, by file path, size and modification time,
+# so that each file is only read once per process (unless it changes)
+_eigen_worms_cache = {}
 
-            end_I = np.concatenate(
-                (sign_change_I,
-                 n_frames * np.ones(1, dtype=np.result_type(sign_change_I))))
 
-            wtf1 = np.zeros(1, dtype=np.result_type(sign_change_I))
-            wtf2 = sign_change_I + 1
-            # +2? due to inclusion rules???
-            start_I = np.concatenate((wtf1, wtf2))
+def load_eigen_worms(eigen_worm_file_path=None):
+    """
+    Load the eigen_worms, which are stored in a Matlab data file
 
-            # All NaN values are considered sign changes, remove these ...
-            keep_mask = np.logical_not(np.isnan(smoothed_bend_angles[start_I]))
+    The eigenworms were computed by the Schafer lab based on N2 worms
 
-            start_I = start_I[keep_mask]
-            end_I = end_I[keep_mask]
+    Each file is only read once, the eigenworms are then shared by all
+    callers (and so are read-only).
 
-            # The old code had a provision for having NaN values in the middle
-            # of the worm. I have not translated that feature to the newer code. I
-            # don't think it will ever happen though for a valid frame, only on the
-            # edges should you have NaN values.
-            if start_I.size != 0 and \
-               np.any(np.isnan(smoothed_bend_angles[start_I[0]:end_I[-1]])):
-                raise Exception("Unhandled code case")
+    Parameters
+    ----------
+    eigen_worm_file_path : str (optional)
+        A file with an 'eigenWorms' dataset of shape [48 x n_eigenworms].
+        Defaults to the N2 eigenworms in config.EIGENWORM_FILE.
 
-            #-------------------------------------------------------
-            # End of identical code ...
+    Returns
+    ----------
+    eigen_worms: [7 x 48]
 
-            lengths = end_I - start_I + 1
+    From http://stackoverflow.com/questions/50499/
 
-            # Adjust lengths for first and last:
-            # Basically we allow NaN values to count towards the length for the
-            # first and last stretches
-            if lengths.size != 0:
-                if start_I[0] != 0:  # Due to leading NaNs
-                    lengths[0] = end_I[0] + 1
-                if end_I[-1] != n_frames:  # Due to trailing NaNs
-                    lengths[-1] = n_frames - start_I[-1]
+    """
+    if eigen_worm_file_path is None:
+        current_module_path = inspect.getfile(inspect.currentframe())
+        package_path = os.path.dirname(os.path.abspath(current_module_path))
 
-            n_kinks_all[iFrame] = np.sum(lengths >= length_threshold)
+        repo_path = os.path.split(package_path)[0]
+        eigen_worm_file_path = os.path.join(repo_path,
+                                            'features',
+                                            config.EIGENWORM_FILE)
 
-        timer.toc('posture.kinks')
+    eigen_worm_file_path = os.path.abspath(eigen_worm_file_path)
+    stat = os.stat(eigen_worm_file_path)
+    file_key = (eigen_worm_file_path, stat.st_size, stat.st_mtime)
 
-        self.value = n_kinks_all
+    if file_key not in _eigen_worms_cache:
+        with h5py.File(eigen_worm_file_path, 'r') as h:
+            eigen_worms = np.transpose(h['eigenWorms'].value)
+        eigen_worms.flags.writeable = False
+        _eigen_worms_cache[file_key] = eigen_worms
 
-    @classmethod
-    def from_schafer_file(cls, wf, feature_name):
-        self = cls.__new__(cls)
-        self.name = feature_name
-        self.value = utils.get_nested_h5_field(wf.h, ['posture', 'kinks'])
-        return self
+    return _eigen_worms_cache[file_key]
 
 
-def load_eigen_worms():
+def get_eigen_projections(sx, sy, eigen_worms):
     """
-    Load the eigen_worms, which are stored in a Matlab data file
+    Project the skeleton angles of all frames onto the eigenworms.
 
-    The eigenworms were computed by the Schafer lab based on N2 worms
+    Frames are independent, so the frames of many worms can be
+    concatenated and projected with a single call.
 
-    Returns
+    Parameters
     ----------
-    eigen_worms: [7 x 48]
+    sx, sy : numpy.array
+        [49 x n_frames]
+    eigen_worms : numpy.array
+        [n_eigenworms x 48], e.g. from load_eigen_worms()
 
-    From http://stackoverflow.com/questions/50499/
+    Returns
+    -------
+    eigen_projections: [n_eigenworms x n_frames]
 
     """
-    current_module_path = inspect.getfile(inspect.currentframe())
-    package_path = os.path.dirname(os.path.abspath(current_module_path))
+    #???? How does this differ from nw.angles???
+    angles = np.arctan2(np.diff(sy, n=1, axis=0), np.diff(sx, n=1, axis=0))
+
+    # need to deal with cases where angle changes discontinuously from -pi
+    # to pi and pi to -pi.  In these cases, subtract 2pi and add 2pi
+    # respectively to all remaining points.  This effectively extends the
+    # range outside the -pi to pi range.  Everything is re-centred later
+    # when we subtract off the mean.
+    #
+    # The number of jumps so far, positive minus negative, gives the
+    # multiple of 2pi to subtract from each angle.
+    with np.errstate(invalid='ignore'):
+        angle_diffs = np.diff(angles, n=1, axis=0)
+        jumps = (angle_diffs > np.pi).astype(int) - (angle_diffs < -np.pi)
 
-    repo_path = os.path.split(package_path)[0]
-    eigen_worm_file_path = os.path.join(repo_path,
-                                        'features',
-                                        config.EIGENWORM_FILE)
+    angles[1:, :] -= 2 * np.pi * np.cumsum(jumps, axis=0)
 
-    h = h5py.File(eigen_worm_file_path, 'r')
-    eigen_worms = h['eigenWorms'].value
+    angles = angles - np.mean(angles, axis=0)
 
-    return np.transpose(eigen_worms)
+    return np.dot(eigen_worms, angles)
 
 
 class EigenProjectionProcessor(Feature):
@@ -1552,56 +1591,13 @@ class EigenProjectionProcessor(Feature):
         N_EIGENWORMS_USE = posture_options.n_eigenworms_use
 
         timer = wf.timer
-        timer.toc
+        timer.tic()
 
         # eigen_worms: [7,48]
-        eigen_worms = load_eigen_worms()
-
-        #???? How does this differ from nw.angles???
-        angles = np.arctan2(np.diff(sy, n=1, axis=0), np.diff(sx, n=1, axis=0))
-
-        n_frames = sx.shape[1]
-
-        # need to deal with cases where angle changes discontinuously from -pi
-        # to pi and pi to -pi.  In these cases, subtract 2pi and add 2pi
-        # respectively to all remaining points.  This effectively extends the
-        # range outside the -pi to pi range.  Everything is re-centred later
-        # when we subtract off the mean.
-        false_row = np.zeros((1, n_frames), dtype=bool)
-
-        # NOTE: By adding the row of falses, we shift the trues
-        # to the next value, which allows indices to match. Otherwise after every
-        # find statement we would need to add 1, I think this is a bit faster
-        # ...
-
-        with np.errstate(invalid='ignore'):
-            mask_pos = np.concatenate(
-                (false_row, np.diff(angles, n=1, axis=0) > np.pi), axis=0)
-            mask_neg = np.concatenate(
-                (false_row, np.diff(angles, n=1, axis=0) < -np.pi), axis=0)
-
-        # Only fix the frames we need to, in which there is a jump in going
-        # from one segment to the next ...
-        fix_frames_I = (
-            np.any(np.logical_or(mask_pos, mask_neg), axis=0)).nonzero()[0]
-
-        for cur_frame in fix_frames_I:
-
-            positive_jump_I = (mask_pos[:, cur_frame]).nonzero()[0]
-            negative_jump_I = (mask_neg[:, cur_frame]).nonzero()[0]
-
-            # subtract 2pi from remainging data after positive jumps
-            # Note that the jumps impact all subsequent frames
-            for cur_pos_jump in positive_jump_I:
-                angles[cur_pos_jump:, cur_frame] -= 2 * np.pi
-
-            # add 2pi to remaining data after negative jumps
-            for cur_neg_jump in negative_jump_I:
-                angles[cur_neg_jump:, cur_frame] += 2 * np.pi
-
-        angles = angles - np.mean(angles, axis=0)
+        eigen_worms = load_eigen_worms(posture_options.eigen_worm_file_path)
 
-        eigen_projections = np.dot(eigen_worms[0:N_EIGENWORMS_USE, :], angles)
+        eigen_projections = get_eigen_projections(
+            sx, sy, eigen_worms[0:N_EIGENWORMS_USE, :])
         timer.toc('posture.eigenworms')
 
         self.value = eigen_projections
@@ -11,7 +11,9 @@ import numpy as np
 __ALL__ = ['get_angles',
            'get_partition_angles',
            'h__computeAngularSpeed',
+           'get_speed_indices',
            'compute_speed',
+           'compute_speeds',
            'get_frames_per_sample']
 
 
@@ -130,11 +132,11 @@ def get_partition_angles(nw, partition_key, data_key='skeleton',
     return get_angles(segment_x, segment_y, head_to_tail)
 
 
-def h__computeAngularSpeed(fps, segment_x, segment_y,
-                           left_I, right_I, ventral_mode):
+def h__computeAngularSpeed(fps, point_angle_d, left_I, right_I,
+                           ventral_mode):
     """
 
-    This function is called by compute_speeed().
+    This function is called by compute_speeds().
 
     TODO: These units are wrong ...
     TODO: This is actually angular velocity
@@ -142,10 +144,9 @@ def h__computeAngularSpeed(fps, segment_x, segment_y,
     Parameters
     ----------
     fps :
-    segment_x : numpy array, shape (p,n)
-        The x's of the partition being considered.
-    segment_y : numpy array, shape (p,n)
-        The y's of the partition being considered.
+    point_angle_d : numpy array, shape (k,n)
+        The direction of each of the k partitions being considered, for
+        each frame, as computed by get_angles().
     left_I : numpy array
         For each frame, an index (earlier in time) from which to compute
         the desired value. These values only exist for cases in which
@@ -161,18 +162,15 @@ def h__computeAngularSpeed(fps, segment_x, segment_y,
 
     Returns
     -------
-    a numpy array of shape n, in units of degrees per second
+    a numpy array of shape (k,len(left_I)), in units of degrees per second
 
     See Also
     --------
-    compute_speed
+    compute_speeds
     get_angles
 
     """
-    # Compute the body part direction for each frame
-    point_angle_d = get_angles(segment_x, segment_y, head_to_tail=False)
-
-    angular_speed = point_angle_d[right_I] - point_angle_d[left_I]
+    angular_speed = point_angle_d[:, right_I] - point_angle_d[:, left_I]
 
     # Correct any jumps that result during the subtraction process
     # i.e. 1 - 359 ~= -358
@@ -406,7 +404,41 @@ def h__getSpeedIndices(frames_per_sample, good_frames_mask):
     return keep_mask, left_I, right_I
 
 
-def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
+def get_speed_indices(frames_per_sample, good_frames_mask, cache=None):
+    """
+    h__getSpeedIndices, with the results kept in a cache.
+
+    The indices only depend on frames_per_sample and on good_frames_mask,
+    which is generally the same for all parts of the worm, so they can be
+    computed once and shared.
+
+    Parameters
+    ----------
+    frames_per_sample : int
+    good_frames_mask : numpy array of bools, shape (num_frames)
+    cache : dict (optional)
+        Indices that have already been computed. New indices are added to
+        it. WormFeatures instances have one (speed_indices_cache).
+
+    Returns
+    -------
+    (keep_mask,left_I,right_I)
+        See h__getSpeedIndices. These are shared, so they must not be
+        modified.
+
+    """
+    if cache is None:
+        return h__getSpeedIndices(frames_per_sample, good_frames_mask)
+
+    key = (frames_per_sample, good_frames_mask.tobytes())
+    if key not in cache:
+        cache[key] = h__getSpeedIndices(frames_per_sample, good_frames_mask)
+
+    return cache[key]
+
+
+def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0,
+                  speed_indices_cache=None):
     """
 
     Previous Name: compute_velocity
@@ -436,6 +468,9 @@ def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
         - 1 = clockwise
         - 2 = anticlockwise
 
+    speed_indices_cache: dict (optional)
+        See get_speed_indices
+
     Returns
     -------
     (speed, angular_speed, motion_direction)
@@ -448,12 +483,47 @@ def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
     -------------
     LocomotionVelocity
 
+    See Also
+    --------
+    compute_speeds
+
+    """
+    speed, angular_speed, motion_direction = \
+        compute_speeds(fps, [(sx, sy)], avg_body_angle, sample_time,
+                       ventral_mode, speed_indices_cache)
+
+    return speed[0], angular_speed[0], motion_direction[0]
+
+
+def compute_speeds(fps, segments, avg_body_angle, sample_time,
+                   ventral_mode=0, speed_indices_cache=None):
+    """
+    compute_speed() for several partitions of the worm at once.
+
+    The indices of the frames used to compute the velocity are the same
+    for all partitions, so they are only computed once, and the velocities
+    of all partitions are then computed together.
+
+    Parameters
+    ----------
+    segments: list of (sx, sy)
+      The skeleton's x and y coordinates for each of k partitions, see
+      compute_speed(). The partitions may have different sizes.
+
+    See compute_speed() for the other parameters.
+
+    Returns
+    -------
+    (speed, angular_speed, motion_direction)
+    Three numpy arrays of shape (k, n)
+
     """
 
-    num_frames = np.shape(sx)[1]
-    speed = np.full((num_frames), np.nan)
-    angular_speed = np.full((num_frames), np.nan)
-    motion_direction = np.full((num_frames), np.nan)
+    num_frames = len(avg_body_angle)
+    num_segments = len(segments)
+    speed = np.full((num_segments, num_frames), np.nan)
+    angular_speed = np.full((num_segments, num_frames), np.nan)
+    motion_direction = np.full((num_segments, num_frames), np.nan)
 
     # We need to go from a time over which to compute the velocity
     # to a # of samples. The # of samples should be odd.
@@ -468,42 +538,43 @@ def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
     # calculate the velocity roughly centered on each sample, but with a
     # considerable width between frames that smooths the velocity estimate.
     good_frames_mask = ~np.isnan(avg_body_angle)
-    keep_mask, left_I, right_I = h__getSpeedIndices(frames_per_sample,
-                                                    good_frames_mask)
+    keep_mask, left_I, right_I = get_speed_indices(frames_per_sample,
+                                                   good_frames_mask,
+                                                   speed_indices_cache)
 
     # 1) Compute speed
     # --------------------------------------------------------
     # Centroid of the current skeletal segment, frame-by-frame:
-    x_mean = np.mean(sx, 0)
-    y_mean = np.mean(sy, 0)
+    x_mean = np.array([np.mean(sx, 0) for sx, sy in segments])
+    y_mean = np.array([np.mean(sy, 0) for sx, sy in segments])
 
-    dX = x_mean[right_I] - x_mean[left_I]
-    dY = y_mean[right_I] - y_mean[left_I]
+    dX = x_mean[:, right_I] - x_mean[:, left_I]
+    dY = y_mean[:, right_I] - y_mean[:, left_I]
 
     distance = np.sqrt(dX ** 2 + dY ** 2)
     time = (right_I - left_I) / fps
 
-    #import pdb
-    # pdb.set_trace()
-
-    speed[keep_mask] = distance / time
+    speed[:, keep_mask] = distance / time
 
     # 2) Compute angular speed (Formally known as direction :/)
     # --------------------------------------------------------
-    angular_speed[keep_mask] = h__computeAngularSpeed(fps, sx, sy,
-                                                      left_I, right_I,
-                                                      ventral_mode)
+    # The body part direction for each frame
+    point_angle_d = np.array([get_angles(sx, sy, head_to_tail=False)
+                              for sx, sy in segments])
+    angular_speed[:, keep_mask] = h__computeAngularSpeed(fps, point_angle_d,
+                                                         left_I, right_I,
+                                                         ventral_mode)
 
     # 3) Sign the speed.
     # ------------------------------------------------------------
     #   We want to know how the worm's movement direction compares
     #   to the average angle it had (apparently at the start)
-    motion_direction[keep_mask] = np.degrees(np.arctan2(dY, dX))
+    motion_direction[:, keep_mask] = np.degrees(np.arctan2(dY, dX))
 
     # This recentres the definition, as we are really just concerned
     # with the change, not with the actual value
-    body_direction = np.full((num_frames), np.nan)
-    body_direction[keep_mask] = motion_direction[keep_mask] - \
+    body_direction = np.full((num_segments, num_frames), np.nan)
+    body_direction[:, keep_mask] = motion_direction[:, keep_mask] - \
         avg_body_angle[left_I]
 
     # Force all angles to be within -pi and pi
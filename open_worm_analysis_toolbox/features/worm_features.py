@@ -28,14 +28,26 @@ import copy
 import csv
 import os
 import warnings
+import multiprocessing
+import traceback
+import pickle
 import h5py  # For loading from disk
 import numpy as np
 import collections  # For namedtuple, OrderedDict
 import pandas as pd
+import six  # For compatibility with Python 2.x
+from six.moves import queue
+try:
+    from multiprocessing import SimpleQueue
+except ImportError:
+    # Python 2
+    from multiprocessing.queues import SimpleQueue
 
 from .. import utils
+from ..prefeatures.normalized_worm import NormalizedWorm
 
 from . import feature_processing_options as fpo
+from .feature_cache import FeatureCache
 from . import events
 from . import generic_features
 from . import path_features
@@ -646,6 +658,8 @@ class WormFeatures(object):
     options :
     nw :
     timer :
+    speed_indices_cache : dict
+        See velocity.get_speed_indices
     specs : {FeatureProcessingSpec}
     features : {Feature}
         Contains all computed features that have been requested by the user.
@@ -653,18 +667,31 @@ class WormFeatures(object):
 
     When loading from Schafer File
     h : hdf5 file reference
+        The 'worm' group of the file. The file stays open until close()
+        is called, or until the end of a 'with' block:
+
+        with WormFeatures.from_disk(file_path, lazy=True) as wf:
+            length = wf.get_features('morphology.length')
 
 
 
     """
 
-    def __init__(self, nw, processing_options=None, specs='all'):
+    def __init__(self, nw, processing_options=None, specs='all',
+                 n_workers=1, cache=None):
         """
 
         Parameters
         ----------
         nw : NormalizedWorm object
         specs :
+        n_workers : int (default 1)
+            If greater than 1, features that don't depend on each other
+            are computed concurrently on this many processes.
+        cache : FeatureCache or string (optional)
+            If given (a string being the path of the cache), features are
+            loaded from this on-disk cache when possible, and saved to it
+            otherwise.
 
         #The options will most likely change. We should have the options
         #be accessible from the specs
@@ -685,6 +712,10 @@ class WormFeatures(object):
         self.nw = nw
         self.timer = utils.ElementTimer()
 
+        if isinstance(cache, six.string_types):
+            cache = FeatureCache(cache)
+        self.cache = cache
+
         self.initialize_features()
 
         # TODO: We should eventually support a list of specs as well
@@ -693,9 +724,12 @@ class WormFeatures(object):
         if isinstance(specs, pd.core.frame.DataFrame):
             # This wouldn't be good if the specs have changed.
             # We would need to change the initialize_features() call
+            if n_workers > 1:
+                self._retrieve_features_in_parallel(
+                    list(specs['feature_name']), n_workers)
             self.get_features(specs['feature_name'])
         else:
-            self._retrieve_all_features()
+            self._retrieve_all_features(n_workers)
 
     def __iter__(self):
         """  Let's allow iteration over the features """
@@ -722,7 +756,8 @@ class WormFeatures(object):
         d = self.__dict__
         for key in d:
             temp = d[key]
-            if key in ['features', 'specs', 'h', '_temp_features']:
+            if key in ['features', 'specs', 'h', '_h5_file',
+                       '_temp_features']:
                 pass
                 # do nothing
                 # setattr(new_self,'spec',temp.copy())
@@ -744,27 +779,134 @@ class WormFeatures(object):
         return new_self
 
     @classmethod
-    def from_disk(cls, data_file_path):
+    def compute_many(cls, paths_or_nws, n_workers=1, processing_options=None,
+                     specs='all', cache=None):
+        """
+        Compute the features of many videos, on a pool of processes.
+
+        This is a generator: results are yielded as each video is finished,
+        which with more than one worker is not necessarily the order of
+        paths_or_nws. A video that fails does not stop the others, even
+        if its worker process dies or its features can't be sent back;
+        the error is reported in its result instead.
+
+        Parameters
+        ----------
+        paths_or_nws : iterable of strings or NormalizedWorm objects
+            Paths are loaded with NormalizedWorm.from_schafer_file_factory,
+            or with NormalizedWorm.open for directories written by
+            NormalizedWorm.save
+        n_workers : int (default 1)
+            The number of processes to use. With 1 the videos are
+            processed in this process, in order.
+        processing_options : FeatureProcessingOptions (optional)
+        specs : (optional)
+            See __init__
+        cache : FeatureCache or string (optional)
+            See __init__. The cache may be shared by all workers.
+
+        Yields
+        ------
+        VideoFeaturesResult
+            index : int
+                The position of the video in paths_or_nws
+            source : string
+                The path of the video, or None if a NormalizedWorm was given
+            features : WormFeatures
+                None if the video failed
+            timer : utils.ElementTimer
+                Time taken to load the video (if a path was given) and to
+                compute each feature. Use timer.summarize() to display.
+            elapsed_time : float
+                Total time taken for the video, in seconds
+            error : string
+                The traceback of the failure, or None
+
+        Examples
+        --------
+        for result in WormFeatures.compute_many(paths, n_workers=4):
+            if result.error is None:
+                print('%s: %0.3fs' % (result.source, result.elapsed_time))
+            else:
+                print(result.error)
+
+        """
+        tasks = ((index, path_or_nw, processing_options, specs, cache)
+                 for index, path_or_nw in enumerate(paths_or_nws))
+
+        if n_workers <= 1:
+            for task in tasks:
+                yield _compute_video_features(task)
+            return
+
+        # Only a few videos are queued per worker, so that paths_or_nws
+        # can be a generator of NormalizedWorm objects
+        pool = _TaskPool(n_workers)
+        sources = {}
+        submit_times = {}
+        try:
+            for task in tasks:
+                index, path_or_nw = task[:2]
+                if isinstance(path_or_nw, six.string_types):
+                    sources[index] = path_or_nw
+                else:
+                    sources[index] = None
+                submit_times[index] = utils.timing_function()
+                pool.submit(index, _compute_video_features, (task,))
+
+                while pool.n_pending >= 2 * n_workers:
+                    yield _get_video_features_result(
+                        pool.wait(), sources, submit_times)
+
+            while pool.n_pending > 0:
+                yield _get_video_features_result(
+                    pool.wait(), sources, submit_times)
+        finally:
+            pool.close()
+
+    @classmethod
+    def from_disk(cls, data_file_path, lazy=False):
         """
         Creates an instance of the class from disk.
 
         Ideally we would support loading of any file type. For now
         we'll punt on building in any logic until we have more types to deal
         with.
+
+        Parameters
+        ----------
+        data_file_path : string
+        lazy : bool (default False)
+            If True, features are only read from the file when they are
+            requested via get_features. See _from_schafer_file
         """
         # This ideally would allow us to load any file from disk.
         #
         # For now we'll punt on this logic
-        return cls._from_schafer_file(data_file_path)
+        return cls._from_schafer_file(data_file_path, lazy=lazy)
 
     @classmethod
-    def _from_schafer_file(cls, data_file_path):
+    def _from_schafer_file(cls, data_file_path, lazy=False):
         """
         Load features from the Schafer lab feature (.mat) files.
+
+        Parameters
+        ----------
+        data_file_path : string
+        lazy : bool (default False)
+            If False, all features are read when loading. If True, nothing
+            is read until a feature is requested via get_features, which
+            then reads just that feature (and the features it depends on).
+            Note that iterating over the object, or the 'features'
+            attribute, only covers the features read so far.
+
+            Either way the file is kept open. Use close(), or a 'with'
+            block, to close it.
         """
 
         self = cls.__new__(cls)
         self.timer = utils.ElementTimer()
+        self.cache = None
         self.initialize_features()
 
         # I'm not thrilled about this approach. I think we should
@@ -775,16 +917,34 @@ class WormFeatures(object):
             spec.source = 'mrc'
 
         # Load file reference for getting files from disk
-        h = h5py.File(data_file_path, 'r')
-        worm = h['worm']
-        self.h = worm
+        self._h5_file = h5py.File(data_file_path, 'r')
+        self.h = self._h5_file['worm']
 
         # Retrieve all features
         # Do we need to differentiate what we can and can not load?
-        self._retrieve_all_features()
+        if not lazy:
+            self._retrieve_all_features()
 
         return self
 
+    def close(self):
+        """
+        Close the file that the features were loaded from, if any.
+
+        Features that have not been read yet can no longer be requested.
+        """
+        h5_file = getattr(self, '_h5_file', None)
+        if h5_file is not None:
+            h5_file.close()
+            self._h5_file = None
+            self.h = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
     @property
     def features(self):
         """
@@ -796,10 +956,19 @@ class WormFeatures(object):
             d[x] for x in d if (
                 x is not None and not d[x].is_temporary and d[x].is_user_requested)]
 
-    def _retrieve_all_features(self):
+    def _retrieve_all_features(self, n_workers=1):
         """
         Simple function for retrieving all features.
+
+        Parameters
+        ----------
+        n_workers : int (default 1)
+            If greater than 1, the features are first computed on a pool
+            of processes. See _retrieve_features_in_parallel
         """
+        if n_workers > 1:
+            self._retrieve_features_in_parallel(list(self.specs), n_workers)
+
         spec_dict = self.specs
         # Trying to avoid 2v3 differences in Python dict iteration
         for key in spec_dict:
@@ -808,6 +977,113 @@ class WormFeatures(object):
             # rather than resolving the instance from the name
             self._get_and_log_feature(spec.name)
 
+    def _get_dependency_order(self, feature_names):
+        """
+        Determine the features that still need to be computed in order to
+        retrieve feature_names, based on the dependencies declared in the
+        specs.
+
+        Returns
+        -------
+        collections.OrderedDict
+            Maps each feature name to the names of the features it depends
+            on that still need to be computed. Features come after their
+            dependencies, in the order that a sequential computation (via
+            _get_and_log_feature) would compute them.
+        """
+        order = collections.OrderedDict()
+
+        def add_feature(feature_name):
+            if feature_name in order or feature_name in self._features:
+                return
+
+            if feature_name not in self.specs:
+                raise KeyError(
+                    'Specified feature name not found in the feature specifications')
+
+            dependencies = self.specs[feature_name].dependencies
+            for dependency in dependencies:
+                add_feature(dependency)
+
+            order[feature_name] = [x for x in dependencies if x in order]
+
+        for feature_name in feature_names:
+            add_feature(feature_name)
+
+        return order
+
+    def _retrieve_features_in_parallel(self, feature_names, n_workers):
+        """
+        Compute features on a pool of processes, following the dependency
+        graph declared in the specs.
+
+        A feature is started as soon as all of its dependencies have been
+        computed, so that independent branches (e.g. the path and posture
+        features) are computed at the same time. The time taken is then
+        bounded by the longest chain of dependencies rather than by the
+        sum of the times of all features.
+
+        Each worker process starts with a copy of this object. The
+        dependencies of a feature are sent along with it, and the computed
+        feature (and its timings) are sent back and logged here, in the
+        same order as they would be by a sequential computation.
+
+        Parameters
+        ----------
+        feature_names : [string]
+        n_workers : int
+            The number of processes to use
+        """
+        order = self._get_dependency_order(feature_names)
+        requested_names = set(feature_names)
+
+        n_missing_dependencies = {}
+        dependents = collections.defaultdict(list)
+        for feature_name in order:
+            n_missing_dependencies[feature_name] = len(order[feature_name])
+            for dependency in order[feature_name]:
+                dependents[dependency].append(feature_name)
+
+        pool = _TaskPool(n_workers, initializer=_init_worker,
+                         initargs=(self,))
+
+        def submit(feature_name):
+            dependencies = dict((x, self._features[x]) for x in
+                                self.specs[feature_name].dependencies)
+            pool.submit(feature_name, _compute_feature,
+                        (feature_name, feature_name not in requested_names,
+                         dependencies))
+
+        try:
+            for feature_name in order:
+                if n_missing_dependencies[feature_name] == 0:
+                    submit(feature_name)
+
+            for i in range(len(order)):
+                feature_name, result, error = pool.wait()
+                if error is not None:
+                    raise RuntimeError("Computing %s failed: %s" %
+                                       (feature_name, error))
+                feature, names, times, error = result
+                if error is not None:
+                    raise error
+
+                # The spec came back as a copy
+                feature.spec = self.specs[feature_name]
+                self._features[feature_name] = feature
+                self.timer.names.extend(names)
+                self.timer.times.extend(times)
+
+                for dependent in dependents[feature_name]:
+                    n_missing_dependencies[dependent] -= 1
+                    if n_missing_dependencies[dependent] == 0:
+                        submit(dependent)
+        finally:
+            pool.close()
+
+        for feature_name in order:
+            self._features[feature_name] = self._features.pop(feature_name)
+
     def initialize_features(self):
         """
         Reads the feature specs and initializes necessary attributes.
@@ -820,6 +1096,10 @@ class WormFeatures(object):
 
         self._features = collections.OrderedDict()
 
+        # The frames used to compute velocities, shared by the features
+        # that compute them. See velocity.get_speed_indices
+        self.speed_indices_cache = {}
+
         # This will be removed soon
         self._temp_features = collections.OrderedDict()
 
@@ -898,7 +1178,16 @@ class WormFeatures(object):
             raise KeyError(
                 'Specified feature name not found in the feature specifications')
 
-        temp = spec.compute_feature(self, internal_request=internal_request)
+        if spec.source == 'mrc' and self.h is None:
+            raise ValueError('Feature %s was not loaded before the feature '
+                             'file was closed' % feature_name)
+
+        if self.cache is None:
+            temp = spec.compute_feature(self,
+                                        internal_request=internal_request)
+        else:
+            temp = self.cache.compute_feature(
+                spec, self, internal_request=internal_request)
 
         # TODO: this will change
         # A feature can return None, which means we can't ask the feature
@@ -1007,6 +1296,260 @@ class WormFeatures(object):
             return feature_spec_expanded
 
 
+class _TaskPool(object):
+    """
+    A multiprocessing.Pool that notices when a worker dies while running
+    a task (e.g. killed for running out of memory, or by a segfault in a
+    C extension), rather than waiting for its result forever.
+
+    Workers report each task they start, along with their process id,
+    before running it.  A started task whose worker is no longer among
+    multiprocessing.active_children() has been lost.
+
+    The task and its result are pickled within the task, so that one
+    that can't be pickled or unpickled is reported rather than lost by
+    the pool.
+
+    Attributes
+    ----------
+    n_pending : int
+        The number of tasks submitted but not yet returned by wait
+    """
+
+    def __init__(self, n_workers, initializer=None, initargs=()):
+        self._started_tasks = SimpleQueue()
+        self._finished_tasks = queue.Queue()
+        self._pool = multiprocessing.Pool(
+            n_workers, initializer=_init_task_worker,
+            initargs=(self._started_tasks, initializer, initargs))
+
+        # task_id : AsyncResult
+        self._pending = {}
+        # task_id : process id of the worker running it
+        self._worker_pids = {}
+
+    @property
+    def n_pending(self):
+        return len(self._pending)
+
+    def submit(self, task_id, function, args):
+        """
+        Run function(*args) on the pool.  function must be picklable,
+        i.e. defined at the top level of a module.
+        """
+        # The callback runs on the pool's result thread, which must not
+        # raise, so the result is only looked at in wait
+        self._pending[task_id] = self._pool.apply_async(
+            _run_task, (task_id, pickle.dumps((function, args))),
+            callback=lambda result: self._finished_tasks.put(task_id))
+
+    def wait(self, poll_interval=1.0):
+        """
+        Wait for one of the submitted tasks to end.
+
+        Returns
+        -------
+        (task_id, result, error)
+            error is None if the task returned.  Otherwise it is a string,
+            the traceback of the exception raised by the task, or what
+            went wrong with the task's worker or result.
+        """
+        while True:
+            try:
+                task_id = self._finished_tasks.get(timeout=poll_interval)
+            except queue.Empty:
+                task_id = self._get_lost_task(poll_interval)
+                if task_id is not None:
+                    del self._pending[task_id]
+                    del self._worker_pids[task_id]
+                    return task_id, None, \
+                        "The worker process died while running the task"
+                continue
+
+            is_pickled, value = self._pending.pop(task_id).get()
+            self._worker_pids.pop(task_id, None)
+            if not is_pickled:
+                return task_id, None, value
+            try:
+                return task_id, pickle.loads(value), None
+            except Exception as e:
+                return task_id, None, \
+                    "The result could not be unpickled: %r" % e
+
+    def _get_lost_task(self, poll_interval):
+        """
+        Return the id of a started task whose worker has died, or None
+        """
+        while not self._started_tasks.empty():
+            task_id, pid = self._started_tasks.get()
+            if task_id in self._pending:
+                self._worker_pids[task_id] = pid
+
+        live_pids = set(p.pid for p in multiprocessing.active_children())
+        for task_id, pid in self._worker_pids.items():
+            if pid not in live_pids:
+                # The worker may have sent its result just before dying,
+                # in which case it is on self._finished_tasks once ready
+                self._pending[task_id].wait(poll_interval)
+                if not self._pending[task_id].ready():
+                    return task_id
+        return None
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+# The queue on which each worker process of a _TaskPool reports the tasks
+# it starts
+_started_tasks = None
+
+
+def _init_task_worker(started_tasks, initializer, initargs):
+    global _started_tasks
+    _started_tasks = started_tasks
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_task(task_id, pickled_task):
+    """
+    Run a task of a _TaskPool in a worker process.
+
+    Returns
+    -------
+    (True, the pickled result), or (False, an error message)
+    """
+    _started_tasks.put((task_id, os.getpid()))
+
+    try:
+        function, args = pickle.loads(pickled_task)
+        result = function(*args)
+    except Exception:
+        return False, traceback.format_exc()
+
+    try:
+        return True, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        return False, "The result could not be pickled: %r" % e
+
+
+# The WormFeatures instance of each worker process, when computing features
+# in parallel (see WormFeatures._retrieve_features_in_parallel)
+_worker_features = None
+
+
+def _init_worker(wf):
+    global _worker_features
+    _worker_features = wf
+
+
+def _compute_feature(feature_name, internal_request, dependencies):
+    """
+    Compute a feature in a worker process.
+
+    Parameters
+    ----------
+    feature_name : string
+    internal_request : bool
+    dependencies : {string : Feature}
+        The already computed features that this feature depends on
+
+    Returns
+    -------
+    (feature, timer names, timer times, exception or None)
+    """
+    wf = _worker_features
+    wf._features.update(dependencies)
+    n_logged = len(wf.timer.names)
+
+    # Exceptions are passed back rather than raised, so that the feature
+    # that failed is known
+    try:
+        feature = wf._get_and_log_feature(feature_name,
+                                          internal_request=internal_request)
+        return (feature, wf.timer.names[n_logged:],
+                wf.timer.times[n_logged:], None)
+    except Exception as e:
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            # e.g. an exception whose __init__ takes more than its message
+            e = RuntimeError("%s while computing %s: %s" %
+                             (type(e).__name__, feature_name, e))
+        return (None, [], [], e)
+
+
+VideoFeaturesResult = collections.namedtuple(
+    'VideoFeaturesResult',
+    ['index', 'source', 'features', 'timer', 'elapsed_time', 'error'])
+
+
+def _compute_video_features(task):
+    """
+    Compute the features of one video, for WormFeatures.compute_many
+
+    Parameters
+    ----------
+    task : (index, path_or_nw, processing_options, specs, cache)
+
+    Returns
+    -------
+    VideoFeaturesResult
+    """
+    index, path_or_nw, processing_options, specs, cache = task
+
+    if isinstance(path_or_nw, six.string_types):
+        source = path_or_nw
+    else:
+        source = None
+
+    start_time = utils.timing_function()
+    timer = utils.ElementTimer()
+    features = None
+    error = None
+
+    try:
+        if source is None:
+            nw = path_or_nw
+        else:
+            timer.tic()
+            if os.path.isdir(source):
+                nw = NormalizedWorm.open(source)
+            else:
+                nw = NormalizedWorm.from_schafer_file_factory(source)
+            timer.toc('normalized_worm')
+
+        features = WormFeatures(nw, processing_options, specs, cache=cache)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        timer.names.extend(features.timer.names)
+        timer.times.extend(features.timer.times)
+
+    elapsed_time = utils.timing_function() - start_time
+
+    return VideoFeaturesResult(index, source, features, timer, elapsed_time,
+                               error)
+
+
+def _get_video_features_result(pool_result, sources, submit_times):
+    """
+    The VideoFeaturesResult of a video computed on a _TaskPool, for
+    WormFeatures.compute_many.  A video whose worker died, or whose
+    result could not be sent back, gets a result with only its error set.
+    """
+    index, result, error = pool_result
+    source = sources.pop(index)
+    elapsed_time = utils.timing_function() - submit_times.pop(index)
+
+    if error is not None:
+        return VideoFeaturesResult(index, source, None,
+                                   utils.ElementTimer(), elapsed_time, error)
+
+    return result
+
+
 def get_feature_specs(as_table=True):
     """
 
@@ -1089,6 +1632,10 @@ class FeatureProcessingSpec(object):
         A method instance
     flags : string
         This is a string that can be passed to the class method
+    dependencies : [string]
+        Names of the features that this feature requests while being
+        computed. These are declared in the specification file so that
+        features can be scheduled before they are computed.
 
     See Also
     --------
@@ -1140,6 +1687,9 @@ class FeatureProcessingSpec(object):
 
         self.flags = d['processing_flags']
 
+        # Separated by ';' in the specification file
+        self.dependencies = [x for x in d['dependencies'].split(';') if x]
+
         # TODO: We might write a __getattr__ function and just hold
         # onto the dict
         self.type = d['type']
@@ -1191,8 +1741,11 @@ class FeatureProcessingSpec(object):
         else:  # mrc #TODO: make explicit check for MRC otherwise throw an error
             final_method = getattr(class_method, 'from_schafer_file')
 
+        # Computing this feature may compute (and time) other features
+        # first, so we keep our own start time rather than relying on the
+        # timer's
         timer = wf.timer
-        timer.tic()
+        start_time = utils.timing_function()
 
         # The flags input is optional, if no flag is present
         # we currently assume that the constructor doesn't require
@@ -1205,7 +1758,7 @@ class FeatureProcessingSpec(object):
             # any fancy parsing
             temp = final_method(wf, self.name, self.flags)
 
-        elapsed_time = timer.toc(self.name)
+        elapsed_time = timer.toc(self.name, start_time)
 
         # This is an assigment of global attributes that the spec knows about
         # This could eventually be handled by a super() call to Feature
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-BasicWorm, WormPartition, JSON_Serializer
+BasicWorm, WormPartition, WormSerializer
 
 Credit to Christopher R. Wagner at
 http://robotfantastic.org/serializing-python-data-to-json-some-edge-cases.html
@@ -18,6 +18,7 @@ import numpy as np
 import warnings
 import copy
 import h5py
+import multiprocessing.pool
 import matplotlib.pyplot as plt
 
 import json
@@ -26,20 +27,131 @@ from collections import namedtuple, Iterable, OrderedDict
 from .. import config, utils
 from .pre_features import WormParsing
 from .video_info import VideoInfo
+from .heterocardinal_frames import HeterocardinalFrames
+from . import wcon_io
 
 #%%
 
 
-class JSON_Serializer():
+def _read_hdf5_references(h, refs, n_workers=None):
     """
-    A class that can save all of its attributes to a JSON file, or
-    load them from a JSON file.
+    Read the datasets pointed to by a list of HDF5 object references
+
+    Parameters
+    ----------
+    h : h5py.File
+    refs : sequence of h5py object references
+    n_workers : int (optional)
+        If given, the datasets are read on a pool of this many threads.
+
+    Returns
+    -------
+    list of numpy arrays, in the order of refs
+
+    """
+    # Resolve all of the references before reading anything. Going through
+    # the low level API avoids creating an h5py.Dataset for each reference.
+    dataset_ids = [h5py.h5r.dereference(ref, h.id) for ref in refs]
+
+    # Read the datasets in the order they are stored in the file. Datasets
+    # without a single offset (e.g. chunked ones) are read last.
+    offsets = [dataset_id.get_offset() for dataset_id in dataset_ids]
+    read_order = sorted(range(len(dataset_ids)),
+                        key=lambda i: (offsets[i] is None, offsets[i] or 0))
+
+    def read_dataset(i):
+        dataset_id = dataset_ids[i]
+        value = np.empty(dataset_id.shape, dtype=dataset_id.dtype)
+        dataset_id.read(h5py.h5s.ALL, h5py.h5s.ALL, value)
+        return value
+
+    if n_workers is None:
+        values = [read_dataset(i) for i in read_order]
+    else:
+        pool = multiprocessing.pool.ThreadPool(n_workers)
+        try:
+            values = pool.map(read_dataset, read_order)
+        finally:
+            pool.close()
+            pool.join()
+
+    data = [None] * len(dataset_ids)
+    for i, value in zip(read_order, values):
+        data[i] = value
+
+    return data
+
+
+class WormSerializer():
+    """
+    A class that can save all of its attributes to a binary file, or load
+    them back, optionally only some of them.
+
+    The file is a numpy .npz archive with one typed array per numpy array
+    attribute (including the arrays inside HeterocardinalFrames and
+    VideoInfo instances), plus a small JSON description of how to put the
+    attributes back together.  Only the arrays of the attributes that are
+    asked for are read when loading.
+
+    JSON files can still be written and read with save_to_JSON and
+    load_from_JSON, e.g. to exchange data with other programs, but they are
+    much larger and much slower.
 
     """
 
+    # Lazily computed caches that are not worth saving
+    _unsaved_attributes = ('_frame_code_info',)
+
     def __init__(self):
         pass
 
+    def save(self, file_path, compress=False):
+        """
+        Save all of the attributes to a .npz file
+
+        Parameters
+        ----------
+        file_path : str
+        compress : bool (optional)
+            If True, the arrays are compressed.  The file is smaller, but
+            slower to save and load.
+
+        """
+        arrays = {}
+        metadata = {name: json.dumps(_to_npz(value, arrays, name))
+                    for name, value in self.__dict__.items()}
+        arrays[_NPZ_METADATA_KEY] = np.array(json.dumps(metadata))
+
+        if compress:
+            np.savez_compressed(file_path, **arrays)
+        else:
+            np.savez(file_path, **arrays)
+
+    def load(self, file_path, keys=None):
+        """
+        Load attributes saved by save()
+
+        Parameters
+        ----------
+        file_path : str
+        keys : list of str (optional)
+            The names of the attributes to load, e.g. ['h_ventral_contour'].
+            The leading underscore of a private attribute can be left out.
+            If not given, all of the attributes are loaded.
+
+        """
+        with np.load(file_path) as npz:
+            metadata = json.loads(str(npz[_NPZ_METADATA_KEY][()]))
+
+            if keys is None:
+                keys = list(metadata.keys())
+            keys = [key if key in metadata else '_' + key for key in keys]
+
+            for key in keys:
+                setattr(self, key, json.loads(
+                    metadata[key],
+                    object_hook=lambda dct: _restore_from_npz(dct, npz)))
+
     def save_to_JSON(self, JSON_path):
         serialized_data = data_to_json(list(self.__dict__.items()))
 
@@ -55,10 +167,13 @@ class JSON_Serializer():
         for member in member_list:
             setattr(self, member[0], member[1])
 
+# Kept for backwards compatibility
+JSON_Serializer = WormSerializer
+
 #%%
 
 
-class UnorderedWorm(JSON_Serializer):
+class UnorderedWorm(WormSerializer):
     """
     Encapsulates the notion of worm contour or skeleton data that might have
     been obtained from a computer vision operation
@@ -169,7 +284,7 @@ class UnorderedWorm(JSON_Serializer):
 #%%
 
 
-class BasicWorm(JSON_Serializer):
+class BasicWorm(WormSerializer):
     """
     A worm's skeleton and contour, not necessarily "normalized" to 49 points,
     and possibly heterocardinal (i.e. possibly with a varying number of
@@ -177,15 +292,18 @@ class BasicWorm(JSON_Serializer):
 
     Attributes
     ----------
-    h_skeleton : list, where each element is a numpy array of shape (2,k_i)
-        Each element of the list is a frame.
+    h_skeleton : HeterocardinalFrames, where each element is a numpy array
+                 of shape (2,k_i)
+        Each element is a frame.
         Where k_i is the number of skeleton points in frame i.
         The first axis of the numpy array, having len 2, is the x and y.
          Missing frames should be identified by None.
     h_ventral_contour:   Same type and shape as skeleton (see above)
         The vulva side of the contour.
+        Lists of frames are converted to HeterocardinalFrames when set.
     h_dorsal_contour: Same type and shape as skeleton (see above)
         The non-vulva side of the contour.
+        Lists of frames are converted to HeterocardinalFrames when set.
     video_info : An instance of the VideoInfo class.
                  (contains metadata attributes of the worm video)
 
@@ -206,35 +324,47 @@ class BasicWorm(JSON_Serializer):
                 setattr(self, a, copy.deepcopy(getattr(other, a)))
 
     @classmethod
-    def from_schafer_file_factory(cls, data_file_path):
+    def from_schafer_file_factory(cls, data_file_path, n_workers=None):
+        """
+        Load the contours from a Schafer file
+
+        Parameters
+        ----------
+        data_file_path : str
+        n_workers : int (optional)
+            If given, the contours are read from the file on a pool of this
+            many threads.
+
+        """
         bw = cls()
 
         with h5py.File(data_file_path, 'r') as h:
             # These are all HDF5 'references'
             all_ventral_contours_refs = h['all_vulva_contours'].value
             all_dorsal_contours_refs = h['all_non_vulva_contours'].value
-            all_skeletons_refs = h['all_skeletons'].value
 
             is_stage_movement = utils._extract_time_from_disk(
                 h, 'is_stage_movement')
             is_valid = utils._extract_time_from_disk(h, 'is_valid')
 
-            all_skeletons = []
-            all_ventral_contours = []
-            dorsal_contour = []
-
-            for valid_frame, iFrame in zip(is_valid, range(is_valid.size)):
-                if valid_frame:
-                    all_skeletons.append(
-                        h[all_skeletons_refs[iFrame][0]].value)
-                    all_ventral_contours.append(
-                        h[all_ventral_contours_refs[iFrame][0]].value)
-                    dorsal_contour.append(
-                        h[all_dorsal_contours_refs[iFrame][0]].value)
-                else:
-                    all_skeletons.append(None)
-                    all_ventral_contours.append(None)
-                    dorsal_contour.append(None)
+            # The skeletons are not loaded, see below
+            valid_frames_I = np.flatnonzero(is_valid)
+            valid_contours = _read_hdf5_references(
+                h,
+                np.concatenate((all_ventral_contours_refs[valid_frames_I, 0],
+                                all_dorsal_contours_refs[valid_frames_I, 0])),
+                n_workers)
+
+        n_frames = is_valid.size
+        n_valid_frames = valid_frames_I.size
+        all_ventral_contours = [None] * n_frames
+        dorsal_contour = [None] * n_frames
+        for i, iFrame in enumerate(valid_frames_I):
+            all_ventral_contours[iFrame] = valid_contours[i]
+            dorsal_contour[iFrame] = valid_contours[n_valid_frames + i]
+        all_ventral_contours = \
+            HeterocardinalFrames.from_frames(all_ventral_contours)
+        dorsal_contour = HeterocardinalFrames.from_frames(dorsal_contour)
 
         # Video Metadata
         is_stage_movement = is_stage_movement.astype(bool)
@@ -244,7 +374,7 @@ class BasicWorm(JSON_Serializer):
         # of the number of frames in the video.  It's unclear why
         # is_stage_movement would be longer by 1, which it was in our
         # canonical example.
-        is_stage_movement = is_stage_movement[0:len(all_skeletons)]
+        is_stage_movement = is_stage_movement[0:n_frames]
 
         # 5. Derive frame_code from the two pieces of data we have,
         #    is_valid and is_stage_movement.
@@ -262,6 +392,52 @@ class BasicWorm(JSON_Serializer):
 
         return bw
 
+    @classmethod
+    def from_WCON_factory(cls, file_path, worm_id=None):
+        """
+        Load a worm from a WCON file, or a zipped WCON file.
+
+        The file is read incrementally, see wcon_io.read_wcon.  The
+        coordinates are converted to microns.
+
+        Parameters
+        ----------
+        file_path : str
+        worm_id : (optional)
+            The "id" of the worm to load, if the file has several worms.
+            If not given, the first worm in the file is loaded.
+
+        """
+        frames, t, units, metadata = wcon_io.read_wcon(file_path, worm_id)
+
+        microns_per_unit = wcon_io.get_microns_per_unit(units)
+        if microns_per_unit != 1:
+            for h_frames in frames.values():
+                if h_frames is not None:
+                    h_frames.data *= microns_per_unit
+
+        if frames['ventral_contour'] is not None and \
+                frames['dorsal_contour'] is not None:
+            bw = cls.from_h_contour_factory(frames['ventral_contour'],
+                                            frames['dorsal_contour'])
+        elif frames['skeleton'] is not None:
+            bw = cls.from_h_skeleton_factory(frames['skeleton'],
+                                             extrapolate_contour=True)
+            is_valid = frames['skeleton'].is_valid
+            bw.video_info.frame_code = 1 * is_valid + 100 * ~is_valid
+        else:
+            raise ValueError("The WCON file has neither a contour nor a "
+                             "skeleton")
+
+        if frames['skeleton'] is not None:
+            bw._h_skeleton = frames['skeleton']
+
+        # Only times in seconds are understood
+        if units.get('t') == 's' and t.size > 1:
+            bw.video_info.fps = 1 / np.median(np.diff(t))
+
+        return bw
+
     @classmethod
     def from_contour_factory(cls, ventral_contour, dorsal_contour):
         """
@@ -280,31 +456,14 @@ class BasicWorm(JSON_Serializer):
         assert(np.shape(ventral_contour) == np.shape(dorsal_contour))
         # TODO: more validations, like that the nans are ligned up, etc.
 
-        num_frames = np.shape(ventral_contour)[2]
-
-        # we need it to be shape (2,49,n) instead of (49,2,n) so we roll
-        # axis 1 back to position 0.
-        ventral_contour = np.rollaxis(ventral_contour, axis=1)
-        dorsal_contour = np.rollaxis(dorsal_contour, axis=1)
+        # The heterocardinal contour has missing frames where we previously
+        # had NaN-filled frames.
+        is_valid = ~np.isnan(ventral_contour[0, 0, :])
 
-        # Pre-allocate the lists to the correct length
-        h_ventral_contour = [None] * num_frames
-        h_dorsal_contour = [None] * num_frames
-
-        nan_frame_mask = np.isnan(ventral_contour[0, 0, :])
-
-        for frame_index in range(num_frames):
-            # The heterocardinal contour expects to have None entries
-            # in the frame list where we previous had NaN-filled numpy
-            # arrays, so just avoid those elements since they are
-            # already pre-populated with None as required.
-            if not nan_frame_mask[frame_index]:
-                # Otherwise just take the appropriate data from the
-                # appropriate frame:
-                h_ventral_contour[frame_index] = \
-                    ventral_contour[:, :, frame_index]
-                h_dorsal_contour[frame_index] = \
-                    dorsal_contour[:, :, frame_index]
+        h_ventral_contour = HeterocardinalFrames.from_homocardinal(
+            ventral_contour, is_valid)
+        h_dorsal_contour = HeterocardinalFrames.from_homocardinal(
+            dorsal_contour, is_valid)
 
         # Having converted our normalized contour to a heterocardinal-type
         # contour that just "happens" to have all its frames with the same
@@ -358,8 +517,8 @@ class BasicWorm(JSON_Serializer):
         bw.h_ventral_contour = h_ventral_contour
         bw.h_dorsal_contour = h_dorsal_contour
 
-        nan_mask_ventral = np.array([f is None for f in h_ventral_contour])
-        nan_mask_dorsal = np.array([f is None for f in h_dorsal_contour])
+        nan_mask_ventral = ~bw.h_ventral_contour.is_valid
+        nan_mask_dorsal = ~bw.h_dorsal_contour.is_valid
 
         assert(np.all(nan_mask_ventral == nan_mask_dorsal))
 
@@ -400,6 +559,8 @@ class BasicWorm(JSON_Serializer):
 
     @h_ventral_contour.setter
     def h_ventral_contour(self, x):
+        if x is not None:
+            x = HeterocardinalFrames.from_frames(x)
         self._h_ventral_contour = x
         self.__remove_precalculated_skeleton()
 
@@ -409,6 +570,8 @@ class BasicWorm(JSON_Serializer):
 
     @h_dorsal_contour.setter
     def h_dorsal_contour(self, x):
+        if x is not None:
+            x = HeterocardinalFrames.from_frames(x)
         self._h_dorsal_contour = x
         self.__remove_precalculated_skeleton()
 
@@ -453,6 +616,53 @@ class BasicWorm(JSON_Serializer):
 
             return self._h_skeleton
 
+    def save_to_WCON(self, file_path, worm_id=0, metadata=None,
+                     frames_per_record=1000):
+        """
+        Save the worm's contour and skeleton to a WCON file, or a zipped
+        WCON file if file_path ends in '.zip'.
+
+        The frames are written as they are produced, a record of
+        frames_per_record frames at a time.  If the skeleton hasn't been
+        computed yet, it is computed a record at a time as well.
+
+        Parameters
+        ----------
+        file_path : str
+        worm_id : (optional)
+            The "id" of the worm in the file.
+        metadata : dict (optional)
+            The WCON "metadata", e.g. {"lab": {"name": "Schafer Lab"}}
+        frames_per_record : int (optional)
+
+        """
+        units = {'t': 's', 'x': 'um', 'y': 'um'}
+        n_frames = len(self.h_ventral_contour)
+        h_skeleton = getattr(self, '_h_skeleton', None)
+
+        def get_records():
+            for start in range(0, n_frames, frames_per_record):
+                stop = min(start + frames_per_record, n_frames)
+                frames = {
+                    'ventral_contour': self.h_ventral_contour[start:stop],
+                    'dorsal_contour': self.h_dorsal_contour[start:stop]}
+                if h_skeleton is None:
+                    # The skeleton calculation smooths the contour in
+                    # place, so it is given a copy
+                    frames['skeleton'] = \
+                        WormParsing.compute_skeleton_and_widths(
+                            *[HeterocardinalFrames(
+                                x.data.copy(), x.offsets, x.is_valid)
+                              for x in (frames['ventral_contour'],
+                                        frames['dorsal_contour'])])[1]
+                else:
+                    frames['skeleton'] = h_skeleton[start:stop]
+
+                t = np.arange(start, stop) / self.video_info.fps
+                yield worm_id, t, frames
+
+        wcon_io.write_wcon(file_path, get_records(), units, metadata)
+
     def plot_frame(self, frame_index):
         """
         Plot the contour and skeleton the worm for one of the frames.
@@ -690,6 +900,11 @@ def serialize(data):
         return {"py/tuple": [serialize(val) for val in data]}
     if isinstance(data, set):
         return {"py/set": [serialize(val) for val in data]}
+    if isinstance(data, HeterocardinalFrames):
+        return {"py/HeterocardinalFrames": {
+            "data": serialize(data.data),
+            "offsets": serialize(data.offsets),
+            "is_valid": serialize(data.is_valid)}}
     if isinstance(data, np.ndarray):
         return {"py/numpy.ndarray": {
             "values": data.tolist(),
@@ -715,9 +930,71 @@ def restore(dct):
         return np.array(data["values"], dtype=data["dtype"])
     if "py/collections.OrderedDict" in dct:
         return OrderedDict(dct["py/collections.OrderedDict"])
+    if "py/HeterocardinalFrames" in dct:
+        data = dct["py/HeterocardinalFrames"]
+        return HeterocardinalFrames(data["data"], data["offsets"],
+                                    data["is_valid"])
     return dct
 
 
+_NPZ_METADATA_KEY = '__metadata__'
+
+# The only classes that _to_npz saves attribute by attribute, by the name
+# they are saved under.  Loading refuses any other name, so that a file
+# can't make us import arbitrary modules.
+_NPZ_OBJECT_TYPES = dict((x.__module__ + '.' + x.__name__, x)
+                         for x in [VideoInfo])
+
+
+def _to_npz(data, arrays, key):
+    """
+    Like serialize, but numpy arrays are put in the arrays dictionary,
+    under key, and only referred to by their key.  VideoInfo instances
+    are saved attribute by attribute; other objects are refused (see
+    _NPZ_OBJECT_TYPES).
+
+    """
+    if isinstance(data, np.ndarray) and data.dtype != object:
+        arrays[key] = data
+        return {"py/npz": key}
+    if isinstance(data, HeterocardinalFrames):
+        return {"py/HeterocardinalFrames": {
+            name: _to_npz(getattr(data, name), arrays, key + '/' + name)
+            for name in ('data', 'offsets', 'is_valid')}}
+    if hasattr(data, '__dict__'):
+        data_class = type(data)
+        type_name = data_class.__module__ + '.' + data_class.__name__
+        if _NPZ_OBJECT_TYPES.get(type_name) is not data_class:
+            raise TypeError("Type %s not data-serializable" % data_class)
+        return {"py/object": {
+            "type": type_name,
+            "attributes": {
+                name: _to_npz(value, arrays, key + '/' + name)
+                for name, value in data.__dict__.items()
+                if name not in WormSerializer._unsaved_attributes}}}
+    return serialize(data)
+
+
+def _restore_from_npz(dct, arrays):
+    """
+    Like restore, for the output of _to_npz.  arrays maps the keys of the
+    arrays to the arrays, e.g. the NpzFile they were saved to.
+
+    """
+    if "py/npz" in dct:
+        return arrays[dct["py/npz"]]
+    if "py/object" in dct:
+        data = dct["py/object"]
+        if data["type"] not in _NPZ_OBJECT_TYPES:
+            raise ValueError("Objects of type %s can't be loaded" %
+                             data["type"])
+        object_class = _NPZ_OBJECT_TYPES[data["type"]]
+        obj = object_class.__new__(object_class)
+        obj.__dict__.update(data["attributes"])
+        return obj
+    return restore(dct)
+
+
 def data_to_json(data):
     """
     """
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+HeterocardinalFrames: a list of frames with a varying number of points,
+stored as one flat array.
+
+"""
+
+import numpy as np
+
+from .. import utils
+
+
+class HeterocardinalFrames(object):
+    """
+    A "heterocardinal" skeleton, contour or widths, i.e. a list of n frames
+    where frame i is a numpy array of shape (2,ki) or (ki,), or None if the
+    frame is missing.
+
+    The frames are stored one after the other in a single array, so
+    indexing a frame returns a view rather than a copy.  It can be used
+    wherever a list of frames is expected.
+
+    Attributes
+    ----------
+    data : numpy array of shape (2,sum(ki)) or (sum(ki),)
+        The points of all of the frames, frame after frame.
+    offsets : int numpy array of shape (n+1,)
+        Frame i is data[..., offsets[i]:offsets[i+1]]
+    is_valid : bool numpy array of shape (n,)
+        False for the missing frames, which have no points.
+
+    """
+
+    def __init__(self, data, offsets, is_valid):
+        self.data = data
+        self.offsets = offsets
+        self.is_valid = is_valid
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Factory method taking a list of frames, with None for the missing
+        frames.  A HeterocardinalFrames instance is returned as is.
+
+        """
+        if isinstance(frames, cls):
+            return frames
+
+        frames = list(frames)
+        is_valid = np.array([f is not None for f in frames], dtype=bool)
+        valid_frames = [np.asarray(f) for f in frames if f is not None]
+
+        n_points = np.zeros(len(frames), dtype=int)
+        n_points[is_valid] = [f.shape[-1] for f in valid_frames]
+        offsets = np.concatenate(([0], np.cumsum(n_points)))
+
+        if len(valid_frames) == 0:
+            # Without any frames to look at, assume (2,ki) frames
+            data = np.zeros((2, 0))
+        else:
+            data = np.concatenate(valid_frames, axis=-1)
+
+        return cls(data, offsets, is_valid)
+
+    @classmethod
+    def from_homocardinal(cls, homocardinal_property, is_valid=None):
+        """
+        Factory method taking frames that all have the same number of points
+
+        Parameters
+        ----------
+        homocardinal_property : numpy array of shape (k,2,n) or (k,n)
+        is_valid : bool numpy array of shape (n,) (optional)
+            If not given, frames are missing if their first value is NaN.
+
+        """
+        homocardinal_property = np.asarray(homocardinal_property)
+        n_points_per_frame, n_frames = \
+            homocardinal_property.shape[0], homocardinal_property.shape[-1]
+
+        if is_valid is None:
+            is_valid = ~np.isnan(homocardinal_property[0, ...].reshape(
+                -1, n_frames)[0])
+
+        # Go from (k,2,n) to (2,n,k) so that the points of each frame
+        # are next to each other
+        by_frame = np.moveaxis(homocardinal_property, 0, -1)[..., is_valid, :]
+        data = by_frame.reshape(by_frame.shape[:-2] + (-1,))
+
+        offsets = np.concatenate(
+            ([0], np.cumsum(n_points_per_frame * is_valid)))
+
+        return cls(data, offsets, is_valid)
+
+    @property
+    def n_points(self):
+        """
+        The number of points in each frame, 0 for the missing frames.
+
+        """
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return self.is_valid.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return HeterocardinalFrames.from_frames(
+                    [self[i] for i in range(start, stop, step)])
+
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop + 1]
+            return HeterocardinalFrames(
+                self.data[..., offsets[0]:offsets[-1]],
+                offsets - offsets[0],
+                self.is_valid[start:stop])
+
+        if not self.is_valid[index]:
+            return None
+
+        if index < 0:
+            index += len(self)
+
+        return self.data[..., self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __repr__(self):
+        return utils.print_object(self)
+
+    def to_list(self):
+        """
+        Return the frames as a list, with None for the missing frames.
+
+        """
+        return list(self)
+
+    def pad(self, n_points=None):
+        """
+        Stack the frames into one NaN-padded array.
+
+        Same as WormParserHelpers.pad_frames, without having to look at
+        each frame to find its number of points.
+
+        Parameters
+        ----------
+        n_points : numpy array of shape (n,) (optional)
+            The number of points to take from each frame.  If not given,
+            all the points of each frame are taken.
+
+        Returns
+        -------
+        (padded, n_points): tuple
+            padded: numpy array of shape (k_max,2,n) or (k_max,n)
+            n_points: integer numpy array of shape (n,)
+
+        """
+        if n_points is None:
+            n_points = self.n_points
+
+        n_frames = len(self)
+        k_max = max(np.max(n_points), 1) if n_frames > 0 else 1
+
+        # The padded array is stored frame by frame in memory, as in
+        # pad_frames
+        padded_by_frame = np.full((n_frames,) + self.data.shape[:-1] +
+                                  (k_max,), np.NaN)
+
+        # Copying frame by frame is faster than a single fancy indexed copy
+        # of all of the points, as each frame is a contiguous block
+        for iFrame in np.flatnonzero(n_points):
+            start = self.offsets[iFrame]
+            padded_by_frame[iFrame, ..., :n_points[iFrame]] = \
+                self.data[..., start:start + n_points[iFrame]]
+
+        return padded_by_frame.T, n_points
@@ -11,9 +11,13 @@ import collections
 import copy
 import warnings
 import os
+import json
+import multiprocessing
+import multiprocessing.sharedctypes
 import matplotlib.pyplot as plt
 
 from .. import config, utils
+from . import basic_worm
 from .basic_worm import WormPartition
 from .basic_worm import BasicWorm
 from .pre_features import WormParsing
@@ -64,7 +68,8 @@ class NormalizedWorm(WormPartition):
                 setattr(self, a, copy.deepcopy(getattr(other, a)))
 
     @classmethod
-    def from_BasicWorm_factory(cls, basic_worm, frames_to_plot_widths=[]):
+    def from_BasicWorm_factory(cls, basic_worm, frames_to_plot_widths=[],
+                               batch_mode=False, n_workers=1):
         """
         Factory classmethod for creating a normalized worm with a basic_worm
         as input.  This requires calculating all the "pre-features" of
@@ -78,6 +83,14 @@ class NormalizedWorm(WormPartition):
         frames_to_plot_widths: list of ints
             Optional list of frames to plot, to show exactly how the
             widths and skeleton were calculated.
+        batch_mode: bool
+            If True, the skeleton and widths are calculated for all frames
+            at once rather than frame by frame (much faster).
+        n_workers: int
+            The number of processes to use.  If more than 1, the frames
+            are split into chunks which are processed in parallel (the
+            calculations are frame by frame, so chunks are independent).
+            Plotting frames is then not supported.
 
         Returns
         -----------
@@ -91,32 +104,19 @@ class NormalizedWorm(WormPartition):
         nw.video_info = bw.video_info
 
         if bw.h_ventral_contour is not None:
-            # 1. Derive skeleton and widths from contour
-            nw.widths, h_skeleton = \
-                WormParsing.compute_skeleton_and_widths(bw.h_ventral_contour,
-                                                        bw.h_dorsal_contour,
-                                                        frames_to_plot_widths)
-
-            # 2. Calculate the angles along the skeleton for each frame
-            nw.angles = WormParsing.compute_angles(h_skeleton)
-
-            # 3. Normalize the skeleton, widths and contour to 49 points
-            #    per frame
-            nw.skeleton = WormParserHelpers.\
-                normalize_all_frames_xy(h_skeleton,
-                                        config.N_POINTS_NORMALIZED)
-
-            nw.widths = WormParserHelpers.\
-                normalize_all_frames(nw.widths, h_skeleton,
-                                     config.N_POINTS_NORMALIZED)
-
-            nw.ventral_contour = WormParserHelpers.\
-                normalize_all_frames_xy(bw.h_ventral_contour,
-                                        config.N_POINTS_NORMALIZED)
+            # Steps 1 to 3 are done frame by frame
+            if n_workers > 1:
+                normalized = _normalize_contour_in_parallel(
+                    bw.h_ventral_contour, bw.h_dorsal_contour,
+                    batch_mode, n_workers)
+            else:
+                normalized = _normalize_contour(bw.h_ventral_contour,
+                                                bw.h_dorsal_contour,
+                                                frames_to_plot_widths,
+                                                batch_mode)
 
-            nw.dorsal_contour = WormParserHelpers.\
-                normalize_all_frames_xy(bw.h_dorsal_contour,
-                                        config.N_POINTS_NORMALIZED)
+            for key, value in normalized.items():
+                setattr(nw, key, value)
 
             # 4. Calculate area for each frame
             nw.area = WormParsing.compute_area(nw.contour)
@@ -265,6 +265,77 @@ class NormalizedWorm(WormPartition):
 
             return nw
 
+    def save(self, path):
+        """
+        Save to a directory, which can be opened with NormalizedWorm.open
+
+        Each numpy array (skeleton, widths, angles, the frame codes of
+        video_info, etc.) is saved in its own .npy file so that it can be
+        memory-mapped when opened.  The other attributes are described in
+        a small JSON file, as in WormSerializer.save.
+
+        Each file is written to a temporary file first and then moved in
+        place, so a worm can be saved to the directory it was opened from,
+        and the JSON file is written last so that a failed save doesn't
+        leave a half-written worm.
+
+        Parameters
+        ----------
+        path : str
+            The directory, which is created if it doesn't exist.  Files
+            from a previous save are overwritten.
+
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        arrays = {}
+        metadata = {'attributes': {key: basic_worm._to_npz(value, arrays, key)
+                                   for key, value in vars(self).items()}}
+        metadata['array_keys'] = sorted(arrays)
+
+        for key, value in arrays.items():
+            utils.write_file_atomically(
+                os.path.join(path, _get_array_file_name(key)),
+                lambda f: np.save(f, value))
+
+        utils.write_file_atomically(
+            os.path.join(path, 'normalized_worm.json'),
+            lambda f: f.write(json.dumps(metadata).encode('utf-8')))
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        Open a NormalizedWorm saved with NormalizedWorm.save
+
+        Parameters
+        ----------
+        path : str
+            The directory
+        mmap : bool (default True)
+            If True the arrays are memory-mapped, so only the parts that
+            are used are read from disk.  They are copy-on-write, so they
+            can still be modified without changing the files.
+
+        """
+        with open(os.path.join(path, 'normalized_worm.json'), 'r') as f:
+            metadata = json.load(f)
+
+        arrays = {}
+        for key in metadata['array_keys']:
+            value = np.load(os.path.join(path, _get_array_file_name(key)),
+                            mmap_mode='c' if mmap else None)
+            arrays[key] = value.view(np.ndarray)
+
+        nw = cls()
+        for key, value in metadata['attributes'].items():
+            setattr(nw, key, json.loads(
+                json.dumps(value),
+                object_hook=lambda dct: basic_worm._restore_from_npz(
+                    dct, arrays)))
+
+        return nw
+
     def get_BasicWorm(self):
         """
         Return an instance of NormalizedSkeletonAndContour containing this
@@ -687,3 +758,144 @@ class NormalizedWorm(WormPartition):
                     x, y), xytext=xytext, textcoords='offset points', ha='right', va='bottom', bbox=dict(
                     boxstyle='round,pad=0.5', fc='yellow', alpha=0.5), arrowprops=dict(
                     arrowstyle='->', connectionstyle='arc3,rad=0'))  # , xytext=(0,0))
+
+
+def _get_array_file_name(key):
+    """
+    The .npy file of an array saved by NormalizedWorm.save, e.g.
+    'video_info.frame_code.npy' for the array key 'video_info/frame_code'
+
+    """
+    return key.replace('/', '.') + '.npy'
+
+
+#%%
+# The shapes of the normalized measurements calculated by
+# _normalize_contour, given the number of frames
+_NORMALIZED_SHAPES = collections.OrderedDict([
+    ('skeleton', lambda n: (config.N_POINTS_NORMALIZED, 2, n)),
+    ('ventral_contour', lambda n: (config.N_POINTS_NORMALIZED, 2, n)),
+    ('dorsal_contour', lambda n: (config.N_POINTS_NORMALIZED, 2, n)),
+    ('angles', lambda n: (config.N_POINTS_NORMALIZED, n)),
+    ('widths', lambda n: (config.N_POINTS_NORMALIZED, n))])
+
+
+def _normalize_contour(h_ventral_contour, h_dorsal_contour,
+                       frames_to_plot_widths=[], batch_mode=False):
+    """
+    Calculate the normalized skeleton, contour, angles and widths from a
+    heterocardinal contour.
+
+    Used by NormalizedWorm.from_BasicWorm_factory.  Every frame is
+    processed independently of the others.
+
+    Returns
+    -----------
+    dict
+        Keyed as _NORMALIZED_SHAPES, with numpy arrays of those shapes
+
+    """
+    # 1. Derive skeleton and widths from contour
+    h_widths, h_skeleton = \
+        WormParsing.compute_skeleton_and_widths(h_ventral_contour,
+                                                h_dorsal_contour,
+                                                frames_to_plot_widths,
+                                                batch_mode)
+
+    # 2. Calculate the angles along the skeleton for each frame
+    angles = WormParsing.compute_angles(h_skeleton)
+
+    # 3. Normalize the skeleton, widths and contour to 49 points
+    #    per frame
+    skeleton = WormParserHelpers.\
+        normalize_all_frames_xy(h_skeleton,
+                                config.N_POINTS_NORMALIZED)
+
+    widths = WormParserHelpers.\
+        normalize_all_frames(h_widths, h_skeleton,
+                             config.N_POINTS_NORMALIZED)
+
+    ventral_contour = WormParserHelpers.\
+        normalize_all_frames_xy(h_ventral_contour,
+                                config.N_POINTS_NORMALIZED)
+
+    dorsal_contour = WormParserHelpers.\
+        normalize_all_frames_xy(h_dorsal_contour,
+                                config.N_POINTS_NORMALIZED)
+
+    return {'skeleton': skeleton,
+            'ventral_contour': ventral_contour,
+            'dorsal_contour': dorsal_contour,
+            'angles': angles,
+            'widths': widths}
+
+
+# The shared output arrays, as seen by a worker process
+_shared_outputs = {}
+
+
+def _init_worker(shared_arrays, num_frames):
+    """
+    Pool initializer: wrap the shared memory in numpy arrays.
+
+    """
+    for key, shared_array in shared_arrays.items():
+        _shared_outputs[key] = np.frombuffer(shared_array).reshape(
+            _NORMALIZED_SHAPES[key](num_frames))
+
+
+def _normalize_chunk(args):
+    """
+    Worker process task: normalize frames start:stop, writing the results
+    directly into the shared output arrays.
+
+    """
+    start, stop, h_ventral_contour, h_dorsal_contour, batch_mode = args
+
+    normalized = _normalize_contour(h_ventral_contour, h_dorsal_contour,
+                                    batch_mode=batch_mode)
+
+    for key, value in normalized.items():
+        _shared_outputs[key][..., start:stop] = value
+
+
+def _normalize_contour_in_parallel(h_ventral_contour, h_dorsal_contour,
+                                   batch_mode, n_workers):
+    """
+    Same as _normalize_contour, but split into frame chunks which are
+    processed by a pool of n_workers processes.
+
+    The outputs are allocated in shared memory so the workers can write
+    their chunks in place, rather than sending them back to be stitched
+    together.
+
+    """
+    num_frames = len(h_ventral_contour)
+
+    shared_arrays = collections.OrderedDict()
+    for key, get_shape in _NORMALIZED_SHAPES.items():
+        shared_arrays[key] = multiprocessing.sharedctypes.RawArray(
+            'd', int(np.prod(get_shape(num_frames))))
+
+    # A few chunks per worker, so that a slow chunk doesn't hold up the
+    # others too much
+    num_chunks = min(num_frames, 4 * n_workers)
+    chunk_edges = np.linspace(0, num_frames, num_chunks + 1).astype(int)
+
+    tasks = [(start, stop,
+              h_ventral_contour[start:stop], h_dorsal_contour[start:stop],
+              batch_mode)
+             for start, stop in zip(chunk_edges[:-1], chunk_edges[1:])
+             if stop > start]
+
+    pool = multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                initargs=(shared_arrays, num_frames))
+    try:
+        pool.map(_normalize_chunk, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    return {key: np.frombuffer(shared_array).reshape(
+        _NORMALIZED_SHAPES[key](num_frames))
+        for key, shared_array in shared_arrays.items()}
@@ -45,6 +45,7 @@ import numpy as np
 from .. import config, utils
 from .skeleton_calculator1 import SkeletonCalculatorType1
 from .pre_features_helpers import WormParserHelpers
+from .heterocardinal_frames import HeterocardinalFrames
 
 #%%
 
@@ -62,7 +63,8 @@ class WormParsing(object):
     @staticmethod
     def compute_skeleton_and_widths(h_ventral_contour,
                                     h_dorsal_contour,
-                                    frames_to_plot=[]):
+                                    frames_to_plot=[],
+                                    batch_mode=False):
         """
         Compute widths and a heterocardinal skeleton from a heterocardinal
         contour.
@@ -75,10 +77,13 @@ class WormParsing(object):
         frames_to_plot: list of ints
             Optional list of frames to plot, to show exactly how the
             widths and skeleton were calculated.
+        batch_mode: bool
+            If True, process all frames at once rather than frame by frame.
+            This is much faster but plotting frames is not supported.
 
         Returns
         -------------------------
-        (h_widths, h_skeleton): tuple
+        (h_widths, h_skeleton): tuple of HeterocardinalFrames
             h_widths : the heterocardinal widths, frame by frame
             h_skeleton : the heterocardinal skeleton, frame by frame.
 
@@ -89,13 +94,20 @@ class WormParsing(object):
         alternative algorithms so this may become the place we swap them in.
 
         """
-        (h_widths, h_skeleton) = \
-            SkeletonCalculatorType1.compute_skeleton_and_widths(
-            h_ventral_contour,
-            h_dorsal_contour,
-            frames_to_plot=[])
-
-        return (h_widths, h_skeleton)
+        if batch_mode:
+            (h_widths, h_skeleton) = \
+                SkeletonCalculatorType1.compute_skeleton_and_widths_batch(
+                h_ventral_contour,
+                h_dorsal_contour)
+        else:
+            (h_widths, h_skeleton) = \
+                SkeletonCalculatorType1.compute_skeleton_and_widths(
+                h_ventral_contour,
+                h_dorsal_contour,
+                frames_to_plot=[])
+
+        return (HeterocardinalFrames.from_frames(h_widths),
+                HeterocardinalFrames.from_frames(h_skeleton))
 
     #%%
     @staticmethod
@@ -151,61 +163,65 @@ class WormParsing(object):
         TODO: sign these angles using ventral_mode ?? - @MichaelCurrie
 
         """
-        temp_angle_list = []  # TODO: pre-allocate the space we need
-
-        for frame_index, cur_skeleton in enumerate(h_skeleton):
-            if cur_skeleton is None:
-                temp_angle_list.append([])
-            else:
-                sx = cur_skeleton[0, :]
-                sy = cur_skeleton[1, :]
-                cur_skeleton2 = np.rollaxis(cur_skeleton, 1)
-                cc = WormParserHelpers.chain_code_lengths_cum_sum(
-                    cur_skeleton2)
-
-                # This is from the old code
-                edge_length = cc[-1] / 12
-
-                # We want all vertices to be defined, and if we look starting
-                # at the left_I for a vertex, rather than vertex for left and
-                # right then we could miss all middle points on worms being
-                # vertices
-
-                left_lengths = cc - edge_length
-                right_lengths = cc + edge_length
-
-                valid_vertices_I = utils.find((left_lengths > cc[0]) &
-                                              (right_lengths < cc[-1]))
-
-                left_lengths = left_lengths[valid_vertices_I]
-                right_lengths = right_lengths[valid_vertices_I]
-
-                left_x = np.interp(left_lengths, cc, sx)
-                left_y = np.interp(left_lengths, cc, sy)
-
-                right_x = np.interp(right_lengths, cc, sx)
-                right_y = np.interp(right_lengths, cc, sy)
-
-                d2_y = sy[valid_vertices_I] - right_y
-                d2_x = sx[valid_vertices_I] - right_x
-                d1_y = left_y - sy[valid_vertices_I]
-                d1_x = left_x - sx[valid_vertices_I]
-
-                frame_angles = np.arctan2(d2_y, d2_x) - np.arctan2(d1_y, d1_x)
-
-                frame_angles[frame_angles > np.pi] -= 2 * np.pi
-                frame_angles[frame_angles < -np.pi] += 2 * np.pi
-
-                # Convert to degrees
-                frame_angles *= 180 / np.pi
-
-                all_frame_angles = np.full_like(cc, np.NaN)
-                all_frame_angles[valid_vertices_I] = frame_angles
-
-                temp_angle_list.append(all_frame_angles)
-
-        return WormParserHelpers.normalize_all_frames(
-            temp_angle_list, h_skeleton, config.N_POINTS_NORMALIZED)
+        # All frames are handled at once, on the NaN-padded skeleton.
+        # Each frame is a row of the arrays below.
+        skeleton, n_points = WormParserHelpers.pad_frames(h_skeleton)
+        frame_I = np.flatnonzero(n_points > 0)
+        last_I = n_points[frame_I] - 1
+
+        if frame_I.size == 0:
+            return np.full([config.N_POINTS_NORMALIZED, len(n_points)],
+                           np.NaN)
+
+        sx = skeleton[:, 0, frame_I].T
+        sy = skeleton[:, 1, frame_I].T
+        cc = WormParserHelpers.chain_code_lengths_cum_sum_padded(
+            skeleton[:, :, frame_I], n_points[frame_I]).T
+        total_lengths = cc[np.arange(frame_I.size), last_I]
+
+        # This is from the old code
+        edge_length = total_lengths[:, None] / 12
+
+        # We want all vertices to be defined, and if we look starting
+        # at the left_I for a vertex, rather than vertex for left and
+        # right then we could miss all middle points on worms being
+        # vertices
+
+        left_lengths = cc - edge_length
+        right_lengths = cc + edge_length
+
+        with np.errstate(invalid='ignore'):
+            is_valid_vertex = (left_lengths > 0) & \
+                (right_lengths < total_lengths[:, None])
+
+        # The left and right points of all vertices are interpolated
+        # together
+        x, y = WormParserHelpers.interp_padded_frames(
+            np.concatenate([left_lengths, right_lengths], axis=1),
+            cc, last_I, [sx, sy])
+        left_x, right_x = np.split(x, 2, axis=1)
+        left_y, right_y = np.split(y, 2, axis=1)
+
+        d2_y = sy - right_y
+        d2_x = sx - right_x
+        d1_y = left_y - sy
+        d1_x = left_x - sx
+
+        angles = np.full([len(n_points), skeleton.shape[0]], np.NaN)
+        with np.errstate(invalid='ignore'):
+            frame_angles = np.arctan2(d2_y, d2_x) - np.arctan2(d1_y, d1_x)
+
+            frame_angles[frame_angles > np.pi] -= 2 * np.pi
+            frame_angles[frame_angles < -np.pi] += 2 * np.pi
+
+        # Convert to degrees
+        frame_angles *= 180 / np.pi
+
+        frame_angles[~is_valid_vertex] = np.NaN
+        angles[frame_I] = frame_angles
+
+        return WormParserHelpers.normalize_padded_frames(
+            skeleton, n_points, config.N_POINTS_NORMALIZED, angles.T)
 
     #%%
     @staticmethod
@@ -6,6 +6,8 @@ Created on Fri Jul  3 17:15:41 2015
 """
 import numpy as np
 
+from .heterocardinal_frames import HeterocardinalFrames
+
 
 class WormParserHelpers:
 
@@ -90,6 +92,250 @@ class WormParserHelpers:
 
             return np.cumsum(distances)
 
+    #%%
+    @staticmethod
+    def pad_frames(heterocardinal_property, n_points=None):
+        """
+        Stack a "heterocardinal" list of frames into one NaN-padded array.
+
+        Parameters
+        --------------
+        heterocardinal_property: list of numpy arrays
+            the outermost dimension, that of the lists, has length n
+            the numpy arrays are of shape (2,ki) or (ki,).  Missing frames
+            are identified by None.  Can also be a HeterocardinalFrames
+            instance.
+        n_points: numpy array of shape (n,) (optional)
+            The number of points to take from each frame.  If not given,
+            this is the length of each frame, or 0 for missing frames.
+            Frames with 0 points are left as NaN.
+
+        Returns
+        --------------
+        (padded, n_points): tuple
+            padded: numpy array of shape (k_max,2,n) or (k_max,n)
+            n_points: integer numpy array of shape (n,)
+
+        """
+        if isinstance(heterocardinal_property, HeterocardinalFrames):
+            return heterocardinal_property.pad(n_points)
+
+        if n_points is None:
+            n_points = np.array([0 if f is None else np.shape(f)[-1]
+                                 for f in heterocardinal_property],
+                                dtype=int)
+
+        # Without any frames to look at, assume (2,ki) frames
+        frame_I = np.flatnonzero(n_points)
+        is_xy = frame_I.size == 0 or \
+            np.ndim(heterocardinal_property[frame_I[0]]) == 2
+        k_max = max(np.max(n_points), 1) if len(n_points) > 0 else 1
+
+        # The padded array is stored frame by frame in memory, since that
+        # is how all frames are filled and resampled, and returned as a
+        # (k_max,2,n) or (k_max,n) view
+        n_frames = len(n_points)
+        if is_xy:
+            padded_by_frame = np.full([n_frames, 2, k_max], np.NaN)
+        else:
+            padded_by_frame = np.full([n_frames, k_max], np.NaN)
+
+        for iFrame in frame_I:
+            padded_by_frame[iFrame, ..., :n_points[iFrame]] = \
+                np.asarray(heterocardinal_property[iFrame])[
+                    ..., :n_points[iFrame]]
+
+        return padded_by_frame.T, n_points
+
+    #%%
+    @staticmethod
+    def chain_code_lengths_cum_sum_padded(xy, n_points):
+        """
+        Compute the Freeman 8-direction chain-code length for all frames at
+        once.  The batched equivalent of chain_code_lengths_cum_sum.
+
+        Parameters
+        ----------------
+        xy: numpy array of shape (k_max,2,n)
+            The NaN-padded skeleton or contour points
+        n_points: integer numpy array of shape (n,)
+            The number of points in each frame
+
+        Returns
+        ----------------
+        numpy array of shape (k_max,n)
+            The cumulative distance from the first point, with NaN past
+            the last point of each frame.
+
+        """
+        running_lengths = np.zeros(xy.shape[0:1] + xy.shape[2:])
+        running_lengths[1:] = np.cumsum(
+            WormParserHelpers.chain_code_lengths(xy), axis=0)
+        running_lengths[np.arange(xy.shape[0])[:, None] >=
+                        n_points[None, :]] = np.NaN
+
+        return running_lengths
+
+    #%%
+    @staticmethod
+    def normalize_padded_frames(xy, n_points, num_norm_points,
+                                prop_to_normalize=None):
+        """
+        Evenly resample all frames of a NaN-padded skeleton or contour (or
+        a property measured along it), in terms of chain code length.
+
+        This is the batched equivalent of normalize_parameter: rather than
+        calling np.interp frame by frame, one np.searchsorted call finds,
+        for every new point in every frame, the pair of old points it lies
+        between.
+
+        Parameters
+        --------------
+        xy: numpy array of shape (k_max,2,n)
+            The NaN-padded skeleton or contour points
+        n_points: integer numpy array of shape (n,)
+            The number of points in each frame.  Frames with 0 points
+            are left as NaN.
+        num_norm_points: int
+            The number of points to normalize to.
+        prop_to_normalize: numpy array of shape (k_max,n) (optional)
+            A property measured at the points of xy.  If not given, the
+            xy points themselves are normalized.
+
+        Returns
+        --------------
+        numpy array of shape (num_norm_points,2,n), or
+        (num_norm_points,n) if prop_to_normalize was given
+
+        """
+        k_max, n_frames = xy.shape[0], xy.shape[2]
+        frame_I = np.flatnonzero(n_points > 0)
+        last_I = n_points[frame_I] - 1
+
+        if prop_to_normalize is None:
+            normalized_data = np.full([num_norm_points, 2, n_frames],
+                                      np.NaN)
+        else:
+            normalized_data = np.full([num_norm_points, n_frames], np.NaN)
+
+        if frame_I.size == 0:
+            return normalized_data
+
+        # All the work below is done with one row per frame, i.e. with
+        # each frame contiguous in memory
+        xy_by_frame = np.transpose(xy, (2, 1, 0))[frame_I]
+
+        # Shape (n_valid, k_max)
+        running_lengths = WormParserHelpers.chain_code_lengths_cum_sum_padded(
+            xy_by_frame.T, n_points[frame_I]).T
+        total_lengths = running_lengths[np.arange(frame_I.size), last_I]
+
+        # Shape (n_valid, num_norm_points): the same values as
+        # np.linspace(running_lengths[0], running_lengths[-1],
+        #             num_norm_points) for each frame
+        new_lengths = np.arange(num_norm_points) * \
+            (total_lengths[:, None] / max(num_norm_points - 1, 1))
+        new_lengths[:, -1] = total_lengths
+
+        if prop_to_normalize is None:
+            values = [xy_by_frame[:, 0], xy_by_frame[:, 1]]
+        else:
+            values = [prop_to_normalize.T[frame_I]]
+        interpolated = WormParserHelpers.interp_padded_frames(
+            new_lengths, running_lengths, last_I, values)
+
+        if prop_to_normalize is None:
+            normalized_data[:, 0, frame_I] = interpolated[0].T
+            normalized_data[:, 1, frame_I] = interpolated[1].T
+        else:
+            normalized_data[:, frame_I] = interpolated[0].T
+
+        return normalized_data
+
+    #%%
+    @staticmethod
+    def interp_padded_frames(new_lengths, running_lengths, last_I, values):
+        """
+        np.interp, for many frames at once.
+
+        Each frame is placed in its own interval of the number line, so
+        that one np.searchsorted call finds, for every new point in every
+        frame, the pair of old points it lies between.  All arrays have
+        one row per frame.
+
+        Parameters
+        --------------
+        new_lengths: numpy array of shape (n_valid,m)
+            The points at which to interpolate, per frame
+        running_lengths: numpy array of shape (n_valid,k_max)
+            The increasing chain code lengths of each frame, NaN-padded
+            past the last point
+        last_I: integer numpy array of shape (n_valid,)
+            The index of the last point of each frame
+        values: list of numpy arrays of shape (n_valid,k_max)
+            The values, known at running_lengths, to interpolate
+
+        Returns
+        --------------
+        list of numpy arrays of shape (n_valid,m), one per entry of values.
+        As with np.interp, points outside of a frame take the value of
+        its first or last point.  Frames whose total length is not finite
+        (e.g. with a NaN point) are all NaN.
+
+        """
+        n_valid, k_max = running_lengths.shape
+        total_lengths = running_lengths[np.arange(n_valid), last_I]
+
+        # A NaN frame must not move the intervals of the other frames
+        with np.errstate(invalid='ignore'):
+            is_finite_frame = np.isfinite(total_lengths)
+        if np.any(is_finite_frame):
+            max_length = np.nanmax(total_lengths[is_finite_frame])
+        else:
+            max_length = 0.0
+
+        # Padding points are put after the last point of their frame
+        frame_offsets = np.arange(n_valid)[:, None] * (max_length + 2.0)
+        search_keys = running_lengths.copy()
+        search_keys[np.isnan(search_keys)] = max_length + 1.0
+        search_keys[~is_finite_frame] = max_length + 1.0
+        search_keys += frame_offsets
+
+        new_keys = new_lengths + frame_offsets
+        new_keys[np.isnan(new_keys)] = 0
+
+        # Like np.interp: the last old point at or before each new point
+        old_I = np.searchsorted(search_keys.ravel(), new_keys.ravel(),
+                                side='right').reshape(new_lengths.shape) - 1
+        old_I -= np.arange(n_valid)[:, None] * k_max
+        old_I = np.clip(old_I, 0, last_I[:, None])
+        next_I = np.minimum(old_I + 1, last_I[:, None])
+        is_last = old_I == last_I[:, None]
+        is_before_first = new_lengths < running_lengths[:, :1]
+
+        # Indices into the flattened (n_valid,k_max) arrays
+        row_start_I = np.arange(n_valid)[:, None] * k_max
+        old_I += row_start_I
+        next_I += row_start_I
+
+        x0 = running_lengths.take(old_I)
+        x1 = running_lengths.take(next_I)
+
+        interpolated = []
+        for cur_values in values:
+            y0 = cur_values.take(old_I)
+            y1 = cur_values.take(next_I)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                slope = (y1 - y0) / (x1 - x0)
+                cur_interpolated = slope * (new_lengths - x0) + y0
+            # At (or past) the ends np.interp takes the value as is
+            cur_interpolated[is_last] = y0[is_last]
+            cur_interpolated[is_before_first] = y0[is_before_first]
+            cur_interpolated[~is_finite_frame] = np.NaN
+            interpolated.append(cur_interpolated)
+
+        return interpolated
+
     #%%
     @staticmethod
     def normalize_all_frames_xy(heterocardinal_property, num_norm_points):
@@ -110,24 +356,10 @@ class WormParserHelpers:
         numpy array of shape (49,2,n)
 
         """
-        n_frames = len(heterocardinal_property)
-        normalized_data = np.full([num_norm_points, 2, n_frames],
-                                  np.NaN)
+        xy, n_points = WormParserHelpers.pad_frames(heterocardinal_property)
 
-        for iFrame, cur_frame_value in enumerate(heterocardinal_property):
-            if cur_frame_value is not None:
-                # We need cur_frame_value to have shape (k,2), not (2,k)
-                cur_frame_value2 = np.rollaxis(cur_frame_value, 1)
-                cc = WormParserHelpers.chain_code_lengths_cum_sum(
-                    cur_frame_value2)
-
-                # Normalize both the x and the y
-                normalized_data[:, 0, iFrame] = WormParserHelpers.normalize_parameter(
-                    cur_frame_value[0, :], cc, num_norm_points)
-                normalized_data[:, 1, iFrame] = WormParserHelpers.normalize_parameter(
-                    cur_frame_value[1, :], cc, num_norm_points)
-
-        return normalized_data
+        return WormParserHelpers.normalize_padded_frames(xy, n_points,
+                                                         num_norm_points)
 
     #%%
     @staticmethod
@@ -156,28 +388,12 @@ class WormParserHelpers:
         """
         assert(len(property_to_normalize) == len(xy_data))
 
-        # Create a blank array of shape (49,n)
-        normalized_data_shape = [num_norm_points, len(property_to_normalize)]
-        normalized_data = np.full(normalized_data_shape, np.NaN)
-
-        # Normalize one frame at a time
-        for frame_index, (cur_frame_value, cur_xy) in \
-                enumerate(zip(property_to_normalize, xy_data)):
-            if cur_xy is not None:
-                # We need cur_xy to have shape (k,2), not (2,k)
-                cur_xy_reshaped = np.rollaxis(cur_xy, axis=1)
-                running_lengths = WormParserHelpers.chain_code_lengths_cum_sum(
-                    cur_xy_reshaped)
-
-                # Normalize cur_frame_value over an evenly-spaced set of
-                # 49 values spread from running_lengths[0] to
-                #                       running_lengths[-1]
-                normalized_data[:, frame_index] = \
-                    WormParserHelpers.normalize_parameter(cur_frame_value,
-                                                          running_lengths,
-                                                          num_norm_points)
+        xy, n_points = WormParserHelpers.pad_frames(xy_data)
+        padded_property, _ = WormParserHelpers.pad_frames(
+            property_to_normalize, n_points)
 
-        return normalized_data
+        return WormParserHelpers.normalize_padded_frames(
+            xy, n_points, num_norm_points, padded_property)
 
     #%%
     @staticmethod
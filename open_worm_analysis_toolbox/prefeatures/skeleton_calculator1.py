@@ -25,7 +25,21 @@ class SkeletonCalculatorType1(object):
     The main method in this clas is compute_skeleton_and_widths. All other
     methods are just subfunctions of this main method.
 
+    compute_skeleton_and_widths_batch is an equivalent of the main method
+    that processes all frames at once rather than frame by frame.
+
     """
+    FRACTION_WORM_SMOOTH = 1.0 / 12.0
+    SMOOTHING_ORDER = 3
+    PERCENT_BACK_SEARCH = 0.3
+    PERCENT_FORWARD_SEARCH = 0.3
+    END_S1_WALK_PCT = 0.15
+
+    # Frames with fewer or more contour points than these are up- or
+    # down-sampled before we pair off the two sides of the contour
+    MIN_CONTOUR_POINTS = 49
+    MAX_CONTOUR_POINTS = 250
+
     #%%
     @staticmethod
     def compute_skeleton_and_widths(h_ventral_contour,
@@ -86,11 +100,12 @@ class SkeletonCalculatorType1(object):
         other sideremains still.
 
         """
-        FRACTION_WORM_SMOOTH = 1.0 / 12.0
-        SMOOTHING_ORDER = 3
-        PERCENT_BACK_SEARCH = 0.3
-        PERCENT_FORWARD_SEARCH = 0.3
-        END_S1_WALK_PCT = 0.15
+        FRACTION_WORM_SMOOTH = SkeletonCalculatorType1.FRACTION_WORM_SMOOTH
+        SMOOTHING_ORDER = SkeletonCalculatorType1.SMOOTHING_ORDER
+        PERCENT_BACK_SEARCH = SkeletonCalculatorType1.PERCENT_BACK_SEARCH
+        PERCENT_FORWARD_SEARCH = \
+            SkeletonCalculatorType1.PERCENT_FORWARD_SEARCH
+        END_S1_WALK_PCT = SkeletonCalculatorType1.END_S1_WALK_PCT
 
         num_frames = len(h_ventral_contour)  # == len(h_dorsal_contour)
 
@@ -328,6 +343,583 @@ class SkeletonCalculatorType1(object):
         # print(profile_times)
         return (h_widths, h_skeleton)
 
+    #%%
+    @staticmethod
+    def compute_skeleton_and_widths_batch(h_ventral_contour,
+                                          h_dorsal_contour,
+                                          frames_per_chunk=32):
+        """
+        Compute widths and a heterocardinal skeleton from a heterocardinal
+        contour, processing all frames at once.
+
+        This gives the same results as compute_skeleton_and_widths, but
+        rather than looping over the frames in Python, the contours are
+        padded with NaN into arrays of shape (n_frames, 2, k_max) and the
+        smoothing, normal vectors, search bounds, projection matching and
+        the walk at the ends are computed for all frames together.
+
+        Like compute_skeleton_and_widths, the contours passed in are
+        smoothed in place.
+
+        Parameters
+        -------------------------
+        h_ventral_contour: list of numpy arrays.
+            Each frame is an entry in the list.
+        h_dorsal_contour:
+        frames_per_chunk: int
+            The intermediate arrays have shape
+            (n_frames, k1, search window length), so to bound memory use
+            the frames are processed this many at a time.
+
+        Returns
+        -------------------------
+        (h_widths, h_skeleton): tuple
+            h_widths : the heterocardinal widths, frame by frame
+            h_skeleton : the heterocardinal skeleton, frame by frame.
+
+        """
+        num_frames = len(h_ventral_contour)  # == len(h_dorsal_contour)
+
+        h_skeleton = [None] * num_frames
+        h_widths = [None] * num_frames
+
+        frame_indices = [frame_index for frame_index, s1 in
+                         enumerate(h_ventral_contour) if s1 is not None]
+
+        if len(frame_indices) == 0:
+            return (h_widths, h_skeleton)
+
+        s1_list = [h_ventral_contour[i] for i in frame_indices]
+        s2_list = [h_dorsal_contour[i] for i in frame_indices]
+
+        # Smoothing of the contour
+        #------------------------------------------
+        SkeletonCalculatorType1.h__smoothFrames(s1_list)
+        SkeletonCalculatorType1.h__smoothFrames(s2_list)
+
+        # UP/DOWNSAMPLE if number of points is not betwen 49 and 250.
+        # NOTE: For side 2 the frame-by-frame code decides how many points
+        # to use based on side 1, which is never below 49 by that point,
+        # so side 2 always gets 200 points.
+        s1_list = SkeletonCalculatorType1.h__resampleFrames(s1_list, 75)
+        s2_list = SkeletonCalculatorType1.h__resampleFrames(s2_list, 200)
+
+        for start in range(0, len(frame_indices), frames_per_chunk):
+            stop = start + frames_per_chunk
+            # Comparisons against the NaN padding are expected
+            with np.errstate(invalid='ignore', divide='ignore'):
+                chunk_widths, chunk_skeleton = \
+                    SkeletonCalculatorType1.h__computeChunk(
+                        s1_list[start:stop], s2_list[start:stop])
+
+            for frame_index, widths, skeleton in \
+                    zip(frame_indices[start:stop],
+                        chunk_widths, chunk_skeleton):
+                h_widths[frame_index] = widths
+                h_skeleton[frame_index] = skeleton
+
+        return (h_widths, h_skeleton)
+
+    #%%
+    @staticmethod
+    def h__smoothFrames(frames):
+        """
+        Apply the Savitzky-Golay filter to each frame of one side of the
+        contour, in place.
+
+        The filter width depends on the number of points in the frame, so
+        frames are grouped by their number of points and each group is
+        filtered with a single call.
+
+        Parameters
+        ---------------
+        frames: list of numpy arrays of shape (2,ki)
+
+        """
+        frame_lengths = np.array([f.shape[1] for f in frames])
+
+        for n_points in np.unique(frame_lengths):
+            group_I = np.flatnonzero(frame_lengths == n_points)
+            filter_width = utils.round_to_odd(
+                n_points * SkeletonCalculatorType1.FRACTION_WORM_SMOOTH)
+
+            smoothed = sgolay(np.array([frames[i] for i in group_I]),
+                              window_length=int(filter_width),
+                              polyorder=SkeletonCalculatorType1.
+                              SMOOTHING_ORDER,
+                              axis=2)
+
+            for i, smoothed_frame in zip(group_I, smoothed):
+                frames[i][:] = smoothed_frame
+
+    #%%
+    @staticmethod
+    def h__resampleFrames(frames, num_points_if_too_few):
+        """
+        Resample frames having too few or too many contour points.
+
+        Parameters
+        ---------------
+        frames: list of numpy arrays of shape (2,ki)
+        num_points_if_too_few: int
+            The number of points to upsample to for frames with fewer than
+            MIN_CONTOUR_POINTS points.  Frames with more than
+            MAX_CONTOUR_POINTS points are downsampled to 200 points.
+
+        Returns
+        ---------------
+        A new list of numpy arrays of shape (2,ki)
+
+        """
+        frames = list(frames)
+        frame_lengths = np.array([f.shape[1] for f in frames])
+
+        for num_norm_points, group_I in \
+                ((num_points_if_too_few, np.flatnonzero(
+                    frame_lengths < SkeletonCalculatorType1.
+                    MIN_CONTOUR_POINTS)),
+                 (200, np.flatnonzero(
+                     frame_lengths > SkeletonCalculatorType1.
+                     MAX_CONTOUR_POINTS))):
+            if group_I.size == 0:
+                continue
+
+            # Shape (k,2,n_group)
+            resampled = WormParserHelpers.normalize_all_frames_xy(
+                [frames[i] for i in group_I], num_norm_points=num_norm_points)
+
+            for j, i in enumerate(group_I):
+                frames[i] = resampled[:, :, j].T
+
+        return frames
+
+    #%%
+    @staticmethod
+    def h__padFrames(frames):
+        """
+        Stack a list of arrays of shape (2,ki) into one NaN-padded array.
+
+        Returns
+        ---------------
+        (padded, n_points): tuple
+            padded: numpy array of shape (n_frames, 2, k_max)
+            n_points: integer numpy array of shape (n_frames,)
+
+        """
+        n_points = np.array([f.shape[1] for f in frames])
+        padded = np.full((len(frames), 2, n_points.max()), np.NaN)
+
+        for i, f in enumerate(frames):
+            padded[i, :, :n_points[i]] = f
+
+        return padded, n_points
+
+    #%%
+    @staticmethod
+    def h__computeChunk(s1_list, s2_list):
+        """
+        Pair off the two (already smoothed) contour sides for a group of
+        frames, and compute the skeleton and widths from these pairs.
+
+        This is the batched equivalent of everything in
+        compute_skeleton_and_widths that follows the resampling step.
+
+        Parameters
+        ---------------
+        s1_list: list of numpy arrays of shape (2,ki)
+        s2_list: list of numpy arrays of shape (2,ji)
+
+        Returns
+        ---------------
+        (widths, skeletons): tuple of lists, one entry per frame
+
+        """
+        s1, n1 = SkeletonCalculatorType1.h__padFrames(s1_list)
+        s2, n2 = SkeletonCalculatorType1.h__padFrames(s2_list)
+        rows = np.arange(s1.shape[0])
+
+        # NOTE: Rather than building the (k1, k2) lookup tables of
+        # distances across the worm for every frame, distances are
+        # computed only where they are needed: within each point's search
+        # window and along the walks at the ends.
+
+        # Determine search bounds for possible "projection pairs"
+        #------------------------------------------------
+        left_indices, right_indices = \
+            SkeletonCalculatorType1.h__getBoundsBatch(
+                n1, n2, s1.shape[2],
+                SkeletonCalculatorType1.PERCENT_BACK_SEARCH,
+                SkeletonCalculatorType1.PERCENT_FORWARD_SEARCH)
+
+        # For each point on side 1, calculate normalized orthogonal values
+        norm_x, norm_y = \
+            SkeletonCalculatorType1.h__computeNormalVectorsBatch(s1, n1)
+
+        # For each point on side 1, find which side 2 the point pairs with
+        match_I1 = SkeletonCalculatorType1.h__getMatchesBatch(
+            s1, s2, n1, n2, norm_x, norm_y, left_indices, right_indices)
+
+        # Pair off the points from one contour to the other
+        keep_mask = SkeletonCalculatorType1.h__updateEndsByWalkingBatch(
+            match_I1, s1, s2, n1, n2,
+            SkeletonCalculatorType1.END_S1_WALK_PCT)
+
+        # Compact the kept pairs to the start of each row
+        rows_2d = rows[:, None]
+        I_1, n_kept = SkeletonCalculatorType1.h__compactRows(keep_mask)
+        I_2 = match_I1[rows_2d, I_1]
+
+        # We're looking to the left and to the right to ensure that
+        # things are ordered
+        point_I = np.arange(I_2.shape[1])
+        is_good = np.ones(I_2.shape, dtype=bool)
+        #                    current is before next
+        is_good[:, 1:-1] = (I_2[:, 1:-1] <= I_2[:, 2:]) & \
+            (I_2[:, 1:-1] >= I_2[:, :-2])  # current after previous
+        is_good[point_I[None, :] >= n_kept[:, None] - 1] = True
+        is_good &= point_I[None, :] < n_kept[:, None]
+
+        # Filter out invalid entries
+        good_I, n_kept = SkeletonCalculatorType1.h__compactRows(is_good)
+        I_1 = I_1[rows_2d, good_I]
+        I_2 = I_2[rows_2d, good_I]
+
+        # Create the skeleton sides
+        side1 = s1[rows_2d, :, I_1]
+        side2 = s2[rows_2d, :, I_2]
+        d_sides = side2 - side1
+        # The widths are simply the distance between the sides
+        widths = np.sqrt(d_sides[:, :, 0] * d_sides[:, :, 0] +
+                         d_sides[:, :, 1] * d_sides[:, :, 1])
+        # The skeleton is simply the midpoint between the sides
+        # (shape (n_frames, 2, k) after the transpose)
+        skeletons = np.transpose((side1 + side2) / 2, (0, 2, 1))
+
+        return ([widths[i, :n_kept[i]] for i in rows],
+                [skeletons[i, :, :n_kept[i]] for i in rows])
+
+    #%%
+    @staticmethod
+    def h__compactRows(mask):
+        """
+        For each row, get the column indices of the True entries of mask,
+        in order, at the start of the row.
+
+        Parameters
+        ---------------
+        mask: boolean numpy array of shape (n_frames, k)
+
+        Returns
+        ---------------
+        (order, n_selected): tuple
+            order: integer numpy array of shape (n_frames, k).  Only the
+                first n_selected[i] entries of row i are meaningful.
+            n_selected: integer numpy array of shape (n_frames,)
+
+        """
+        # A stable sort puts the True entries first, in their original order
+        order = np.argsort(~mask, axis=1, kind='mergesort')
+
+        return order, mask.sum(axis=1)
+
+    #%%
+    @staticmethod
+    def h__getBoundsBatch(n1, n2, k1_max,
+                          percent_left_search, percent_right_search):
+        """
+        Batched equivalent of h__getBounds.
+
+        Parameters
+        ---------------
+        n1: integer numpy array of shape (n_frames,)
+            number of points along one side of the contour
+        n2: integer numpy array of shape (n_frames,)
+            number of points along the other side of the contour
+        k1_max: int
+            The padded length of side 1
+        percent_left_search: float
+            percent to search backward
+        percent_right_search: float
+            percent to search forward
+
+        Returns
+        ---------------
+        (start_indices, stop_indices): Two integer numpy arrays of shape
+            (n_frames, k1_max).  Entries beyond n1 in a row are meaningless.
+
+        """
+        point_I = np.arange(k1_max)[None, :]
+        # The same values as np.linspace(0, 1, n1) for each frame
+        percentiles = point_I * (1.0 / (n1[:, None] - 1))
+        percentiles[point_I >= n1[:, None] - 1] = 1
+
+        start_indices = np.floor((percentiles - percent_left_search) *
+                                 n2[:, None])
+        stop_indices = np.ceil((percentiles + percent_right_search) *
+                               n2[:, None])
+        # Truncate any indices pointing outside the range between 0 and n2-1
+        start_indices[start_indices < 0] = 0
+        stop_indices = np.minimum(stop_indices, n2[:, None] - 1)
+
+        return start_indices.astype(int), stop_indices.astype(int)
+
+    #%%
+    @staticmethod
+    def h__computeNormalVectorsBatch(s, n_points):
+        """
+        Batched equivalent of utils.compute_normal_vectors, for padded
+        curves of shape (n_frames, 2, k_max) having n_points[i] points
+        in frame i.
+
+        """
+        rows = np.arange(s.shape[0])
+        last_I = n_points - 1
+
+        # np.gradient, but with the last edge at a different place per frame
+        gradient = np.empty_like(s)
+        gradient[:, :, 1:-1] = (s[:, :, 2:] - s[:, :, :-2]) / 2.0
+        gradient[:, :, 0] = s[:, :, 1] - s[:, :, 0]
+        gradient[rows, :, last_I] = s[rows, :, last_I] - s[rows, :,
+                                                            last_I - 1]
+
+        dx = gradient[:, 0, :]
+        dy = gradient[:, 1, :]
+        magnitude = np.sqrt(dy * dy + dx * dx)
+
+        # Rotate clockwise 90 degrees and scale to length 1
+        return dy / magnitude, -dx / magnitude
+
+    #%%
+    @staticmethod
+    def h__getMatchesBatch(s1, s2, n1, n2, norm_x, norm_y, left_I, right_I):
+        """
+        Batched equivalent of h__getMatches and h__getProjectionIndex.
+
+        In each frame, the sign of the projection is chosen per point and,
+        if the points disagree, all points are then redone with the sign
+        used by the majority.  Since the redone points end up with that
+        same sign as the others, we just choose one sign per frame and
+        then do the matching once.
+
+        Parameters
+        ---------------
+        s1, s2: padded sides, of shape (n_frames, 2, k_max)
+        n1, n2: integer numpy arrays of shape (n_frames,)
+            The number of points on each side
+        norm_x, norm_y: numpy arrays of shape (n_frames, k1_max)
+        left_I, right_I: integer numpy arrays of shape (n_frames, k1_max)
+            The search window on side 2 for each point on side 1
+
+        Returns
+        ---------------
+        match_I: integer numpy array of shape (n_frames, k1_max)
+
+        """
+        n_frames, _, k1_max = s1.shape
+        rows = np.arange(n_frames)
+        point_I = np.arange(k1_max)[None, :]
+
+        # There is no need to do the first and last point
+        is_inner = (point_I >= 1) & (point_I <= n1[:, None] - 2)
+
+        # Each window, starting one point early so that we also have the
+        # distance to the point before each point in the window.
+        # Shape (n_frames, k1_max, max_window_length + 1)
+        window_lengths = right_I - left_I
+        offsets = np.arange(-1, np.max(window_lengths[is_inner]))
+        col_I = left_I[:, :, None] + offsets
+        in_window = (offsets >= 0) & (col_I < right_I[:, :, None])
+        col_I = np.clip(col_I, 0, s2.shape[2] - 1)
+
+        dx_across = s1[:, 0, :, None] - s2[rows[:, None, None], 0, col_I]
+        dy_across = s1[:, 1, :, None] - s2[rows[:, None, None], 1, col_I]
+        d_across = np.sqrt(dx_across * dx_across + dy_across * dy_across)
+        dx_across /= d_across
+        dy_across /= d_across
+
+        dp = dx_across * norm_x[:, :, None] + dy_across * norm_y[:, :, None]
+
+        # The sign each point would choose on its own
+        window_sum = np.where(in_window, dp, 0).sum(axis=2)
+        signs_used = np.where(window_sum > 0, 1, -1) * is_inner
+
+        all_same = np.all((signs_used == signs_used[:, 1:2]) | ~is_inner,
+                          axis=1)
+        majority_sign = np.where(signs_used.sum(axis=1) > 0, 1, -1)
+        sign_use = np.where(all_same, signs_used[:, 1], majority_sign)
+
+        # A sign of 1 means the projections are flipped
+        dp *= -sign_use[:, None, None]
+
+        # Local minima, in the same part of the window as
+        # h__getProjectionIndex searches
+        possible = np.zeros(dp.shape, dtype=bool)
+        possible[:, :, 1:-1] = (dp[:, :, 1:-1] < dp[:, :, 2:]) & \
+            (dp[:, :, 1:-1] < dp[:, :, :-2])
+        possible &= (offsets >= 1) & \
+            (offsets <= window_lengths[:, :, None] - 3)
+        n_possible = possible.sum(axis=2)
+
+        # When there are several minima h__getProjectionIndex picks the
+        # one with the smallest d_across, looked up one point to the left
+        d_previous = np.full(d_across.shape, np.inf)
+        d_previous[:, :, 1:] = d_across[:, :, :-1]
+        closest_possible_I = np.argmin(np.where(possible, d_previous,
+                                                np.inf), axis=2)
+
+        # Otherwise, take the overall minimum within the window
+        min_dp_I = np.argmin(np.where(in_window, dp, np.inf), axis=2)
+
+        match_I = left_I + offsets[np.where(n_possible > 0,
+                                            closest_possible_I, min_dp_I)]
+        match_I[:, 0] = 0
+        match_I[rows, n1 - 1] = n2
+
+        return match_I
+
+    #%%
+    @staticmethod
+    def h__distanceAcross(xy1, xy2, frame_I, I1, I2):
+        """
+        The distance from point I1 on side 1 to point I2 on side 2, in
+        frame frame_I, for padded sides of shape (n_frames, 2, k_max).
+
+        """
+        dx = xy1[frame_I, 0, I1] - xy2[frame_I, 0, I2]
+        dy = xy1[frame_I, 1, I1] - xy2[frame_I, 1, I2]
+
+        return np.sqrt(dx * dx + dy * dy)
+
+    #%%
+    @staticmethod
+    def h__updateEndsByWalkingBatch(match_I1, s1, s2, n1, n2,
+                                    END_S1_WALK_PCT):
+        """
+        Batched equivalent of h__updateEndsByWalking.
+
+        match_I1 is updated in place.
+
+        Returns
+        -------
+        keep_mask: boolean numpy array of shape (n_frames, k1_max)
+            Which entries of match_I1 to use.
+
+        """
+        n_frames, k1_max = match_I1.shape
+        rows = np.arange(n_frames)
+        point_I = np.arange(k1_max)[None, :]
+        keep_mask = np.zeros(match_I1.shape, dtype=bool)
+
+        end_s1_walk_I = np.ceil(n1 * END_S1_WALK_PCT).astype(int)
+        end_s2_walk_I = 2 * end_s1_walk_I
+        end_s1_walk_backwards = n1 - end_s1_walk_I + 1
+        end_s2_walk_backwards = n2 - end_s2_walk_I + 1
+
+        for walk_args in ((np.zeros_like(n1), end_s1_walk_I,
+                           np.zeros_like(n2), end_s2_walk_I, 1),
+                          (n1 - 1, end_s1_walk_backwards,
+                           n2 - 1, end_s2_walk_backwards, -1)):
+            p1_I, p2_I, n_pairs = \
+                SkeletonCalculatorType1.h__getPartnersViaWalkBatch(
+                    *(walk_args + (s1, s2)))
+
+            # Alter the matches somewhat, and keep all our alterations
+            is_pair = np.arange(p1_I.shape[1])[None, :] < n_pairs[:, None]
+            pair_rows = np.repeat(rows, n_pairs)
+            match_I1[pair_rows, p1_I[is_pair]] = p2_I[is_pair]
+            keep_mask[pair_rows, p1_I[is_pair]] = True
+
+        # Anything in between we'll use the projection approach
+        keep_mask |= (point_I >= end_s1_walk_I[:, None] + 1) & \
+            (point_I < end_s1_walk_backwards[:, None])
+
+        # Always keep ends
+        keep_mask[:, 0] = True
+        keep_mask[rows, n1 - 1] = True
+        keep_mask &= point_I < n1[:, None]
+
+        match_I1[:, 0] = 0
+        match_I1[rows, n1 - 1] = n2 - 1
+
+        return keep_mask
+
+    #%%
+    @staticmethod
+    def h__getPartnersViaWalkBatch(s1, e1, s2, e2, step, xy1, xy2):
+        """
+        Batched equivalent of h__getPartnersViaWalk.
+
+        All frames take their steps together; a frame stops walking once
+        it reaches the end of either side.
+
+        Parameters
+        ----------
+        s1, e1, s2, e2: integer numpy arrays of shape (n_frames,)
+            start and end (inclusive) indices for side 1 and side 2
+        step: 1 or -1
+            Whether we walk up from the start or down from the end
+        xy1, xy2: padded sides, of shape (n_frames, 2, k_max)
+
+        Returns
+        -------
+        (p1_I, p2_I, n_pairs) tuple
+            p1_I[f,i] goes with p2_I[f,i], for i < n_pairs[f]
+
+        """
+        n_frames = len(s1)
+        max_steps = np.max(np.abs(e1 - s1) + np.abs(e2 - s2)) + 1
+        p1_I = np.zeros((n_frames, max_steps), dtype=int)
+        p2_I = np.zeros((n_frames, max_steps), dtype=int)
+        n_pairs = np.zeros(n_frames, dtype=int)
+
+        c1 = s1.copy()  # Current 1 index
+        c2 = s2.copy()  # Current 2 index
+
+        active = (c1 != e1) & (c2 != e2)
+        while np.any(active):
+            f = np.flatnonzero(active)
+            cur_p_I = n_pairs[f]  # Current pair index
+            cur1 = c1[f]
+            cur2 = c2[f]
+            next1 = cur1 + step
+            next2 = cur2 + step
+
+            v_n1c1 = xy1[f, :, next1] - xy1[f, :, cur1]
+            v_n2c2 = xy2[f, :, next2] - xy2[f, :, cur2]
+
+            d = SkeletonCalculatorType1.h__distanceAcross
+            d_n1n2 = d(xy1, xy2, f, next1, next2)
+            d_n1c2 = d(xy1, xy2, f, next1, cur2)
+            d_n2c1 = d(xy1, xy2, f, cur1, next2)
+
+            # NOTE: Like the frame-by-frame code, for the first pair the
+            # "previous" pair is (0,0) and for the second it has width 0
+            prev_width = d(xy1, xy2, f,
+                           p1_I[f, cur_p_I - 1], p2_I[f, cur_p_I - 1])
+            prev_width[cur_p_I == 1] = 0
+
+            advance_both = (d_n1c2 == d_n2c1) | \
+                ((d_n1n2 <= d_n1c2) & (d_n1n2 <= d_n2c1))
+            # Contours go different directions, and it's getting wider
+            advance_both |= ~np.any(v_n1c1 * v_n2c2 > 0, axis=1) & \
+                (d_n1c2 > prev_width) & (d_n2c1 > prev_width)
+            # Otherwise, follow the smallest width
+            advance_1 = advance_both | (d_n1c2 < d_n2c1)
+            advance_2 = advance_both | ~(d_n1c2 < d_n2c1)
+
+            c1[f] = np.where(advance_1, next1, cur1)
+            c2[f] = np.where(advance_2, next2, cur2)
+            p1_I[f, cur_p_I] = c1[f]
+            p2_I[f, cur_p_I] = c2[f]
+            n_pairs[f] += 1
+
+            active = (c1 != e1) & (c2 != e2)
+
+        # NOTE: Like the frame-by-frame code, we drop the last pair
+        n_pairs = np.maximum(n_pairs - 1, 0)
+
+        return (p1_I, p2_I, n_pairs)
+
     #%%
     @staticmethod
     def h__getBounds(n1, n2, percent_left_search, percent_right_search):
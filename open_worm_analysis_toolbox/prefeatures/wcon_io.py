@@ -0,0 +1,644 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming reading and writing of WCON files
+
+WCON (Worm tracker Commons Object Notation) is the JSON based format of
+https://github.com/openworm/tracker-commons.  A WCON file looks like:
+
+{
+    "units": {"t": "s", "x": "um", "y": "um"},
+    "metadata": {...},
+    "data": [{"id": 0, "t": [0.0, 0.04, ...],
+              "x": [[...frame 0...], [...frame 1...], ...],
+              "y": [[...frame 0...], [...frame 1...], ...],
+              "vc_x": ..., "vc_y": ..., "dc_x": ..., "dc_y": ...},
+             ...]
+}
+
+"x" and "y" hold the skeleton, and, as in "examples/WCON demo.py", the
+ventral and dorsal contours are stored under the "vc_" and "dc_" prefixed
+keys.  A frame without any points is a missing frame.
+
+Files from trackers can be several GB, so rather than parsing the whole
+file into Python lists, the file is read a chunk of text at a time and
+the frames are put into flat numpy arrays a block of frames at a time.
+Writing is likewise done one frame at a time, straight to the file.
+
+"""
+import io
+import os
+import re
+import json
+import array
+import zipfile
+import tempfile
+import contextlib
+import six
+import numpy as np
+from collections import OrderedDict
+
+from .heterocardinal_frames import HeterocardinalFrames
+
+# The prefix of the x and y keys of each heterocardinal property
+FRAME_KEY_PREFIXES = OrderedDict([('skeleton', ''),
+                                  ('ventral_contour', 'vc_'),
+                                  ('dorsal_contour', 'dc_')])
+
+# The length units that can be read, in microns
+MICRONS_PER_LENGTH_UNIT = {
+    'nm': 1e-3, 'nanometer': 1e-3, 'nanometre': 1e-3,
+    'um': 1, u'\u00b5m': 1, u'\u03bcm': 1,
+    'micron': 1, 'micrometer': 1, 'micrometre': 1,
+    'mm': 1e3, 'millimeter': 1e3, 'millimetre': 1e3,
+    'cm': 1e4, 'centimeter': 1e4, 'centimetre': 1e4,
+    'm': 1e6, 'meter': 1e6, 'metre': 1e6,
+    'in': 25400, 'inch': 25400}
+
+_WHITESPACE = re.compile(r'\s*')
+_NUMBER_CHARACTERS = frozenset('0123456789+-.eE')
+# The number of frames whose offsets are added at a time
+_OFFSET_BLOCK_SIZE = 1000
+
+
+class _JSONStreamReader(object):
+    """
+    A minimal pull parser for JSON text, which only ever holds a chunk of
+    the text in memory.
+
+    Arrays and objects can be walked one element at a time with
+    iter_array and iter_object, while smaller values, e.g. the points of a
+    frame, are decoded in one go with read_value.
+
+    """
+
+    def __init__(self, text_file, chunk_size=2**20):
+        self.text_file = text_file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """
+        Read the next chunk of text.  Returns False at the end of the file.
+
+        """
+        text = self.text_file.read(self.chunk_size)
+        if not text:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, or '' at the end of
+        the file.
+
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError("Invalid WCON file: expected '%s' at '%s'" %
+                             (character,
+                              self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def read_value(self):
+        """
+        Decode the next value.
+
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the chunk might carry on in the
+                # next chunk
+                if self.eof or (end < len(self.buffer) and
+                                self.buffer[end] not in _NUMBER_CHARACTERS):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_array(self):
+        """
+        Walk an array, yielding before each element.  The caller must
+        consume the element before asking for the next one.
+
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            yield
+            if self._read_separator(']'):
+                return
+
+    def iter_object(self):
+        """
+        Walk an object, yielding each key.  The caller must consume the
+        value of the key before asking for the next one.
+
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self._read_separator('}'):
+                return
+
+    def _read_separator(self, closing_character):
+        """
+        Read the ',' between two elements, or the closing character.
+        Returns True if it was the closing character.
+
+        """
+        character = self.peek()
+        if character not in (',', closing_character):
+            self.expect(closing_character)
+        self.pos += 1
+        return character == closing_character
+
+    def skip_value(self):
+        """
+        Skip the next value without holding all of it in memory.
+
+        """
+        character = self.peek()
+        if character == '[':
+            for _ in self.iter_array():
+                self.skip_value()
+        elif character == '{':
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.read_value()
+
+
+class _PropertyBuffer(object):
+    """
+    The points of one heterocardinal property, e.g. the skeleton, of all of
+    the frames read so far.
+
+    The points are stored as the (x,y) rows of a single array, so that the
+    array can be grown, and trimmed once all frames are read, in place
+    (ndarray.resize reallocates rather than copies when it can).  The
+    frames of a record are only committed once the whole record has been
+    read, so that the records of other worms can be dropped.
+
+    """
+
+    def __init__(self):
+        self.points = np.zeros((0, 2))
+        self.n_points = array.array('l')
+        self.n_committed_points = 0
+        self.is_present = False
+
+    def write(self, start, dimension_index, values):
+        stop = start + values.size
+        if stop > len(self.points):
+            # Grow by at least a quarter, so that there are few
+            # reallocations but not much unused space
+            self.points.resize(
+                (max(stop, len(self.points) * 5 // 4 + 1024), 2),
+                refcheck=False)
+        self.points[start:stop, dimension_index] = values
+        return stop
+
+    def commit(self, record_n_points, stop=None, offsets=None):
+        """
+        Add the frames of a record, whose points are the rows from
+        n_committed_points to stop.  offsets maps the dimension index to
+        the offsets of the record, which are added in place.
+
+        """
+        if stop is not None:
+            self.is_present = True
+            start = self.n_committed_points
+            frame_point_starts = start + np.concatenate(
+                ([0], np.cumsum(record_n_points)))
+            for dimension_index, offset in (offsets or {}).items():
+                offset = np.broadcast_to(offset, record_n_points.shape)
+                # A block of frames at a time, to bound the temporary
+                # arrays of repeated offsets
+                for first in range(0, offset.size, _OFFSET_BLOCK_SIZE):
+                    last = min(first + _OFFSET_BLOCK_SIZE, offset.size)
+                    self.points[frame_point_starts[first]:
+                                frame_point_starts[last],
+                                dimension_index] += np.repeat(
+                        offset[first:last], record_n_points[first:last])
+            self.n_committed_points = stop
+
+        self.n_points.extend(record_n_points.tolist())
+
+    def get_frames(self):
+        """
+        Return the committed frames as HeterocardinalFrames, or None if
+        the property was never present.  The buffer can't be used after.
+
+        """
+        if not self.is_present:
+            return None
+
+        self.points.resize((self.n_committed_points, 2), refcheck=False)
+        n_points = _to_numpy(self.n_points)
+        return HeterocardinalFrames(
+            self.points.T, np.concatenate(([0], np.cumsum(n_points))),
+            n_points > 0)
+
+
+class _FrameBuilder(object):
+    """
+    Writes the frames of one coordinate of a record, e.g. "vc_x", to a
+    _PropertyBuffer, converting the frames to numpy a block of frames at a
+    time.
+
+    """
+
+    def __init__(self, buffer, dimension_index, frames_per_block=1000):
+        self.buffer = buffer
+        self.dimension_index = dimension_index
+        self.frames_per_block = frames_per_block
+        self.stop = buffer.n_committed_points
+        self.block = []
+        self.n_points = array.array('l')
+
+    def append(self, frame):
+        self.block.append(np.array(frame, dtype=float).ravel())
+        self.n_points.append(self.block[-1].size)
+        if len(self.block) >= self.frames_per_block:
+            self.end_block()
+
+    def end_block(self):
+        if len(self.block) > 0:
+            self.stop = self.buffer.write(self.stop, self.dimension_index,
+                                          np.concatenate(self.block))
+            self.block = []
+
+    def __len__(self):
+        return len(self.n_points)
+
+
+def _to_numpy(values):
+    """
+    Copy an array.array to a numpy array.
+
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=values.typecode)
+    return np.frombuffer(values, dtype=values.typecode).copy()
+
+
+def _read_numbers(stream):
+    """
+    Read a number or a list of numbers as an array.  null is read as NaN.
+
+    """
+    if stream.peek() != '[':
+        return np.array([stream.read_value()], dtype=float)
+
+    values = array.array('d')
+    for _ in stream.iter_array():
+        value = stream.read_value()
+        values.append(np.NaN if value is None else value)
+    return _to_numpy(values)
+
+
+def _read_frames(stream, builder):
+    """
+    Read the frames of one coordinate, e.g. "x", into builder.
+
+    The value is a list of frames, or a single frame if the record is for
+    a single time.
+
+    """
+    single_frame = []
+    for _ in stream.iter_array():
+        if stream.peek() == '[':
+            builder.append(stream.read_value())
+        else:
+            single_frame.append(stream.read_value())
+
+    if len(single_frame) > 0:
+        builder.append(single_frame)
+
+
+def _read_record(stream, buffers, frames_per_block):
+    """
+    Read one data record, writing its frames to buffers, which maps the
+    keys of FRAME_KEY_PREFIXES to _PropertyBuffer instances.  The frames
+    are not committed.
+
+    Returns
+    -------
+    (worm_id, t, builders, offsets) : tuple
+        builders maps each of the x and y keys that were present to a
+        _FrameBuilder, and offsets maps 'ox' and 'oy' to their values.
+
+    """
+    worm_id = None
+    t = None
+    builders = {}
+    offsets = {}
+    coordinate_keys = {prefix + dimension: (name, dimension_index)
+                       for name, prefix in FRAME_KEY_PREFIXES.items()
+                       for dimension_index, dimension in enumerate('xy')}
+
+    for key in stream.iter_object():
+        if key == 'id':
+            worm_id = stream.read_value()
+        elif key == 't':
+            t = _read_numbers(stream)
+        elif key in coordinate_keys:
+            name, dimension_index = coordinate_keys[key]
+            builders[key] = _FrameBuilder(buffers[name], dimension_index,
+                                          frames_per_block)
+            _read_frames(stream, builders[key])
+            builders[key].end_block()
+        elif key in ('ox', 'oy'):
+            offsets[key] = _read_numbers(stream)
+        else:
+            stream.skip_value()
+
+    if t is None:
+        raise ValueError("Invalid WCON file: a data record has no 't'")
+
+    for key, builder in builders.items():
+        if len(builder) == 0 and t.size == 1:
+            # A single missing frame, e.g. "t": 1.5, "x": []
+            builder.append([])
+            builder.end_block()
+        if len(builder) != t.size:
+            raise ValueError("Invalid WCON file: '%s' has %d frames but 't' "
+                             "has %d" % (key, len(builder), t.size))
+
+    return worm_id, t, builders, offsets
+
+
+def get_microns_per_unit(units):
+    """
+    The number of microns per unit of the "x" and "y" coordinates.
+
+    Parameters
+    ----------
+    units : dict
+        The WCON "units", e.g. {'t': 's', 'x': 'mm', 'y': 'mm'}
+
+    """
+    microns_per_unit = []
+    for dimension in 'xy':
+        unit = units.get(dimension)
+        if unit is None:
+            raise ValueError("The WCON file has no units for '%s'" %
+                             dimension)
+        # Plurals, e.g. 'microns', and surrounding spaces are allowed
+        unit = unit.strip()
+        if unit not in MICRONS_PER_LENGTH_UNIT and unit.endswith('s'):
+            unit = unit[:-1]
+        try:
+            microns_per_unit.append(MICRONS_PER_LENGTH_UNIT[unit])
+        except KeyError:
+            raise ValueError("Unsupported WCON unit for '%s': %s" %
+                             (dimension, units[dimension]))
+
+    if microns_per_unit[0] != microns_per_unit[1]:
+        raise ValueError("The 'x' and 'y' units of the WCON file differ")
+
+    return microns_per_unit[0]
+
+
+@contextlib.contextmanager
+def _open_text_file(file_path, mode):
+    """
+    Open a WCON file, or the WCON file in a .zip archive.
+
+    A zipped file is written to a temporary file first, then added to
+    the archive, since writing to a member of a ZipFile needs Python 3.6.
+
+    """
+    if mode == 'r' and zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path) as zip_file:
+            member_name = zip_file.namelist()[0]
+            with io.TextIOWrapper(zip_file.open(member_name),
+                                  encoding='utf-8') as text_file:
+                yield text_file
+    elif mode == 'w' and file_path.lower().endswith('.zip'):
+        member_name = os.path.basename(file_path)[:-4]
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(file_path)))
+        try:
+            with _open_for_writing(fd) as text_file:
+                yield text_file
+            with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as \
+                    zip_file:
+                zip_file.write(temp_path, member_name)
+        finally:
+            os.remove(temp_path)
+    elif mode == 'w':
+        with _open_for_writing(file_path) as text_file:
+            yield text_file
+    else:
+        with io.open(file_path, mode, encoding='utf-8') as text_file:
+            yield text_file
+
+
+def _open_for_writing(file):
+    if six.PY2:
+        # json.dumps returns byte strings, which are ASCII as it escapes
+        # any other characters
+        return io.open(file, 'wb')
+    return io.open(file, 'w', encoding='utf-8')
+
+
+def read_wcon(file_path, worm_id=None, frames_per_block=1000,
+              chunk_size=2**20):
+    """
+    Read the frames of one worm from a WCON file, or a zipped WCON file.
+
+    Parameters
+    ----------
+    file_path : str
+    worm_id : (optional)
+        The "id" of the worm to read.  If not given, the worm of the first
+        data record is read.  The records of any other worms are skipped.
+    frames_per_block : int (optional)
+        The number of frames to parse before putting them in the flat
+        arrays.  This bounds the memory used by Python objects.
+    chunk_size : int (optional)
+        The number of characters to read from the file at a time.
+
+    Returns
+    -------
+    (frames, t, units, metadata) : tuple
+        frames : dict mapping each key of FRAME_KEY_PREFIXES to the
+            HeterocardinalFrames read, or None if the file doesn't have
+            them.  The frames of the records of the worm are concatenated
+            in the order they appear in the file.
+        t : numpy array of the times of the frames
+        units : dict, the "units" of the file
+        metadata : dict, the "metadata" of the file (or None)
+
+    Notes
+    -----
+    "ox" and "oy" offsets are added to the coordinates.  Other keys, such
+    as the centroid or custom '@' keys, are skipped.
+
+    """
+    units = {}
+    metadata = None
+    buffers = OrderedDict((name, _PropertyBuffer())
+                          for name in FRAME_KEY_PREFIXES)
+    t = []
+    worm_ids = [worm_id]
+
+    def add_record(record):
+        record_worm_id, record_t, builders, offsets = record
+        if worm_ids[0] is None:
+            worm_ids[0] = record_worm_id
+        elif record_worm_id != worm_ids[0]:
+            # The points that were written will be overwritten by the
+            # next record
+            return
+
+        t.append(record_t)
+        for name, prefix in FRAME_KEY_PREFIXES.items():
+            if prefix + 'x' not in builders and prefix + 'y' not in builders:
+                # The record doesn't have this property, so its frames
+                # are missing
+                buffers[name].commit(np.zeros(record_t.size, dtype=int))
+                continue
+
+            try:
+                x_builder = builders[prefix + 'x']
+                y_builder = builders[prefix + 'y']
+            except KeyError:
+                raise ValueError("Invalid WCON file: '%sx' and '%sy' must "
+                                 "both be given" % (prefix, prefix))
+
+            record_n_points = _to_numpy(x_builder.n_points)
+            if not np.array_equal(record_n_points,
+                                  _to_numpy(y_builder.n_points)):
+                raise ValueError("Invalid WCON file: the '%sx' and '%sy' "
+                                 "frames have different lengths" %
+                                 (prefix, prefix))
+
+            buffers[name].commit(
+                record_n_points, x_builder.stop,
+                {dimension_index: offsets[key] for dimension_index, key
+                 in enumerate(['ox', 'oy']) if key in offsets})
+
+    with _open_text_file(file_path, 'r') as text_file:
+        stream = _JSONStreamReader(text_file, chunk_size)
+        for key in stream.iter_object():
+            if key == 'units':
+                units = stream.read_value()
+            elif key == 'metadata':
+                metadata = stream.read_value()
+            elif key == 'data':
+                if stream.peek() == '[':
+                    for _ in stream.iter_array():
+                        add_record(_read_record(stream, buffers,
+                                                frames_per_block))
+                else:
+                    add_record(_read_record(stream, buffers,
+                                            frames_per_block))
+            else:
+                stream.skip_value()
+
+    if len(t) == 0:
+        raise ValueError("No data was found in the WCON file for worm %s" %
+                         ('' if worm_id is None else worm_id))
+
+    t = np.concatenate(t)
+    frames = {name: buffer.get_frames() for name, buffer in buffers.items()}
+
+    return frames, t, units, metadata
+
+
+def _write_frames(text_file, frames, dimension_index):
+    text_file.write('[')
+    for frame_index, frame in enumerate(frames):
+        if frame_index > 0:
+            text_file.write(', ')
+        if frame is None:
+            text_file.write('[]')
+            continue
+
+        values = np.asarray(frame)[dimension_index]
+        if np.any(np.isnan(values)):
+            # JSON has no NaN, WCON uses null
+            values = [None if np.isnan(v) else v for v in values.tolist()]
+        else:
+            values = values.tolist()
+        text_file.write(json.dumps(values))
+    text_file.write(']')
+
+
+def write_wcon(file_path, records, units, metadata=None):
+    """
+    Write a WCON file, or a zipped WCON file if file_path ends in '.zip'.
+
+    Each record is written to the file as soon as it is produced, so
+    records can be a generator computing the frames block by block.
+
+    Parameters
+    ----------
+    file_path : str
+    records : iterable of (worm_id, t, frames) tuples
+        t : numpy array of the times of the frames of the record
+        frames : dict mapping keys of FRAME_KEY_PREFIXES to a
+            HeterocardinalFrames, or list of frames, with as many frames as
+            there are times in t.  Missing frames (None) are written as
+            frames without any points.
+    units : dict
+        The WCON "units", e.g. {'t': 's', 'x': 'um', 'y': 'um'}
+    metadata : dict (optional)
+        The WCON "metadata"
+
+    """
+    with _open_text_file(file_path, 'w') as text_file:
+        text_file.write('{"units": %s,\n' % json.dumps(units))
+        if metadata is not None:
+            text_file.write(' "metadata": %s,\n' % json.dumps(metadata))
+        text_file.write(' "data": [')
+
+        for record_index, (worm_id, t, frames) in enumerate(records):
+            if record_index > 0:
+                text_file.write(',')
+            text_file.write('\n  {"id": %s,\n   "t": %s' %
+                            (json.dumps(worm_id),
+                             json.dumps(np.asarray(t, dtype=float).tolist())))
+
+            for name, prefix in FRAME_KEY_PREFIXES.items():
+                if frames.get(name) is None:
+                    continue
+                if len(frames[name]) != len(t):
+                    raise ValueError("The record has %d times but %d %s "
+                                     "frames" % (len(t), len(frames[name]),
+                                                 name))
+                for dimension_index, dimension in enumerate('xy'):
+                    text_file.write(',\n   "%s%s": ' % (prefix, dimension))
+                    _write_frames(text_file, frames[name], dimension_index)
+
+            text_file.write('}')
+
+        text_file.write('\n ]\n}\n')
@@ -512,6 +512,120 @@ class MergedHistogram(Histogram):
 
         return merged_hist
 
+    #%%
+    @classmethod
+    def running_merge_factory(cls, specs):
+        """
+        Return an empty merged histogram, to which histograms can be added
+        one at a time with add_histogram.  Call finish_merge once they
+        have all been added.
+
+        Unlike merged_histogram_factory, only the bin counts summed over
+        all videos are kept, so 'counts' has one element per bin rather
+        than one row per video.  This avoids holding on to the histogram
+        of every video when merging a large number of them.
+
+        Parameters
+        ------------------
+        specs: the specs shared by all the histograms to be added
+
+        Returns
+        ------------------
+        A MergedHistogram object
+
+        """
+        merged_hist = cls(specs=specs)
+
+        merged_hist._running_counts = np.zeros(0)
+        merged_hist._min_bin_midpoint = None
+        merged_hist._max_bin_midpoint = None
+
+        merged_hist.mean_per_video = []
+        merged_hist.std_per_video = []
+        merged_hist.num_samples_per_video = []
+
+        return merged_hist
+
+    def add_histogram(self, histogram):
+        """
+        Add the counts, mean, standard deviation and number of samples of
+        a single-video histogram to a merge started with
+        running_merge_factory.  The histogram's data is not kept.
+
+        Parameters
+        ------------------
+        histogram: a (not merged) Histogram object
+
+        """
+        if histogram.num_videos != 1:
+            raise Exception("Merging already-merged histograms is not yet "
+                            "implemented")
+
+        self.mean_per_video.append(histogram.mean)
+        self.std_per_video.append(histogram.std)
+        self.num_samples_per_video.append(histogram.num_samples)
+
+        first_bin_midpoint = histogram.first_bin_midpoint
+        if np.isnan(first_bin_midpoint):
+            return
+
+        # As in merged_histogram_factory, the bins always line up, so we
+        # only need to pad the running counts to cover the new bins
+        cur_bin_width = self.specs.bin_width
+        if self._min_bin_midpoint is None:
+            self._min_bin_midpoint = first_bin_midpoint
+            self._max_bin_midpoint = histogram.last_bin_midpoint
+        elif first_bin_midpoint < self._min_bin_midpoint:
+            num_new_bins = int(round((self._min_bin_midpoint -
+                                      first_bin_midpoint) / cur_bin_width))
+            self._running_counts = np.concatenate((np.zeros(num_new_bins),
+                                                   self._running_counts))
+            self._min_bin_midpoint = first_bin_midpoint
+        self._max_bin_midpoint = max(self._max_bin_midpoint,
+                                     histogram.last_bin_midpoint)
+
+        start_index = int(round((first_bin_midpoint -
+                                 self._min_bin_midpoint) / cur_bin_width))
+        end_index = start_index + histogram.num_bins
+        if end_index > len(self._running_counts):
+            self._running_counts = np.concatenate(
+                (self._running_counts,
+                 np.zeros(end_index - len(self._running_counts))))
+
+        self._running_counts[start_index:end_index] += histogram.counts
+
+    def finish_merge(self):
+        """
+        Compute the bins, counts and pdf of a merge started with
+        running_merge_factory, once all its histograms have been added.
+
+        """
+        if self._min_bin_midpoint is None:
+            new_bin_midpoints = np.zeros(0)
+        else:
+            cur_bin_width = self.specs.bin_width
+            new_bin_midpoints = np.arange(self._min_bin_midpoint,
+                                          self._max_bin_midpoint +
+                                          cur_bin_width,
+                                          step=cur_bin_width)
+
+        new_counts = np.zeros(len(new_bin_midpoints))
+        new_counts[:len(self._running_counts)] = \
+            self._running_counts[:len(new_counts)]
+
+        self.mean_per_video = np.array(self.mean_per_video)
+        self.std_per_video = np.array(self.std_per_video)
+        self.num_samples_per_video = np.array(self.num_samples_per_video)
+
+        self._bin_midpoints = new_bin_midpoints
+        self._counts = new_counts
+        self._num_samples = sum(self.num_samples_per_video)
+        self._pdf = self._counts / self._num_samples
+
+        del self._running_counts
+        del self._min_bin_midpoint
+        del self._max_bin_midpoint
+
     @property
     def mean(self):
         try:
@@ -69,22 +69,42 @@ class HistogramManager(object):
     """
     #%%
 
-    def __init__(self, feature_path_or_object_list, verbose=False):
+    def __init__(self, feature_path_or_object_list, verbose=False,
+                 streaming=False):
         """
         Parameters
         ----------
         feature_path_or_object_list: list of strings or feature objects
             Full paths to all feature files making up this histogram, or
-            their in-memory object equivalents.
+            their in-memory object equivalents.  Any iterable will do,
+            e.g. a generator that computes or loads the features of one
+            video at a time.
+        streaming: bool (default False)
+            If True, the data of each video is dropped as soon as its
+            histograms have been computed, keeping only their bin counts,
+            mean, standard deviation and number of samples, which are
+            merged into the running totals of each feature as each video
+            arrives (see MergedHistogram.running_merge_factory).  Memory
+            then no longer grows with the total number of frames.  The
+            merged histograms have no 'data', their 'counts' are summed
+            over all videos, and hist_cell_array is None.
 
         """
-        if verbose:
+        if verbose and hasattr(feature_path_or_object_list, '__len__'):
             print("Number of feature files passed into the histogram manager:",
                   len(feature_path_or_object_list))
 
         # This will have shape (len(feature_path_or_object_list), 726)
         self.hist_cell_array = []
 
+        if streaming:
+            # One running MergedHistogram per feature (None once a video
+            # is missing that feature), plus the per-video validity and
+            # means needed by valid_2d_mask and means_2d_dataframe
+            running_merges = None
+            valid_2d_mask = []
+            means_2d_array = []
+
         # Loop over all feature files and get histogram objects for each
         for feature_path_or_object in feature_path_or_object_list:
             worm_features = None
@@ -92,7 +112,7 @@ class HistogramManager(object):
             if isinstance(feature_path_or_object, six.string_types):
                 # If we have a string, it's a filepath to an HDF5 feature file
                 file_path = feature_path_or_object
-                worm_features = WormFeaturesDos.from_disk(file_path)
+                worm_features = WormFeatures.from_disk(file_path)
             else:
                 # Otherwise the worm features have been passed directly
                 # as an instance of WormFeatures (we hope)
@@ -102,7 +122,49 @@ class HistogramManager(object):
             # worm_features.info -> obj.info
 
             new_histogram_set = self.init_histograms(worm_features)
-            self.hist_cell_array.append(new_histogram_set)
+
+            if isinstance(feature_path_or_object, six.string_types):
+                worm_features.close()
+
+            if not streaming:
+                self.hist_cell_array.append(new_histogram_set)
+                continue
+
+            if running_merges is None:
+                running_merges = \
+                    [MergedHistogram.running_merge_factory(h.specs)
+                     if h is not None else None for h in new_histogram_set]
+            elif len(running_merges) != len(new_histogram_set):
+                raise Exception("All videos must have the same features")
+
+            for feature_index, histogram in enumerate(new_histogram_set):
+                if histogram is None:
+                    running_merges[feature_index] = None
+                elif running_merges[feature_index] is not None:
+                    running_merges[feature_index].add_histogram(histogram)
+
+            valid_2d_mask.append([h is not None for h in new_histogram_set])
+            means_2d_array.append([h.mean if h is not None else np.NaN
+                                   for h in new_histogram_set])
+
+        if streaming:
+            if running_merges is None:
+                running_merges = []
+
+            self.hist_cell_array = None
+            self._valid_2d_mask = np.array(valid_2d_mask, dtype=bool)
+            self._means_2d_array = np.array(means_2d_array, dtype=float)
+
+            self.merged_histograms = np.array([None] * len(running_merges))
+            for feature_index, merged_hist in enumerate(running_merges):
+                if merged_hist is None:
+                    print("For feature #%d, at least one video is None. "
+                          "Bypassing." % feature_index)
+                    continue
+                merged_hist.finish_merge()
+                self.merged_histograms[feature_index] = merged_hist
+
+            return
 
         # JAH TODO: I'm not sure what this is doing ..., add documentation
         #----------------------------------------------------------------
@@ -143,7 +205,7 @@ class HistogramManager(object):
 
     @property
     def num_videos(self):
-        return self.hist_cell_array.shape[0]
+        return self.valid_2d_mask.shape[0]
 
     @property
     def valid_2d_mask(self):
@@ -151,6 +213,10 @@ class HistogramManager(object):
         Return a mask showing which elements of hist_cell_array are null.
 
         """
+        if self.hist_cell_array is None:
+            # Streaming mode: the histograms of each video were not kept
+            return self._valid_2d_mask
+
         valid_mean_detector = lambda h: True if h is not None else False
         return np.vectorize(valid_mean_detector)(self.hist_cell_array)
 
@@ -163,8 +229,13 @@ class HistogramManager(object):
             Shape (10,726)
 
         """
-        valid_mean_detector = lambda h: h.mean if h is not None else np.NaN
-        means_array = np.vectorize(valid_mean_detector)(self.hist_cell_array)
+        if self.hist_cell_array is None:
+            means_array = self._means_2d_array
+        else:
+            valid_mean_detector = \
+                lambda h: h.mean if h is not None else np.NaN
+            means_array = \
+                np.vectorize(valid_mean_detector)(self.hist_cell_array)
 
         # Change shape to (726,10) since pandas wants the first axis
         # to be the rows of the dataframe
@@ -174,7 +245,7 @@ class HistogramManager(object):
         # Give a more human-readable column name
         df.columns = ['Video %d mean' % i for i in range(self.num_videos)]
 
-        feature_spec = WormFeaturesDos.get_feature_spec(extended=True)
+        feature_spec = WormFeatures.get_feature_spec(extended=True)
         feature_spec = feature_spec[['feature_field',
                                      'data_type',
                                      'motion_type']]
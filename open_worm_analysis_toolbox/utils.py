@@ -7,12 +7,12 @@ that are the equivalent of the same-named functions in Matlab, e.g. gausswin
 
 """
 from __future__ import division
-from itertools import groupby
 
 import os
 import sys
 import time
 import csv
+import tempfile
 
 import numpy as np
 import scipy as sp
@@ -25,10 +25,14 @@ __ALL__ = ['scatter',
            'plotx',
            'imagesc',
            'separated_peaks',
+           'largest_separated_peaks',
+           'separated_peaks_by_row',
            'gausswin',
            'colon',
            'print_object'
            'write_to_CSV',
+           'find_runs',
+           'sum_over_runs',
            'interpolate_with_threshold',
            'interpolate_with_threshold_2D',
            'gausswin',
@@ -250,6 +254,196 @@ def separated_peaks(x, dist, use_max, value_cutoff):
     return (peaks, indices)
 
 
+def largest_separated_peaks(x, dist, value_cutoff, n_peaks):
+    """
+    The largest maximum peaks in each row of an array, as found by
+    separated_peaks(x[i], dist, True, value_cutoff[i]), for all rows at
+    once.
+
+    separated_peaks() considers the candidate peaks from largest to
+    smallest, and each one rules out the candidates near it. Here each
+    iteration considers the largest remaining candidate of every row, and
+    we stop once n_peaks peaks have been found in every row, so the loop
+    runs about n_peaks times rather than once per candidate per row.
+
+    Parameters
+    ---------------------------------------
+    x: numpy array, shape (n_rows, n_points)
+      The values to be searched for peaks
+    dist: int
+      The minimum distance between peaks
+    value_cutoff: numpy array, shape (n_rows,)
+      Peaks must be greater than this
+    n_peaks: int
+      The number of peaks to return per row
+
+    Returns
+    ---------------------------------------
+    indices: numpy array of ints, shape (n_rows, n_peaks)
+      The indices of the peaks in each row, largest peak first. Rows with
+      fewer than n_peaks peaks are padded with -1.
+
+    See Also
+    ---------------------------------------
+    separated_peaks
+
+    """
+    n_rows, n_points = x.shape
+    too_close = dist - 1
+
+    # Candidates are larger than the cutoff and than their neighbors
+    could_be_a_peak = x > value_cutoff[:, None]
+    could_be_a_peak[:, 1:] &= x[:, 1:] > x[:, :-1]
+    could_be_a_peak[:, :-1] &= x[:, :-1] > x[:, 1:]
+
+    # The maximum over [i - too_close, i + too_close) for each index i,
+    # which is the window that a peak at i rules out
+    padded_x = np.full((n_rows, n_points + 2 * too_close), -np.inf)
+    padded_x[:, too_close:too_close + n_points] = x
+    window_max = padded_x[:, 0:n_points].copy()
+    for offset in range(1, 2 * too_close):
+        np.maximum(window_max, padded_x[:, offset:offset + n_points],
+                   out=window_max)
+    is_window_max = window_max == x
+
+    indices = np.full((n_rows, n_peaks), -1, dtype=int)
+    n_found = np.zeros(n_rows, dtype=int)
+    point_I = np.arange(n_points)
+
+    while True:
+        row_I = (np.any(could_be_a_peak, axis=1) &
+                 (n_found < n_peaks)).nonzero()[0]
+        if row_I.size == 0:
+            break
+
+        cur_I = np.argmax(np.where(could_be_a_peak[row_I], x[row_I], -np.inf),
+                          axis=1)
+
+        is_peak = is_window_max[row_I, cur_I]
+        peak_row_I = row_I[is_peak]
+        indices[peak_row_I, n_found[peak_row_I]] = cur_I[is_peak]
+        n_found[peak_row_I] += 1
+
+        could_be_a_peak[row_I] &= \
+            (point_I < (cur_I - too_close)[:, None]) | \
+            (point_I >= (cur_I + too_close)[:, None])
+
+    return indices
+
+
+def separated_peaks_by_row(x, dist, use_max, value_cutoff):
+    """
+    Find the peaks (either minimum or maximum) in each row of an array,
+    as separated_peaks(x[i], dist, use_max, value_cutoff) does, for all
+    rows at once.
+
+    separated_peaks() considers the candidate peaks one at a time, from
+    the best to the worst, and each one rules out the candidates that are
+    too close to it. Here the candidates of all rows are decided together,
+    in rounds: a candidate is kept if it is the best of the undecided and
+    kept candidates that could rule it out, and is ruled out if a better
+    kept candidate is close to it. Each round decides at least the best
+    undecided candidate of every row, and generally most of them.
+
+    Parameters
+    ---------------------------------------
+    x: numpy array, shape (n_rows, n_points)
+      The values to be searched for peaks
+    dist: int
+      The minimum distance between peaks
+    use_max: boolean
+      True: find the maximum peaks
+      False: find the minimum peaks
+    value_cutoff: float
+      Maximum peaks must be greater than this, minimum peaks smaller
+
+    Returns
+    ---------------------------------------
+    is_peak_mask: numpy array of bools, shape (n_rows, n_points)
+
+    See Also
+    ---------------------------------------
+    separated_peaks
+
+    """
+    n_rows, n_points = x.shape
+    too_close = int(dist - 1)
+
+    if n_points < 2 * dist + 1:
+        raise ValueError('Rows must be longer than the search window, '
+                         'see separated_peaks')
+
+    # Lower keys are better, i.e. considered first
+    if use_max:
+        key = -x
+        could_be_a_peak = x > value_cutoff
+    else:
+        key = x
+        could_be_a_peak = x < value_cutoff
+
+    # A point can't be a peak if it is worse than either of its neighbors
+    could_be_a_peak[:, 1:] &= key[:, 1:] < key[:, :-1]
+    could_be_a_peak[:, :-1] &= key[:, :-1] < key[:, 1:]
+
+    # From here on we only work with the candidates, ordered by row and
+    # then by position
+    row_I, point_I = could_be_a_peak.nonzero()
+    cand_key = key[row_I, point_I]
+    n_cands = row_I.size
+
+    # A candidate at i rules out [i - too_close, i + too_close), and is
+    # a peak if it is the best value within that window
+    window_I = point_I[:, None] + np.arange(-too_close, too_close)
+    is_in_row = (window_I >= 0) & (window_I < n_points)
+    window_key = key[row_I[:, None], np.clip(window_I, 0, n_points - 1)]
+    window_key[~is_in_row] = np.inf
+    is_window_best = np.min(window_key, axis=1) == cand_key
+
+    # The order in which separated_peaks considers the candidates. Ranks
+    # are only compared within rows, so all rows can be sorted together.
+    rank = np.empty(n_cands)
+    rank[np.lexsort((cand_key, row_I))] = np.arange(n_cands)
+
+    # Pairs of candidates in which one can rule out the other. Candidates
+    # are at least 2 points apart, so those that are close are at most
+    # too_close candidates apart.
+    # (candidate, candidate that can rule it out)
+    pairs = []
+    for n_apart in range(1, min(too_close, n_cands - 1) + 1):
+        left_I = np.arange(n_cands - n_apart)
+        right_I = left_I + n_apart
+        distance = point_I[right_I] - point_I[left_I]
+        is_same_row = row_I[left_I] == row_I[right_I]
+
+        mask = is_same_row & (distance <= too_close)
+        pairs.append((left_I[mask], right_I[mask]))
+        mask = is_same_row & (distance < too_close)
+        pairs.append((right_I[mask], left_I[mask]))
+
+    def best_rank_of_rulers(is_ruler):
+        ruler_rank = np.where(is_ruler, rank, np.inf)
+        best_rank = ruler_rank.copy()
+        for cand_I, ruler_I in pairs:
+            best_rank[cand_I] = np.minimum(best_rank[cand_I],
+                                           ruler_rank[ruler_I])
+        return best_rank
+
+    is_undecided = np.ones(n_cands, dtype=bool)
+    is_kept = np.zeros(n_cands, dtype=bool)
+    while np.any(is_undecided):
+        is_new = is_undecided & \
+            (best_rank_of_rulers(is_undecided | is_kept) == rank)
+        is_kept |= is_new
+        is_undecided &= ~is_new
+        is_undecided &= ~(best_rank_of_rulers(is_kept) < rank)
+
+    is_peak_mask = np.zeros((n_rows, n_points), dtype=bool)
+    is_peak = is_kept & is_window_best
+    is_peak_mask[row_I[is_peak], point_I[is_peak]] = True
+
+    return is_peak_mask
+
+
 def colon(r1, inc, r2):
     """
       Matlab's colon operator, althought it doesn't although inc is required
@@ -439,6 +633,106 @@ def write_to_CSV(data_dict, filename):
     csv_file.close()
 
 
+def write_file_atomically(file_path, write_function):
+    """
+    Write to a temporary file in the same folder first, then move it in
+    place, so that other processes never see a partial file.  Processes
+    that have the old file open (e.g. memory-mapped) keep its contents.
+
+    Parameters
+    ---------------------------------------
+    file_path: string
+    write_function: function
+      Called with the temporary file, opened for writing in binary mode
+
+    """
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_function(f)
+        _replace_file(temp_path, file_path)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+if hasattr(os, 'replace'):
+    _replace_file = os.replace
+else:
+    # Python 2, where os.rename only replaces an existing file on POSIX
+    def _replace_file(source_path, file_path):
+        if os.name == 'nt' and os.path.exists(file_path):
+            os.remove(file_path)
+        os.rename(source_path, file_path)
+
+
+def find_runs(x):
+    """
+    Find the runs of consecutive equal, non-zero values in a frame mask.
+
+    Parameters
+    ---------------------------------------
+    x: 1-d numpy array of bools or ints
+      e.g. a mask of event frames, or frames signed with -1, 0 or 1
+
+    Returns
+    ---------------------------------------
+    (starts, ends, lengths): 1-d int numpy arrays
+      The first and last index (inclusive) and the number of values of
+      each run. For ints a run changes whenever the value changes,
+      e.g. [1, 1, -1, 0, 1] has the runs (0, 1), (2, 2) and (4, 4).
+
+    """
+    x = np.asarray(x)
+    n = x.size
+
+    # Indices where a new run of equal values begins
+    change_I = np.flatnonzero(x[1:] != x[:-1]) + 1
+    run_starts = np.concatenate(([0], change_I))
+    run_ends = np.concatenate((change_I, [n])) - 1
+
+    if n == 0:
+        run_starts = run_starts[:0]
+        run_ends = run_ends[:0]
+
+    # Only keep the runs of non-zero values
+    keep_mask = x[run_starts] != 0
+    starts = run_starts[keep_mask]
+    ends = run_ends[keep_mask]
+
+    return starts, ends, ends - starts + 1
+
+
+def sum_over_runs(x, starts, ends):
+    """
+    Sum x over each run, from starts[i] to ends[i] inclusive.
+
+    Parameters
+    ---------------------------------------
+    x: 1-d numpy array
+    starts, ends: 1-d int numpy arrays
+      As returned by find_runs, i.e. sorted and non-overlapping
+
+    Returns
+    ---------------------------------------
+    1-d numpy array, the sum over each run
+
+    """
+    if starts.size == 0:
+        return np.zeros(0, dtype=x.dtype)
+
+    # The padding allows for a run that ends at the last value
+    # e.g. starts = [2, 7], ends = [4, 9] => indices = [2, 5, 7, 10], and
+    # every other sum is between the runs
+    padded_x = np.concatenate((x, np.zeros(1, dtype=x.dtype)))
+    indices = np.empty(2 * starts.size, dtype=int)
+    indices[0::2] = starts
+    indices[1::2] = ends + 1
+
+    return np.add.reduceat(padded_x, indices)[0::2]
+
+
 def interpolate_with_threshold(array,
                                threshold=None,
                                make_copy=True,
@@ -528,34 +822,16 @@ def interpolate_with_threshold(array,
     # (If we weren't using a threshold and just interpolating all NaNs,
     # we could skip the next four lines.)
     if(threshold is not None):
-        # Group these together using a fancy trick from
-        # http://stackoverflow.com/questions/2154249/, since
-        # the lambda function x:x[0]-x[1] on an enumerated list will
-        # group consecutive integers together
-        # e.g. [[(0, 3)], [(1, 5), (2, 6), (3, 7)]]
-        x_grouped = [
-            list(group) for key,
-            group in groupby(
-                enumerate(x),
-                lambda i:i[0] -
-                i[1])]
-
-        # We want to know the first element from each "run", and the run's length
-        # e.g. [(3, 1), (5, 3)]
-        x_runs = [(i[0][1], len(i)) for i in x_grouped]
+        # We want to know the first element from each "run", and the run's
+        # length e.g. starts = [3, 5], lengths = [1, 3]
+        starts, ends, lengths = find_runs(np.isnan(new_array))
 
         # We need only interpolate on runs of length <= threshold
-        # e.g. if threshold = 2, then we have only [(3, 1)]
-        x_runs = [i for i in x_runs if i[1] <= threshold]
-
-        # now expand the remaining runs
-        # e.g. if threshold was 5, then x_runs would be [(3,1), (5,3)] so
-        #      x would be [3, 5, 6, 7]
-        # this give us the x-coordinates of the values to be interpolated:
+        # e.g. if threshold = 2, then we have only the run at 3.
+        # This give us the x-coordinates of the values to be interpolated:
+        x = x[np.repeat(lengths <= threshold, lengths)]
 
-        if x_runs:
-            x = np.concatenate([(i[0] + list(range(i[1]))) for i in x_runs])
-        else:
+        if x.size == 0:
             # consider th case that there where not valid groups remaining to
             # interpolate
             return new_array
@@ -935,8 +1211,14 @@ class ElementTimer(object):
     def tic(self):
         self.start_time = timing_function()
 
-    def toc(self, name):
-        elapsed_time = timing_function() - self.start_time
+    def toc(self, name, start_time=None):
+        """
+        Log the time elapsed since start_time, or since the last call to
+        tic() if start_time is not given.
+        """
+        if start_time is None:
+            start_time = self.start_time
+        elapsed_time = timing_function() - start_time
         self.times.append(elapsed_time)
         self.names.append(name)
         return elapsed_time
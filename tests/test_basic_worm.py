@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of loading and saving BasicWorm instances.
+
+"""
+import sys
+import os
+import shutil
+import collections
+import tempfile
+import h5py
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+
+def _write_schafer_file(file_path, n_frames=30):
+    """
+    Write a contour file as Matlab does, with each frame's contours
+    saved as a separate dataset that is pointed to by a reference.
+
+    Returns the contours that were written, with None for invalid frames.
+    """
+    rng = np.random.RandomState(0)
+    is_valid = rng.rand(n_frames) > 0.2
+    ventral_contours = [None] * n_frames
+    dorsal_contours = [None] * n_frames
+
+    all_contours = collections.OrderedDict(
+        [('all_vulva_contours', ventral_contours),
+         ('all_non_vulva_contours', dorsal_contours),
+         ('all_skeletons', [None] * n_frames)])
+
+    with h5py.File(file_path, 'w') as h:
+        refs = h.create_group('#refs#')
+        ref_dtype = h5py.special_dtype(ref=h5py.Reference)
+        for name in all_contours:
+            h.create_dataset(name, (n_frames, 1), dtype=ref_dtype)
+
+        # Write the frames backwards so that the file order differs from
+        # the frame order
+        for iFrame in range(n_frames)[::-1]:
+            for name, contours in all_contours.items():
+                if is_valid[iFrame]:
+                    data = rng.rand(2, rng.randint(20, 40))
+                    contours[iFrame] = data
+                else:
+                    # Matlab's empty matrix
+                    data = np.zeros(2, dtype=np.uint64)
+                dataset = refs.create_dataset('%s_%d' % (name, iFrame),
+                                              data=data)
+                h[name][iFrame, 0] = dataset.ref
+
+        h['is_valid'] = is_valid[None, :].astype(float)
+        h['is_stage_movement'] = \
+            (rng.rand(n_frames + 1) > 0.9)[None, :].astype(float)
+
+    return ventral_contours, dorsal_contours
+
+
+def test_from_schafer_file():
+    temp_path = tempfile.mkdtemp()
+    file_path = os.path.join(temp_path, 'contours.mat')
+    ventral_contours, dorsal_contours = _write_schafer_file(file_path)
+
+    try:
+        for n_workers in [None, 2]:
+            bw = mv.BasicWorm.from_schafer_file_factory(file_path, n_workers)
+
+            for contours, expected_contours in [
+                    (bw._h_ventral_contour, ventral_contours),
+                    (bw._h_dorsal_contour, dorsal_contours)]:
+                assert(len(contours) == len(expected_contours))
+                for x, expected_x in zip(contours, expected_contours):
+                    if expected_x is None:
+                        assert(x is None)
+                    else:
+                        assert(np.array_equal(x, expected_x))
+
+            frame_code = bw.video_info.frame_code
+            assert(frame_code.size == len(ventral_contours))
+            assert(np.array_equal(frame_code % 2 == 1,
+                                  [x is not None for x in ventral_contours]))
+    finally:
+        shutil.rmtree(temp_path)
+
+
+def test_heterocardinal_frames():
+    rng = np.random.RandomState(0)
+    frames = [None if i % 4 == 1 else rng.rand(2, rng.randint(1, 10))
+              for i in range(20)]
+    h_frames = mv.HeterocardinalFrames.from_frames(frames)
+
+    assert(len(h_frames) == len(frames))
+    assert(h_frames[-3] is frames[-3] is None)
+    for x, expected_x in zip(h_frames, frames):
+        assert((x is None and expected_x is None) or
+               np.array_equal(x, expected_x))
+
+    # Frames and slices of frames are views
+    assert(np.may_share_memory(h_frames[0], h_frames.data))
+    assert(np.may_share_memory(h_frames[5:12].data, h_frames.data))
+    assert(h_frames[5:12].to_list()[0] is None)
+    assert(np.array_equal(h_frames[5:12][1], frames[6]))
+
+    padded, n_points = h_frames.pad()
+    expected_padded, expected_n_points = \
+        mv.prefeatures.pre_features_helpers.WormParserHelpers.pad_frames(
+            frames)
+    assert(np.array_equal(n_points, expected_n_points))
+    assert(np.allclose(padded, expected_padded, equal_nan=True))
+
+    # Homocardinal frames, e.g. a (49,2,n) skeleton
+    skeleton = rng.rand(49, 2, 10)
+    skeleton[:, :, 3] = np.NaN
+    h_skeleton = mv.HeterocardinalFrames.from_homocardinal(skeleton)
+    assert(h_skeleton[3] is None)
+    assert(np.array_equal(h_skeleton[4], skeleton[:, :, 4].T))
+    assert(np.allclose(h_skeleton.pad()[0], skeleton, equal_nan=True))
+
+    # The frames can be saved to JSON
+    basic_worm = mv.prefeatures.basic_worm
+    h_frames2 = basic_worm.json_to_data(basic_worm.data_to_json(h_frames))
+    assert(isinstance(h_frames2, mv.HeterocardinalFrames))
+    assert(np.array_equal(h_frames2.data, h_frames.data))
+    assert(np.array_equal(h_frames2.offsets, h_frames.offsets))
+    assert(np.array_equal(h_frames2.is_valid, h_frames.is_valid))
+
+
+def test_save_and_load():
+    temp_path = tempfile.mkdtemp()
+    file_path = os.path.join(temp_path, 'contours.mat')
+    _write_schafer_file(file_path)
+
+    try:
+        bw = mv.BasicWorm.from_schafer_file_factory(file_path)
+        bw.video_info.fps = 30
+        # The cached frame code descriptions are not saved
+        bw.video_info._frame_code_info = object()
+
+        for compress in [False, True]:
+            npz_path = os.path.join(temp_path, 'bw%d.npz' % compress)
+            bw.save(npz_path, compress)
+
+            bw2 = mv.BasicWorm()
+            bw2.load(npz_path)
+            assert(bw2.video_info.fps == 30)
+            assert(np.array_equal(bw2.video_info.frame_code,
+                                  bw.video_info.frame_code))
+            for key in ['h_ventral_contour', 'h_dorsal_contour']:
+                value = getattr(bw2, key)
+                expected_value = getattr(bw, key)
+                assert(isinstance(value, mv.HeterocardinalFrames))
+                for name in ['data', 'offsets', 'is_valid']:
+                    assert(np.array_equal(getattr(value, name),
+                                          getattr(expected_value, name)))
+
+        # Partial loads leave the other attributes alone
+        bw3 = mv.BasicWorm()
+        bw3.load(npz_path, keys=['h_dorsal_contour'])
+        assert(bw3.h_ventral_contour is None)
+        assert(bw3.video_info.fps != 30)
+        assert(np.array_equal(bw3.h_dorsal_contour.data,
+                              bw.h_dorsal_contour.data))
+
+        # Only the known classes can be loaded, not any class named in
+        # the file
+        with np.load(npz_path) as npz:
+            arrays = dict(npz.items())
+        metadata = str(arrays['__metadata__'][()]).replace(
+            'open_worm_analysis_toolbox.prefeatures.video_info.VideoInfo',
+            'subprocess.Popen')
+        arrays['__metadata__'] = np.array(metadata)
+        np.savez(npz_path, **arrays)
+        try:
+            mv.BasicWorm().load(npz_path)
+        except ValueError as e:
+            assert('subprocess.Popen' in str(e))
+        else:
+            assert(False)
+
+        # Nor can other classes be saved
+        bw.video_info.extra = mv.BasicWorm()
+        try:
+            bw.save(npz_path)
+        except TypeError:
+            pass
+        else:
+            assert(False)
+    finally:
+        shutil.rmtree(temp_path)
+
+
+def _assert_frames_equal(frames, expected_frames):
+    assert(len(frames) == len(expected_frames))
+    for x, expected_x in zip(frames, expected_frames):
+        if expected_x is None:
+            assert(x is None)
+        else:
+            assert(np.allclose(x, expected_x, equal_nan=True))
+
+
+def test_WCON():
+    rng = np.random.RandomState(0)
+    s = np.linspace(0, 1, 49)[:, None]
+    t = np.arange(50)[None, :] / 25.0
+    x = 1000 * s + 150 * t + 5 * rng.rand(49, 50)
+    y = 60 * np.sin(2 * np.pi * (1.5 * s - 0.5 * t))
+    skeleton = np.stack([x, y], axis=1)
+    skeleton[:, :, [10, 11]] = np.NaN
+    bw = mv.BasicWorm.from_skeleton_factory(skeleton)
+    bw.video_info.fps = 20
+
+    # The skeleton is computed as the worm is saved.  The skeleton
+    # calculation changes the contour it is given, so give it a copy.
+    expected_skeleton = mv.BasicWorm.from_skeleton_factory(skeleton).h_skeleton
+
+    temp_path = tempfile.mkdtemp()
+    try:
+        for file_name in ['worm.wcon', 'worm.wcon.zip']:
+            file_path = os.path.join(temp_path, file_name)
+            bw.save_to_WCON(file_path, frames_per_record=7)
+
+            bw2 = mv.BasicWorm.from_WCON_factory(file_path)
+            assert(np.isclose(bw2.video_info.fps, 20))
+            assert(np.array_equal(bw2.video_info.frame_code,
+                                  bw.video_info.frame_code))
+            _assert_frames_equal(bw2.h_ventral_contour, bw.h_ventral_contour)
+            _assert_frames_equal(bw2.h_dorsal_contour, bw.h_dorsal_contour)
+            _assert_frames_equal(bw2.h_skeleton, expected_skeleton)
+
+        # Several worms, offsets, a single time record, nulls and keys
+        # that are skipped, read a few characters at a time
+        file_path = os.path.join(temp_path, 'worms.wcon')
+        with open(file_path, 'w') as f:
+            f.write("""
+            {"units": {"t": "s", "x": "mm", "y": "mm"},
+             "metadata": {"lab": {"name": "Test Lab"}},
+             "data": [
+                {"id": "1", "t": [0, 0.5], "ox": 10, "oy": [0, 100],
+                 "@custom": {"a": [1, [2, 3]]}, "cx": [0, 0],
+                 "x": [[1, 2, 3], []], "y": [[4, 5, 6], []]},
+                {"id": "2", "t": 1, "x": [7], "y": [8]},
+                {"x": [1.25, null], "y": [-2e-3, 1E2], "t": 1.0,
+                 "id": "1"}
+             ],
+             "files": {"current": "worms.wcon"}
+            }""")
+
+        frames, t, units, metadata = \
+            mv.prefeatures.wcon_io.read_wcon(file_path, chunk_size=7)
+        assert(np.array_equal(t, [0, 0.5, 1]))
+        assert(units['x'] == 'mm')
+        assert(metadata['lab']['name'] == 'Test Lab')
+        assert(frames['ventral_contour'] is None)
+        _assert_frames_equal(frames['skeleton'],
+                             [np.array([[11, 12, 13], [4, 5, 6]]), None,
+                              np.array([[1.25, np.NaN], [-2e-3, 100]])])
+
+        frames, t, units, metadata = \
+            mv.prefeatures.wcon_io.read_wcon(file_path, worm_id='2')
+        _assert_frames_equal(frames['skeleton'], [np.array([[7], [8]])])
+
+        # The coordinates are converted to microns, so that a worm is
+        # saved as it was read
+        bw3 = mv.BasicWorm.from_WCON_factory(file_path, worm_id='2')
+        assert(np.array_equal(bw3.video_info.frame_code, [1]))
+        _assert_frames_equal(bw3.h_skeleton, [np.array([[7000], [8000]])])
+
+        um_file_path = os.path.join(temp_path, 'worm_um.wcon')
+        bw3.save_to_WCON(um_file_path)
+        frames, t, units, metadata = \
+            mv.prefeatures.wcon_io.read_wcon(um_file_path)
+        assert(units['x'] == 'um')
+        _assert_frames_equal(frames['skeleton'], [np.array([[7000], [8000]])])
+
+        with open(file_path, 'w') as f:
+            f.write('{"units": {"t": "s", "x": "furlong", "y": "furlong"},'
+                    ' "data": {"id": 1, "t": 0, "x": [1], "y": [2]}}')
+        try:
+            mv.BasicWorm.from_WCON_factory(file_path)
+        except ValueError as e:
+            assert('furlong' in str(e))
+        else:
+            assert(False)
+    finally:
+        shutil.rmtree(temp_path)
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_from_schafer_file()
+    test_heterocardinal_frames()
+    test_save_and_load()
+    test_WCON()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the on-disk feature cache.
+
+"""
+import sys
+import os
+import shutil
+import tempfile
+import h5py
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+from test_feature_dependencies import _get_synthetic_worm, _is_same
+
+
+def test_feature_cache():
+    nw = _get_synthetic_worm()
+    cache_path = tempfile.mkdtemp()
+
+    try:
+        wf = mv.WormFeatures(nw)
+        wf1 = mv.WormFeatures(nw, cache=cache_path)
+        wf2 = mv.WormFeatures(nw, cache=mv.FeatureCache(cache_path))
+
+        # Everything should have been loaded rather than computed, so the
+        # recorded computation times are those of the first run
+        assert(list(wf._features) == list(wf2._features))
+        for feature_name in wf._features:
+            feature1 = wf1._features[feature_name]
+            feature2 = wf2._features[feature_name]
+            assert(feature1.computation_time == feature2.computation_time)
+            assert(feature2.spec is wf2.specs[feature_name])
+            del feature1.cache_key, feature2.cache_key
+            assert(_is_same(wf._features[feature_name], feature2))
+
+        # Only the crawling bends use this option
+        options = mv.FeatureProcessingOptions()
+        options.locomotion.crawling_bends.peak_energy_threshold = 0.4
+        wf3 = mv.WormFeatures(nw, options)
+        wf4 = mv.WormFeatures(nw, options, cache=cache_path)
+
+        for feature_name in wf._features:
+            feature1 = wf1._features[feature_name]
+            feature4 = wf4._features[feature_name]
+            is_recomputed = \
+                feature1.computation_time != feature4.computation_time
+            assert(is_recomputed ==
+                   feature_name.startswith('locomotion.crawling_bends'))
+            del feature4.cache_key
+            assert(_is_same(wf3._features[feature_name], feature4))
+
+        # Editing a file named by an option invalidates the features
+        # computed from it, even though the option's value is the same
+        eigen_worm_file_path = os.path.join(cache_path, 'eigen_worms.mat')
+        features_path = os.path.dirname(mv.features.posture_features.__file__)
+        shutil.copyfile(os.path.join(features_path, mv.config.EIGENWORM_FILE),
+                        eigen_worm_file_path)
+        options = mv.FeatureProcessingOptions()
+        options.posture.eigen_worm_file_path = eigen_worm_file_path
+        wf5 = mv.WormFeatures(nw, options, cache=cache_path)
+
+        with h5py.File(eigen_worm_file_path, 'r+') as h:
+            h['eigenWorms'][...] = -h['eigenWorms'].value
+        modification_time = os.stat(eigen_worm_file_path).st_mtime + 10
+        os.utime(eigen_worm_file_path,
+                 (modification_time, modification_time))
+        wf6 = mv.WormFeatures(nw, options, cache=cache_path)
+
+        for feature_name in wf._features:
+            feature5 = wf5._features[feature_name]
+            feature6 = wf6._features[feature_name]
+            is_recomputed = \
+                feature5.computation_time != feature6.computation_time
+            assert(is_recomputed ==
+                   feature_name.startswith('posture.all_eigenprojections') or
+                   feature_name.startswith('posture.eigen_projection'))
+    finally:
+        shutil.rmtree(cache_path)
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_feature_cache()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the feature dependencies declared in features_list.csv, and of
+the parallel computation of features, within a video (which relies on
+these dependencies) and across videos.
+
+"""
+import sys
+import os
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+
+def _get_synthetic_worm(num_frames=300):
+    """
+    A worm crawling along the x axis, with a travelling sine wave along
+    its body, and a few missing frames.
+    """
+    rng = np.random.RandomState(0)
+    s = np.linspace(0, 1, 49)[:, None]
+    t = np.arange(num_frames)[None, :] / 25.0
+
+    x = 1000 * s + 150 * t + rng.rand(49, num_frames)
+    y = 60 * np.sin(2 * np.pi * (1.5 * s - 0.5 * t)) + 50 * np.sin(t / 5)
+
+    skeleton = np.stack([x, y], axis=1)
+    skeleton[:, :, [10, 11, 200]] = np.NaN
+
+    bw = mv.BasicWorm.from_skeleton_factory(skeleton)
+    return mv.NormalizedWorm.from_BasicWorm_factory(bw)
+
+
+def _is_same(value1, value2):
+    if isinstance(value1, np.ndarray):
+        return np.allclose(value1, value2, equal_nan=True)
+    elif isinstance(value1, (list, tuple)):
+        return len(value1) == len(value2) and \
+            all(_is_same(x, y) for x, y in zip(value1, value2))
+    elif hasattr(value1, '__dict__'):
+        d1 = value1.__dict__
+        d2 = value2.__dict__
+        return set(d1) == set(d2) and \
+            all(_is_same(d1[x], d2[x]) for x in d1
+                if x not in ['computation_time', 'spec'])
+    elif isinstance(value1, float) and np.isnan(value1):
+        return np.isnan(value2)
+    else:
+        return value1 == value2
+
+
+def test_declared_dependencies():
+    # The dependencies in the specs should be exactly the features that
+    # are requested while computing each feature
+    wf = mv.WormFeatures(_get_synthetic_worm())
+
+    for feature_name in wf.specs:
+        feature = wf._features[feature_name]
+        assert(getattr(feature, 'dependencies', []) ==
+               wf.specs[feature_name].dependencies)
+
+
+def test_parallel_features():
+    nw = _get_synthetic_worm()
+    wf1 = mv.WormFeatures(nw)
+    wf2 = mv.WormFeatures(nw, n_workers=2)
+
+    assert(list(wf1._features) == list(wf2._features))
+    assert(sorted(wf1.timer.names) == sorted(wf2.timer.names))
+    for feature_name in wf1._features:
+        assert(_is_same(wf1._features[feature_name],
+                        wf2._features[feature_name]))
+        assert(wf2._features[feature_name].spec is wf2.specs[feature_name])
+
+    # Only some of the features, with some temporary features needed to
+    # compute them
+    specs = mv.get_feature_specs()
+    specs = specs[specs['feature_name'].str.contains(r'^posture\.')]
+    wf3 = mv.WormFeatures(nw, specs=specs)
+    wf4 = mv.WormFeatures(nw, specs=specs, n_workers=2)
+
+    assert(list(wf3._features) == list(wf4._features))
+    for feature_name in wf3._features:
+        assert(_is_same(wf3._features[feature_name],
+                        wf4._features[feature_name]))
+
+
+def test_compute_many():
+    nw = _get_synthetic_worm()
+    wf = mv.WormFeatures(nw)
+
+    # The missing file should fail without stopping the other videos
+    results = list(mv.WormFeatures.compute_many(
+        [nw, 'missing_video.mat', nw], n_workers=2))
+
+    assert(sorted(x.index for x in results) == [0, 1, 2])
+    for result in results:
+        if result.index == 1:
+            assert(result.source == 'missing_video.mat')
+            assert(result.features is None)
+            assert(result.error is not None)
+        else:
+            assert(result.source is None)
+            assert(result.error is None)
+            assert(result.elapsed_time > 0)
+            assert(result.timer.names == wf.timer.names)
+            for feature_name in wf._features:
+                assert(_is_same(wf._features[feature_name],
+                                result.features._features[feature_name]))
+
+
+class _TwoArgumentError(Exception):
+    # Pickles, but can't be unpickled, as its args are just the message
+
+    def __init__(self, a, b):
+        super(_TwoArgumentError, self).__init__('%s %s' % (a, b))
+
+
+class _Unpicklable(object):
+
+    def __reduce__(self):
+        return (_TwoArgumentError, ('only one argument',))
+
+
+def test_parallel_feature_errors():
+    # A feature that fails, whose worker dies, or whose result can't be
+    # sent back from the worker, should raise rather than hang
+    nw = _get_synthetic_worm()
+    specs = mv.get_feature_specs()
+    specs = specs[specs['feature_name'] == 'morphology.length']
+    Length = mv.features.morphology_features.Length
+    original_init = Length.__init__
+
+    def raise_error(self, wf, feature_name):
+        raise _TwoArgumentError('bad', 'length')
+
+    def exit_worker(self, wf, feature_name):
+        os._exit(1)
+
+    def return_lambda(self, wf, feature_name):
+        original_init(self, wf, feature_name)
+        self.value = lambda: None
+
+    def return_unpicklable(self, wf, feature_name):
+        original_init(self, wf, feature_name)
+        self.value = _Unpicklable()
+
+    try:
+        for new_init, message in [(raise_error, 'bad length'),
+                                  (exit_worker, 'died'),
+                                  (return_lambda, 'could not be pickled'),
+                                  (return_unpicklable,
+                                   'could not be unpickled')]:
+            Length.__init__ = new_init
+            try:
+                mv.WormFeatures(nw, specs=specs, n_workers=2)
+            except RuntimeError as e:
+                assert(message in str(e))
+                assert('morphology.length' in str(e))
+            else:
+                assert(False)
+    finally:
+        Length.__init__ = original_init
+
+
+def test_compute_many_worker_errors():
+    # A video whose worker dies, or whose features can't be sent back,
+    # should fail without stopping the other videos
+    nws = [_get_synthetic_worm(num_frames) for num_frames in [300, 310, 320]]
+    specs = mv.get_feature_specs()
+    specs = specs[specs['feature_name'] == 'morphology.length']
+    Length = mv.features.morphology_features.Length
+    original_init = Length.__init__
+
+    def exit_or_return_lambda(self, wf, feature_name):
+        original_init(self, wf, feature_name)
+        if len(self.value) == 310:
+            os._exit(1)
+        elif len(self.value) == 320:
+            self.value = lambda: None
+
+    try:
+        Length.__init__ = exit_or_return_lambda
+        results = list(mv.WormFeatures.compute_many(nws, n_workers=2,
+                                                    specs=specs))
+    finally:
+        Length.__init__ = original_init
+
+    results = sorted(results, key=lambda x: x.index)
+    assert([x.index for x in results] == [0, 1, 2])
+    assert(results[0].error is None)
+    assert(len(results[0].features._features['morphology.length'].value) ==
+           300)
+    for result, message in [(results[1], 'died'),
+                            (results[2], 'could not be pickled')]:
+        assert(result.features is None)
+        assert(message in result.error)
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_declared_dependencies()
+    test_parallel_features()
+    test_parallel_feature_errors()
+    test_compute_many()
+    test_compute_many_worker_errors()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of feature expansion, i.e. feature_manipulations.expand_mrc_features
+
+"""
+import sys
+import os
+import pickle
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+from test_feature_dependencies import _get_synthetic_worm
+
+
+def test_expand_movement_features():
+    wf = mv.WormFeatures(_get_synthetic_worm())
+    expanded_wf = mv.feature_manipulations.expand_mrc_features(wf)
+
+    feature = wf.get_features('locomotion.velocity.midbody.speed')
+    motion_mode = wf.get_features('locomotion.motion_mode').value
+    value = feature.value
+
+    name = feature.name + '.%s_data_with_%s_movement'
+    expanded_feature = expanded_wf.get_features(
+        name % ('absolute', 'forward'))
+
+    # Nothing is selected until the value is requested
+    assert('_value' not in expanded_feature.__dict__)
+    assert(expanded_feature.spec.type == 'expanded_movement')
+    assert(not expanded_feature.spec.is_signed)
+    assert(expanded_feature.is_user_requested)
+
+    good_mask = ~np.isnan(value)
+    assert(np.array_equal(expanded_feature.value,
+                          np.absolute(value[good_mask & (motion_mode == 1)])))
+    assert(np.array_equal(
+        expanded_wf.get_features(name % ('negative', 'paused')).value,
+        value[(value <= 0) & (motion_mode == 0)]))
+
+    # The original feature is unchanged
+    assert(feature.spec.type == 'movement')
+    assert(feature.value is value)
+
+    expanded_feature = pickle.loads(pickle.dumps(
+        expanded_wf.get_features(name % ('all', 'backward'))))
+    assert(np.array_equal(expanded_feature.value,
+                          value[good_mask & (motion_mode == -1)]))
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_expand_movement_features()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
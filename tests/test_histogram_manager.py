@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the HistogramManager.
+
+"""
+import sys
+import os
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+from test_feature_dependencies import _get_synthetic_worm
+
+
+def test_streaming_histogram_manager():
+    # Merging the histograms of each video as it arrives should give the
+    # same merged histograms, just without their data and with the counts
+    # summed over the videos
+    feature_sets = [mv.feature_manipulations.expand_mrc_features(
+        mv.WormFeatures(_get_synthetic_worm(num_frames)))
+        for num_frames in [300, 400]]
+
+    hist_manager1 = mv.HistogramManager(feature_sets)
+    hist_manager2 = mv.HistogramManager(iter(feature_sets), streaming=True)
+
+    assert(len(hist_manager1) == len(hist_manager2))
+    assert(np.any(hist_manager1.valid_histograms_mask))
+    assert(np.array_equal(hist_manager1.valid_histograms_mask,
+                          hist_manager2.valid_histograms_mask))
+    assert(hist_manager2.hist_cell_array is None)
+    assert(hist_manager1.num_videos == hist_manager2.num_videos == 2)
+    assert(np.array_equal(hist_manager1.valid_2d_mask,
+                          hist_manager2.valid_2d_mask))
+
+    for hist1, hist2 in zip(hist_manager1.valid_histograms_array,
+                            hist_manager2.valid_histograms_array):
+        assert(hist1.data is not None)
+        assert(hist2.data is None)
+        assert(np.array_equal(hist1.counts.sum(axis=0), hist2.counts))
+        for attribute in ['bin_midpoints', 'pdf', 'num_samples_per_video']:
+            assert(np.array_equal(getattr(hist1, attribute),
+                                  getattr(hist2, attribute)))
+        for attribute in ['mean_per_video', 'std_per_video']:
+            np.testing.assert_array_equal(getattr(hist1, attribute),
+                                          getattr(hist2, attribute))
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_streaming_histogram_manager()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of lazily loading features from a Schafer lab feature file.
+
+"""
+import sys
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+
+def _write_feature_file(file_path):
+    """
+    Write a feature file with just the morphology features, saved as
+    Matlab does, as (1,n) arrays.
+    """
+    with h5py.File(file_path, 'w') as h:
+        morphology = h.create_group('worm/morphology')
+        morphology['length'] = np.linspace(900, 1000, 50)[None, :]
+        morphology['area'] = np.linspace(70000, 80000, 50)[None, :]
+
+
+def test_lazy_loading():
+    temp_path = tempfile.mkdtemp()
+    file_path = os.path.join(temp_path, 'features.mat')
+    _write_feature_file(file_path)
+
+    try:
+        with mv.WormFeatures.from_disk(file_path, lazy=True) as wf:
+            assert(len(wf._features) == 0)
+
+            area_per_length = wf.get_features('morphology.area_per_length')
+            assert(np.allclose(area_per_length.value,
+                               np.linspace(70000, 80000, 50) /
+                               np.linspace(900, 1000, 50)))
+
+            # Only the requested feature and its dependencies are read
+            assert(sorted(wf._features) == ['morphology.area',
+                                             'morphology.area_per_length',
+                                             'morphology.length'])
+            assert([x.name for x in wf.features] ==
+                   ['morphology.area_per_length'])
+
+        assert(wf.h is None)
+
+        # Features that were read are still available once closed
+        assert(wf.get_features('morphology.length').value.size == 50)
+
+        try:
+            wf.get_features('morphology.width.head')
+        except ValueError:
+            pass
+        else:
+            assert(False)
+    finally:
+        shutil.rmtree(temp_path)
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_lazy_loading()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the locomotion features that are computed in batches of frames.
+
+"""
+import sys
+import os
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+from open_worm_analysis_toolbox.features import locomotion_bends
+from open_worm_analysis_toolbox.features import velocity
+from open_worm_analysis_toolbox.features import locomotion_turns
+from open_worm_analysis_toolbox.features import events
+from open_worm_analysis_toolbox.features.feature_processing_options import \
+    LocomotionCrawlingBends
+
+
+def test_separated_peaks_by_row():
+    # The peaks of each row should be those found one row at a time by
+    # separated_peaks
+    rng = np.random.RandomState(0)
+    x = np.abs(np.fft.rfft(rng.randn(200, 49), 512, axis=1))[:, 0:256]
+    x[1, :] = 1
+
+    for use_max, value_cutoff in [(True, 0.5), (False, np.inf)]:
+        is_peak_mask = mv.utils.separated_peaks_by_row(
+            x, 5, use_max, value_cutoff)
+        for cur_x, cur_mask in zip(x, is_peak_mask):
+            _, expected_indices = mv.utils.separated_peaks(
+                cur_x, 5, use_max, value_cutoff)
+            assert(np.array_equal(np.flatnonzero(cur_mask),
+                                  expected_indices))
+
+
+def test_crawling_bend_data():
+    # A sine wave at 0.5 Hz, with windows of several different lengths
+    fps = 25
+    options = LocomotionCrawlingBends()
+    t = np.arange(1000) / fps
+    avg_bend_angles = 30 * np.sin(2 * np.pi * 0.5 * t) + 5
+    is_paused = np.zeros(1000, dtype=bool)
+    is_paused[500:550] = True
+
+    bound_info = locomotion_bends.CrawlingBendsBoundInfo(
+        avg_bend_angles, is_paused, options, fps)
+    amplitude, frequency = locomotion_bends.BendHelper().h__getBendData(
+        avg_bend_angles, bound_info, options, None, fps)
+
+    is_valid = ~np.isnan(frequency)
+    assert(np.any(is_valid))
+    assert(np.array_equal(is_valid, ~np.isnan(amplitude)))
+    assert(not np.any(is_valid & bound_info.is_bad_mask))
+    assert(np.allclose(np.abs(frequency[is_valid]), 0.5, atol=0.1))
+    assert(np.array_equal(np.sign(frequency[is_valid]),
+                          np.sign(amplitude[is_valid])))
+
+
+def test_bounding_zero_indices():
+    rng = np.random.RandomState(0)
+    avg_bend_angles = np.cumsum(rng.randn(2000)) + rng.randn(2000)
+    sign_change_I = np.flatnonzero(np.sign(avg_bend_angles[:-1]) !=
+                                   np.sign(avg_bend_angles[1:]))
+    frame_I = np.arange(2000)
+    bound_info = locomotion_bends.CrawlingBendsBoundInfo.__new__(
+        locomotion_bends.CrawlingBendsBoundInfo)
+
+    half_distances = []
+    for mimic_old_behaviour in [True, False]:
+        back_zeros_I, front_zeros_I = \
+            bound_info.h__getBoundingZeroIndices(avg_bend_angles, 25,
+                                                 mimic_old_behaviour)
+        is_valid = back_zeros_I != -1
+        assert(np.any(is_valid))
+        assert(np.all(np.in1d(back_zeros_I[is_valid], sign_change_I)))
+        assert(np.all(np.in1d(front_zeros_I[is_valid] - 1, sign_change_I)))
+        assert(np.all(back_zeros_I[is_valid] < frame_I[is_valid]))
+        assert(np.all(front_zeros_I[is_valid] > frame_I[is_valid]))
+
+        back_zeros_I = back_zeros_I[is_valid]
+        front_zeros_I = front_zeros_I[is_valid]
+        cur_frame_I = frame_I[is_valid]
+        half_distance = np.maximum(cur_frame_I - back_zeros_I,
+                                   front_zeros_I - cur_frame_I)
+        if mimic_old_behaviour:
+            assert(np.all(front_zeros_I - back_zeros_I + 1 >= 25))
+        else:
+            assert(np.all(2 * half_distance + 1 >= 25))
+
+        half_distances.append(np.full(2000, np.NaN))
+        half_distances[-1][is_valid] = half_distance
+
+    # The old behaviour expands the windows past what is needed
+    is_valid = ~np.isnan(half_distances[0]) & ~np.isnan(half_distances[1])
+    assert(np.all(half_distances[1][is_valid] <= half_distances[0][is_valid]))
+    assert(np.any(half_distances[1][is_valid] < half_distances[0][is_valid]))
+
+
+def test_compute_speeds():
+    # Stacked segments should give the same result as one segment at a time,
+    # and segments with the same missing frames should share their indices
+    rng = np.random.RandomState(0)
+    sx = np.cumsum(rng.randn(20, 500), axis=1)
+    sy = np.cumsum(rng.randn(20, 500), axis=1)
+    sx[:, rng.rand(500) < 0.1] = np.NaN
+    sy[:, np.isnan(sx[0])] = np.NaN
+    avg_body_angle = 360 * rng.rand(500) - 180
+    segments = [(sx[0:10], sy[0:10]), (sx[10:20], sy[10:20])]
+
+    cache = {}
+    speeds, directions, motion_directions = velocity.compute_speeds(
+        25, segments, avg_body_angle, 0.5, 1, cache)
+    assert(speeds.shape == (2, 500))
+    assert(len(cache) == 1)
+
+    for i, (x, y) in enumerate(segments):
+        speed, direction, motion_direction = velocity.compute_speed(
+            25, x, y, avg_body_angle, 0.5, 1)
+        assert(np.allclose(speed, speeds[i], equal_nan=True))
+        assert(np.allclose(direction, directions[i], equal_nan=True))
+        assert(np.allclose(motion_direction, motion_directions[i],
+                           equal_nan=True))
+
+    good_frames_mask = ~np.isnan(avg_body_angle)
+    frames_per_sample = velocity.get_frames_per_sample(25, 0.5)
+    indices = velocity.get_speed_indices(frames_per_sample, good_frames_mask,
+                                         cache)
+    assert(len(cache) == 1)
+    assert(indices is velocity.get_speed_indices(frames_per_sample,
+                                                 good_frames_mask, cache))
+
+
+def test_head_tail_direction_change():
+    # A worm that turns around slowly, across the +/- 180 degree wrap and
+    # with some missing frames, should only be flagged when it turns fast
+    class SkeletonPartitions(object):
+
+        def __init__(self, angles):
+            head_x = np.tile(np.cos(angles), (3, 1))
+            head_y = np.tile(np.sin(angles), (3, 1))
+            self.partitions = {'head': (head_x, head_y),
+                               'tail': (-head_x, -head_y)}
+
+        def get_partition(self, partition_key, data_key,
+                          split_spatial_dimensions):
+            return self.partitions[partition_key]
+
+    fps = 25
+    degrees_per_frame = np.ones(1000)
+    degrees_per_frame[600:700] = 10
+    angles = np.deg2rad(150 + np.cumsum(degrees_per_frame))
+    angles[[100, 101, 102, 400, 650]] = np.NaN
+
+    is_omega_angle_change = \
+        locomotion_turns.OmegaTurns.h_getHeadTailDirectionChange(
+            None, SkeletonPartitions(angles), fps)
+
+    half_window_size = round(fps / 4)
+    assert(not np.any(is_omega_angle_change[:600 - half_window_size]))
+    assert(np.all(is_omega_angle_change[600 + half_window_size:
+                                        700 - half_window_size]))
+    assert(not np.any(is_omega_angle_change[700 + half_window_size:]))
+
+
+def test_find_runs():
+    starts, ends, lengths = mv.utils.find_runs(
+        np.array([1, 1, -1, 0, 0, 1, 0, 1]))
+    assert(np.array_equal(starts, [0, 2, 5, 7]))
+    assert(np.array_equal(ends, [1, 2, 5, 7]))
+    assert(np.array_equal(lengths, [2, 1, 1, 1]))
+
+    starts, ends, lengths = mv.utils.find_runs(np.zeros(5, dtype=bool))
+    assert(starts.size == 0 and ends.size == 0 and lengths.size == 0)
+
+    x = np.arange(10.0)
+    sums = mv.utils.sum_over_runs(x, np.array([0, 3, 9]), np.array([1, 5, 9]))
+    assert(np.array_equal(sums, [1, 12, 9]))
+
+
+def test_event_finder():
+    # Gaps of up to 2 frames are merged, and events need at least 3 frames
+    # and a summed distance of at least 4
+    speed = np.array([np.NaN, 1, 1, 0, 0, 1, 0, 0, 0, 1, 1, 1, 0, 1, 0, 1])
+    ef = events.EventFinder()
+    ef.min_speed_threshold = 0.5
+    ef.max_inter_frames_threshold = 2
+    ef.include_at_inter_frames_threshold = True
+    ef.min_frames_threshold = 3
+    ef.min_distance_threshold = np.full(speed.size, 4.0)
+    ef.include_at_distance_threshold = False
+
+    event_list = ef.get_events(speed)
+    assert(np.array_equal(event_list.starts_and_stops, [[9, 15]]))
+
+    ef.min_distance_threshold = None
+    event_list = ef.get_events(speed)
+    assert(np.array_equal(event_list.starts_and_stops, [[0, 5], [9, 15]]))
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_separated_peaks_by_row()
+    test_crawling_bend_data()
+    test_bounding_zero_indices()
+    test_compute_speeds()
+    test_head_tail_direction_change()
+    test_find_runs()
+    test_event_finder()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of saving and opening NormalizedWorm instances.
+
+"""
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+
+def test_save_and_open():
+    rng = np.random.RandomState(0)
+    s = np.linspace(0, 1, 49)[:, None]
+    t = np.arange(100)[None, :] / 25.0
+    x = 1000 * s + 150 * t + 5 * rng.rand(49, 100)
+    y = 60 * np.sin(2 * np.pi * (1.5 * s - 0.5 * t))
+    skeleton = np.stack([x, y], axis=1)
+    skeleton[:, :, [10, 11]] = np.NaN
+
+    bw = mv.BasicWorm.from_skeleton_factory(skeleton)
+    nw = mv.NormalizedWorm.from_BasicWorm_factory(bw)
+    nw.video_info.fps = 30
+
+    temp_path = tempfile.mkdtemp()
+    nw_path = os.path.join(temp_path, 'nw')
+    try:
+        nw.save(nw_path)
+
+        for mmap in [True, False]:
+            nw2 = mv.NormalizedWorm.open(nw_path, mmap)
+            assert(type(nw2.video_info) is mv.VideoInfo)
+            assert(nw2.video_info.fps == 30)
+            assert(np.array_equal(nw2.video_info.frame_code,
+                                  nw.video_info.frame_code))
+            assert(nw2.worm_partitions == nw.worm_partitions)
+            for key in ['skeleton', 'ventral_contour', 'dorsal_contour',
+                        'angles', 'widths', 'length', 'area']:
+                value = getattr(nw2, key)
+                assert(type(value) is np.ndarray)
+                # NaNs in the same places count as equal
+                np.testing.assert_array_equal(value, getattr(nw, key))
+                assert(isinstance(value.base, np.memmap) == mmap)
+
+        # Changes to a memory-mapped worm are not written to disk
+        nw2 = mv.NormalizedWorm.open(nw_path)
+        nw2.skeleton[:] = 0
+        nw3 = mv.NormalizedWorm.open(nw_path)
+        np.testing.assert_array_equal(nw3.skeleton, nw.skeleton)
+        del nw2, nw3
+
+        # Features can be computed from the opened worm
+        wf = mv.WormFeatures(mv.NormalizedWorm.open(nw_path))
+        expected_wf = mv.WormFeatures(nw)
+        for name in ['morphology.length', 'locomotion.velocity.midbody.speed']:
+            np.testing.assert_array_equal(
+                wf.get_features(name).value,
+                expected_wf.get_features(name).value)
+
+        # A memory-mapped worm can be modified and saved back to where it
+        # was opened from
+        nw4 = mv.NormalizedWorm.open(nw_path)
+        nw4.angles[:, 0] = 1
+        nw4.video_info.fps = 20
+        nw4.save(nw_path)
+        np.testing.assert_array_equal(nw4.skeleton, nw.skeleton)
+        nw5 = mv.NormalizedWorm.open(nw_path)
+        assert(nw5.video_info.fps == 20)
+        assert(np.all(nw5.angles[:, 0] == 1))
+        np.testing.assert_array_equal(nw5.angles[:, 1:], nw.angles[:, 1:])
+        np.testing.assert_array_equal(nw5.skeleton, nw.skeleton)
+        del nw4, nw5
+    finally:
+        shutil.rmtree(temp_path)
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_save_and_open()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
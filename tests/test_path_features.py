@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the path features.
+
+"""
+import sys
+import os
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+
+def test_duration():
+    # The sparse arenas should match dense arenas filled frame by frame
+    rng = np.random.RandomState(0)
+    s = np.linspace(0, 1, 49)[:, None]
+    t = np.arange(300)[None, :] / 25.0
+    x = 1000 * s + 150 * t + 100 * rng.rand(49, 300)
+    y = 60 * np.sin(2 * np.pi * (1.5 * s - 0.5 * t)) + 50 * np.sin(t / 5)
+    skeleton = np.stack([x, y], axis=1)
+    skeleton[:, :, [10, 11, 200]] = np.NaN
+
+    bw = mv.BasicWorm.from_skeleton_factory(skeleton)
+    nw = mv.NormalizedWorm.from_BasicWorm_factory(bw)
+    wf = mv.WormFeatures(nw)
+    duration = wf._features['path.duration']
+
+    widths = [nw.widths[slice(*nw.worm_partitions[x])]
+              for x in ('head', 'midbody', 'tail')]
+    scale = 2.0 ** 0.5 / np.mean([np.nanmean(x) for x in widths])
+    with np.errstate(invalid='ignore'):
+        scaled_sx = np.round(nw.skeleton_x * scale)
+        scaled_sy = np.round(nw.skeleton_y * scale)
+    scaled_sx -= np.nanmin(scaled_sx)
+    scaled_sy -= np.nanmin(scaled_sy)
+    arena_size = (int(np.nanmax(scaled_sy)) + 1, int(np.nanmax(scaled_sx)) + 1)
+
+    for name in ('all', 'head', 'body', 'tail'):
+        arena = np.zeros(arena_size)
+        s_indices = slice(*nw.worm_partitions[name])
+        for iFrame in np.flatnonzero(~np.isnan(scaled_sx[0])):
+            arena[scaled_sy[s_indices, iFrame].astype(int),
+                  scaled_sx[s_indices, iFrame].astype(int)] += 1
+        expected = mv.features.path_features.DurationElement(
+            arena[::-1, :], wf.video_info.fps)
+
+        element = getattr(duration, 'worm' if name == 'all' else
+                          'midbody' if name == 'body' else name)
+        assert(np.array_equal(element.indices, expected.indices))
+        assert(np.allclose(element.times, expected.times))
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_duration()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
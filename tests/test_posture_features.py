@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the posture features that are computed in batches of frames.
+
+"""
+import sys
+import os
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open-worm-analysis-toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+import open_worm_analysis_toolbox as mv
+
+from open_worm_analysis_toolbox.features import posture_features
+
+
+def test_contour_central_moments():
+    # A rectangle 4 wide by 2 high, rotated by 30 degrees, for which
+    # mu20 = w^3 h / 12 and mu02 = w h^3 / 12 before the rotation
+    x = np.array([-2, 2, 2, -2], dtype=float)
+    y = np.array([-1, -1, 1, 1], dtype=float)
+    theta = np.pi / 6
+    rotated = np.stack([x * np.cos(theta) - y * np.sin(theta),
+                        x * np.sin(theta) + y * np.cos(theta)])
+    # The points are all the same except for the offset and direction
+    contour = np.stack([rotated.T + 100,
+                        rotated.T[::-1] - 50,
+                        np.full((4, 2), np.NaN),
+                        np.zeros((4, 2))], axis=2)
+
+    mu20, mu02, mu11 = posture_features.get_contour_central_moments(contour)
+
+    assert(np.allclose(mu20[:2], mu20[0]) and np.allclose(mu11[:2], mu11[0]))
+    assert(np.allclose(mu20[0] + mu02[0], (64 * 2 + 4 * 8) / 12.0))
+    assert(np.all(np.isnan([mu20[2], mu02[2], mu11[2]])))
+    assert(mu20[3] == 0 and mu02[3] == 0 and mu11[3] == 0)
+
+    eccentricity, orientation = \
+        posture_features._get_eccentricity_and_orientation(contour)
+
+    assert(np.allclose(eccentricity[:2], np.sqrt(1 - 1 / 4.0)))
+    assert(np.allclose(orientation[:2], 30))
+    assert(np.isnan(eccentricity[2]) and np.isnan(orientation[2]))
+
+
+def test_largest_separated_peaks():
+    # The two largest peaks of each row should be those found one row at
+    # a time by separated_peaks
+    rng = np.random.RandomState(0)
+    x = np.abs(np.fft.rfft(rng.randn(200, 49), 512, axis=1))[:, 0:256]
+    x[0, :] = 1
+    value_cutoff = 0.5 * np.amax(x, axis=1)
+
+    indices = mv.utils.largest_separated_peaks(x, 5, value_cutoff, 2)
+
+    assert(indices.shape == (200, 2))
+    assert(np.all(indices[0] == -1))
+    for cur_x, cur_cutoff, cur_indices in zip(x, value_cutoff, indices):
+        peaks, expected_indices = mv.utils.separated_peaks(
+            cur_x, 5, True, cur_cutoff)
+        expected_indices = expected_indices[np.argsort(-peaks)][0:2]
+        assert(np.array_equal(cur_indices[cur_indices >= 0],
+                              expected_indices))
+
+
+def test_kink_counts():
+    # Stretches of the same sign, with NaN values at the ends of the worm
+    # counting towards the first and last stretches
+    angles = np.ones((12, 5))
+    angles[4:8, 1] = -1
+    angles[:2, 2] = np.NaN
+    angles[2:5, 2] = -1
+    angles[10:, 3] = np.NaN
+    angles[:, 4] = np.NaN
+
+    n_kinks = posture_features.get_kink_counts(angles, 4)
+
+    # The last stretch of the worm is counted as 1 longer, and leading
+    # NaN values count towards the first stretch
+    assert(np.array_equal(n_kinks, [1, 3, 2, 1, 0]))
+    assert(np.array_equal(posture_features.get_kink_counts(angles, 5),
+                          [1, 1, 2, 1, 0]))
+
+    angles[5, 0] = np.NaN
+    try:
+        posture_features.get_kink_counts(angles, 4)
+        assert(False)
+    except Exception as e:
+        assert(str(e) == 'Unhandled code case')
+
+
+def test_eigen_projections():
+    # The eigenworms are only loaded once
+    eigen_worms = posture_features.load_eigen_worms()
+    assert(eigen_worms.shape == (7, 48))
+    assert(posture_features.load_eigen_worms() is eigen_worms)
+
+    # Rotating a worm, so that its angles cross from pi to -pi at
+    # different points, shouldn't change its projections
+    s = np.linspace(0, 1, 49)
+    x = 1000 * s
+    y = 100 * np.sin(2 * np.pi * 1.5 * s)
+    theta = np.linspace(0, 2 * np.pi, 30)
+    sx = np.cos(theta) * x[:, None] - np.sin(theta) * y[:, None]
+    sy = np.sin(theta) * x[:, None] + np.cos(theta) * y[:, None]
+    sx[:, 5] = np.NaN
+
+    projections = posture_features.get_eigen_projections(
+        sx, sy, eigen_worms)
+
+    assert(projections.shape == (7, 30))
+    assert(np.all(np.isnan(projections[:, 5])))
+    projections = np.delete(projections, 5, axis=1)
+    assert(np.allclose(projections, projections[:, 0:1]))
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    start_time = mv.utils.timing_function()
+    test_contour_central_moments()
+    test_largest_separated_peaks()
+    test_kink_counts()
+    test_eigen_projections()
+    print("\nTime elapsed: %.2fs" %
+          (mv.utils.timing_function() - start_time))
@@ -10,9 +10,13 @@ they are the same:   i.e. nw == nw_calculated
 """
 import sys
 import os
+import numpy as np
 
 sys.path.append('..')
 import open_worm_analysis_toolbox as mv
+from open_worm_analysis_toolbox.prefeatures.pre_features import WormParsing
+from open_worm_analysis_toolbox.prefeatures.pre_features_helpers import \
+    WormParserHelpers
 
 
 def test_pre_features():
@@ -76,6 +80,116 @@ def _test_bw_and_nw(bw, nw):
     return nw == nw_calculated
 
 
+def _get_synthetic_skeleton(num_frames=60):
+    """
+    A worm crawling along the x-axis with a travelling sine wave, with
+    a few dropped frames.
+
+    """
+    x = np.linspace(0, 1000, 49)[:, None] + 3 * np.arange(num_frames)
+    y = 80 * np.sin(2 * np.pi * (np.linspace(0, 1.2, 49)[:, None] -
+                                 np.arange(num_frames) / 40.0))
+    skeleton = np.stack([x, y], axis=1)
+    skeleton[:, :, [5, 6, 40]] = np.NaN
+
+    return skeleton
+
+
+def test_batch_skeleton_and_widths():
+    # The batched skeletonization should agree with the frame by
+    # frame one.  (Both smooth the contour in place, so each gets its
+    # own BasicWorm)
+    skeleton = _get_synthetic_skeleton()
+    bw1 = mv.BasicWorm.from_skeleton_factory(skeleton)
+    bw2 = mv.BasicWorm.from_skeleton_factory(skeleton)
+
+    h_widths1, h_skeleton1 = WormParsing.compute_skeleton_and_widths(
+        bw1.h_ventral_contour, bw1.h_dorsal_contour)
+    h_widths2, h_skeleton2 = WormParsing.compute_skeleton_and_widths(
+        bw2.h_ventral_contour, bw2.h_dorsal_contour, batch_mode=True)
+
+    for w1, w2, s1, s2 in zip(h_widths1, h_widths2,
+                              h_skeleton1, h_skeleton2):
+        if w1 is None:
+            assert(w2 is None)
+        else:
+            assert(np.allclose(w1, w2))
+            assert(np.allclose(s1, s2))
+
+
+def test_parallel_from_BasicWorm_factory():
+    # Splitting the frames over several processes should not change
+    # the normalized worm
+    skeleton = _get_synthetic_skeleton()
+    nw1 = mv.NormalizedWorm.from_BasicWorm_factory(
+        mv.BasicWorm.from_skeleton_factory(skeleton))
+    nw2 = mv.NormalizedWorm.from_BasicWorm_factory(
+        mv.BasicWorm.from_skeleton_factory(skeleton), n_workers=2)
+
+    for attribute in ['skeleton', 'ventral_contour', 'dorsal_contour',
+                      'angles', 'widths', 'length', 'area']:
+        assert(np.allclose(getattr(nw1, attribute), getattr(nw2, attribute),
+                           equal_nan=True))
+
+
+def test_normalize_all_frames_xy():
+    # Resampling all frames at once should match resampling each frame
+    # on its own with np.interp
+    rng = np.random.RandomState(0)
+    h_xy = []
+    for n_points in [60, 0, 75, 98]:
+        if n_points == 0:
+            h_xy.append(None)
+            continue
+        h_xy.append(np.cumsum(rng.rand(2, n_points), axis=1))
+
+    normalized = WormParserHelpers.normalize_all_frames_xy(h_xy, 49)
+    assert(normalized.shape == (49, 2, 4))
+    assert(np.all(np.isnan(normalized[:, :, 1])))
+
+    for iFrame in [0, 2, 3]:
+        x, y = h_xy[iFrame]
+        s = np.concatenate([[0], np.cumsum(np.sqrt(np.diff(x)**2 +
+                                                   np.diff(y)**2))])
+        new_s = np.linspace(0, s[-1], 49)
+        assert(np.allclose(normalized[:, 0, iFrame], np.interp(new_s, s, x)))
+        assert(np.allclose(normalized[:, 1, iFrame], np.interp(new_s, s, y)))
+
+
+def test_normalize_all_frames_xy_with_nan():
+    # A NaN point makes its own frame NaN, but must not change the other
+    # frames resampled with it
+    rng = np.random.RandomState(0)
+    h_xy = [np.cumsum(rng.rand(2, 60), axis=1) for iFrame in range(3)]
+    h_xy[1][0, 30] = np.NaN
+
+    normalized = WormParserHelpers.normalize_all_frames_xy(h_xy, 49)
+    assert(np.all(np.isnan(normalized[:, :, 1])))
+
+    for iFrame in [0, 2]:
+        expected = WormParserHelpers.normalize_all_frames_xy(
+            [h_xy[iFrame]], 49)
+        assert(np.allclose(normalized[:, :, iFrame], expected[:, :, 0]))
+
+
+def test_compute_angles():
+    # A straight worm has no bends; a worm on a circle bends the same
+    # amount at every vertex
+    t = np.linspace(0, 1, 80)
+    straight = np.array([100 * t, 50 * t])
+    circle = np.array([100 * np.cos(t), 100 * np.sin(t)])
+
+    angles = WormParsing.compute_angles([straight, None, circle])
+    assert(angles.shape == (49, 3))
+    assert(np.all(np.isnan(angles[:, 1])))
+
+    assert(np.allclose(angles[:, 0][~np.isnan(angles[:, 0])], 0))
+    circle_angles = angles[:, 2][~np.isnan(angles[:, 2])]
+    assert(circle_angles.size > 0)
+    assert(np.allclose(circle_angles, circle_angles[0]))
+    assert(np.allclose(np.abs(circle_angles), 180 / np.pi / 12, rtol=0.01))
+
+
 if __name__ == '__main__':
     print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
     start_time = mv.utils.timing_function()